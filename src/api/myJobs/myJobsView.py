@@ -55,7 +55,7 @@ class MyJobsViewSet(APIView):
             for assignment in assignments:
                 if str(assignment.job.job_type) == 'Bonus Delivery':
                     assignments.remove(assignment)
-                    bonusRouteJobDays = assignment.job.recurrence.between(current_date, current_date + relativedelta(months = 1), dtstart=current_date, inc=True)
+                    bonusRouteJobDays = assignment.job.occurrences_between(current_date.date(), current_date.date() + relativedelta(months = 1, days = 1))
                     for jobDay in bonusRouteJobDays:
                         bonusDeliveryJobs.append(self.Job(assignment.job.get_route_number(), assignment.job.id, assignment.job.name, assignment.job.job_type.name, assignment.volunteer.user.id, date(year = jobDay.year, month= jobDay.month, day = jobDay.day), False))
 
@@ -1,6 +1,6 @@
 #import core libs
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseBadRequest, HttpResponseNotAllowed
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotFound
 from django.db.models import Q
 from datetime import date,datetime
 from interfaces.recurrence import date_to_day_of_month
@@ -80,8 +80,7 @@ class RouteOverview(APIView):
 
         # check bonus route will run on the provided day, return 404 if not
         if str(assignment.job.job_type) == 'Bonus Delivery':
-            nextBonusDeliveryDate = assignment.job.recurrence.after(date_object, inc=True, dtstart= date_object)
-            if nextBonusDeliveryDate != date_object:
+            if not assignment.job.runs_on(date_object):
                 return HttpResponseNotFound()
 
         route = Route.objects.get(id=assignment.job.id)
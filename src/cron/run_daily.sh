@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# Run the daily cron every hour in the cron container, which is built from the web image
+# so it has the same environment and database access. run_daily takes an advisory lock,
+# so runs never overlap, and writes the records of the days since its last successful
+# run that have none, so the days the container was down are caught up.
+while true; do
+    echo Running the daily cron
+    python3 manage.py run_daily
+    sleep 3600
+done
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
-from datetime import date
+from datetime import date, datetime, time, timedelta
 
-from recurrence import FR, MO, MONTHLY, TH, TU, WE, WEEKLY
+from recurrence import DAILY, FR, MO, MONTHLY, TH, TU, WE, WEEKLY
 from recurrence import Recurrence as OriginalRecurrence
 from recurrence import Rule, Weekday, deserialize
 
@@ -157,6 +157,44 @@ def is_weekend(date):
     return date.isoweekday() in {6, 7}
 
 
+def starts_anywhere(rule):
+    """
+    Return True if the rule falls on the same days whatever day it starts on, so it
+    can be expanded once over a range instead of day by day.
+    """
+    if rule.count or (rule.interval or 1) != 1:
+        return False
+    if rule.freq == DAILY:
+        return True
+    return rule.freq in (WEEKLY, MONTHLY) and bool(rule.byday or rule.bymonthday)
+
+
+def recurrence_days(recurrence, start_date, end_date):
+    """
+    Return the set of dates in [start_date, end_date) that the recurrence falls on.
+    A day counts if the recurrence has an occurrence at midnight when started the day
+    before and ended the day after, which is how Customer.num_meals_on_day checks it.
+    """
+    days = set()
+    if all(starts_anywhere(rule) for rule in recurrence.rrules + recurrence.exrules):
+        first = datetime.combine(start_date, time())
+        last = datetime.combine(end_date, time()) - timedelta(days=1)
+        for dt in recurrence.between(
+                first, last, dtstart=first - timedelta(days=1), dtend=last + timedelta(days=1), inc=True):
+            if dt.time() == time():
+                days.add(dt.date())
+        return days
+
+    day = start_date
+    while day < end_date:
+        dt = datetime.combine(day, time())
+        if recurrence.between(
+                dt, dt, dtstart=dt - timedelta(days=1), dtend=dt + timedelta(days=1), inc=True):
+            days.add(day)
+        day += timedelta(days=1)
+    return days
+
+
 def split_recurrence(recurrence):
     """
     https://github.com/django-recurrence/django-recurrence/blob/master/recurrence/base.py
@@ -195,3 +233,41 @@ def split_recurrence(recurrence):
                     day_in_month = DayOfMonth(day.number + 1, i)
                     if not is_excluded(day_in_month):
                         yield day_in_month
+
+
+def day_of_month_bit(day_of_month):
+    """
+    Return the bit for a DayOfMonth in a compiled schedule, 7 bits per week of the month.
+    """
+    return 1 << ((day_of_month.week_of_month - 1) * 7 + day_of_month.day_of_week - 1)
+
+
+def compiles(rule):
+    """
+    Return True if the rule is a plain weekly or nth weekday of the month pattern.
+    """
+    if rule.count or rule.until or (rule.interval or 1) != 1:
+        return False
+    if not rule.byday or any(getattr(rule, p) for p in rule.byparams if p != "byday"):
+        return False
+    if rule.freq == WEEKLY:
+        return all(day.index is None for day in rule.byday)
+    if rule.freq == MONTHLY:
+        return all(day.index in range(1, 6) for day in rule.byday)
+    return False
+
+
+def compile_recurrence(recurrence):
+    """
+    Compile the recurrence into a 35 bit schedule with a bit set for every DayOfMonth it
+    falls on. Returns None if the recurrence is not made of patterns that
+    split_recurrence decomposes exactly, such as last-weekday rules or extra dates.
+    """
+    if recurrence is None or recurrence.rdates or recurrence.exdates:
+        return None
+    if not all(compiles(rule) for rule in recurrence.rrules + recurrence.exrules):
+        return None
+    schedule = 0
+    for day_of_month in split_recurrence(recurrence):
+        schedule |= day_of_month_bit(day_of_month)
+    return schedule
@@ -0,0 +1,77 @@
+"""
+Name search shared by the models and the staff autocompletes.
+
+Searchable models keep a normalized search_text column with a GIN index on
+search_vector(), and queries match each typed word as a prefix of a word in it.
+"""
+
+import re
+import unicodedata
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F
+
+# names are not language text, so they are neither stemmed nor stop-worded
+SEARCH_CONFIG = "simple"
+
+
+def search_words(text):
+    """
+    Return the lowercase words of text with accents stripped.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+def search_text(*parts):
+    """
+    Return the normalized search_text of a row from its name parts.
+    """
+    return " ".join(word for part in parts for word in search_words(part))
+
+
+def search_vector(field="search_text"):
+    """
+    The tsvector of a search_text field, the same expression as the GIN indexes.
+    """
+    return SearchVector(field, config=SEARCH_CONFIG)
+
+
+def search_query(text, operator="&", prefix=True):
+    """
+    Return a SearchQuery matching every typed word of text, or any of them with
+    operator "|", as a word prefix or with prefix=False as a whole word.
+    Returns None if text has no words.
+    """
+    words = search_words(text)
+    if not words:
+        return None
+    # the words are alphanumeric so they are safe to use in a raw query
+    suffix = ":*" if prefix else ""
+    raw = f" {operator} ".join(f"{word}{suffix}" for word in words)
+    return SearchQuery(raw, config=SEARCH_CONFIG, search_type="raw")
+
+
+def search_rank(vector, text):
+    """
+    Rank a search vector against the words of text. Each matching word counts,
+    and whole word matches count again, so "ann" ranks Ann above Anna.
+    """
+    return (SearchRank(vector, search_query(text, "|"))
+            + SearchRank(vector, search_query(text, "|", prefix=False)))
+
+
+def rank_search(queryset, text, field="search_text"):
+    """
+    Filter queryset to the rows whose field matches every word of text,
+    best matches first. Ties keep the queryset's ordering.
+    """
+    query = search_query(text)
+    if query is None:
+        return queryset
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.annotate(
+        search=search_vector(field),
+        rank=search_rank(search_vector(field), text),
+    ).filter(search=query).order_by(F("rank").desc(), *ordering)
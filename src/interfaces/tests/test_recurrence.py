@@ -1,11 +1,14 @@
-from datetime import date
+from datetime import date, datetime, timedelta
 from itertools import product
 
 from django.test import TestCase
+from recurrence import deserialize
 
 from interfaces.recurrence import (
     DayOfMonth,
+    compile_recurrence,
     date_to_day_of_month,
+    day_of_month_bit,
     day_of_month_to_date,
     split_recurrence,
 )
@@ -193,3 +196,43 @@ EXRULE:FREQ=MONTHLY;BYDAY=4FR"""
 EXRULE:FREQ=MONTHLY;BYDAY=4FR"""
         actual = set(split_recurrence(rule_str))
         self.assertEqual(actual, expected)
+
+    def test_compile_recurrence_matches_rrule(self):
+        """
+        Test that a compiled schedule falls on the same days as the rrule for two years.
+        """
+        rule_strs = [
+            "RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR",
+            "RRULE:FREQ=MONTHLY;BYDAY=+2TU,+5TH",
+            """RRULE:FREQ=MONTHLY;BYDAY=4TU,4TH
+RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR
+EXRULE:FREQ=WEEKLY;BYDAY=TU
+EXRULE:FREQ=MONTHLY;BYDAY=3MO""",
+            "DTSTART:19700101T050000Z\nRRULE:FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+            "",
+        ]
+        for rule_str in rule_strs:
+            recurrence = deserialize(rule_str)
+            schedule = compile_recurrence(recurrence)
+            self.assertIsNotNone(schedule, rule_str)
+            day = date(year=2020, month=1, day=1)
+            while day < date(year=2022, month=1, day=1):
+                dt = datetime(year=day.year, month=day.month, day=day.day)
+                expected = bool(recurrence.between(
+                    dt, dt, dtstart=dt - timedelta(days=1), dtend=dt + timedelta(days=1), inc=True))
+                self.assertEqual(
+                    bool(schedule & day_of_month_bit(date_to_day_of_month(day))),
+                    expected,
+                    f"{rule_str} on {day}")
+                day += timedelta(days=1)
+
+    def test_compile_recurrence_falls_back(self):
+        rule_strs = [
+            "RRULE:FREQ=MONTHLY;BYDAY=-1FR",
+            "RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO",
+            "RRULE:FREQ=WEEKLY;COUNT=10;BYDAY=MO",
+            "RRULE:FREQ=MONTHLY;BYMONTHDAY=15",
+            "RDATE:20200107T000000",
+        ]
+        for rule_str in rule_strs:
+            self.assertIsNone(compile_recurrence(deserialize(rule_str)), rule_str)
@@ -5,6 +5,37 @@ RRULE_COUNT = 31
 
 RETENTION = 180
 
+# days generated reports are kept on disk
+REPORT_RETENTION = 7
+
+# bytes of generated reports kept in the report cache
+REPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# rows deleted per transaction when purging expired rows
+PURGE_BATCH_SIZE = 1000
+
+# postgres advisory lock key held while the daily cron runs
+DAILY_CRON_LOCK = 6367
+
+# days ahead of today that bonus route occurrences are materialized for
+OCCURRENCE_HORIZON = 365
+
+# days ahead of today that ActualSlot is kept for
+ACTUAL_SLOT_WINDOW = 120
+
+# days, starting today, covered by the upcoming birthday reports by default
+UPCOMING_BIRTHDAYS_DAYS = 14
+
+# rows per page of the manage assignments table
+ASSIGNMENTS_TABLE_PAGE_SIZE = 50
+
+# results per page of the staff autocompletes, best matches first
+AUTOCOMPLETE_RESULTS = 10
+
+# wkhtmltopdf renders run at once per process, and seconds before one is killed
+PDF_RENDER_WORKERS = 2
+PDF_RENDER_TIMEOUT = 60
+
 OPEN_ROUTE = "OPEN JOB"
 OPEN_SUBSTITUTION = "Open Substitution Request"
 UNASSIGNED_JOB = "No Assignment"
@@ -197,6 +197,10 @@ STATIC_URL = "/static/"
 
 STATIC_ROOT = "/collected-static"
 
+# where the report worker stores generated reports
+REPORT_ROOT = os.getenv("REPORT_ROOT", "/reports")
+REPORT_CACHE_ROOT = os.getenv("REPORT_CACHE_ROOT", os.path.join(REPORT_ROOT, "cache"))
+
 STATICFILES_STORAGE = "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
 
 CRISPY_TEMPLATE_PACK = "bootstrap3"
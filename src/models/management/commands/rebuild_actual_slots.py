@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from meals.constants import ACTUAL_SLOT_WINDOW
+from models.models import rebuild_actual_slots, verify_actual_slots
+
+
+class Command(BaseCommand):
+    """
+     - run with python3 manage.py rebuild_actual_slots
+     - or python3 manage.py rebuild_actual_slots --check to only verify the table
+    """
+
+    help = "Rebuild the ActualSlot schedule from the assignments and substitutions and verify it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=ACTUAL_SLOT_WINDOW,
+            help="number of days from today to schedule",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            default=False,
+            help="verify the table without rebuilding it",
+        )
+
+    def handle(self, *args, **kwargs):
+        if not kwargs["check"]:
+            num_slots = rebuild_actual_slots(kwargs["days"])
+            self.stdout.write(f"Wrote {num_slots} slots")
+        missing, extra = verify_actual_slots()
+        for row in missing.elements():
+            self.stderr.write(self.style.ERROR(f"Missing slot {row}"))
+        for row in extra.elements():
+            self.stderr.write(self.style.ERROR(f"Extra slot {row}"))
+        if missing or extra:
+            self.stderr.write(self.style.ERROR("ActualSlot does not match the schedule"))
+        else:
+            self.stdout.write(self.style.SUCCESS("ActualSlot matches the schedule"))
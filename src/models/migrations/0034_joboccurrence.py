@@ -0,0 +1,35 @@
+# Generated by Django 4.0.4 on 2026-10-17 21:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0033_alter_route_bonusroute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='occurrences_end',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='occurrences_start',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='JobOccurrence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='models.job')),
+            ],
+            options={
+                'unique_together': {('job', 'date')},
+            },
+        ),
+    ]
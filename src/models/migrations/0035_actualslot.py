@@ -0,0 +1,35 @@
+# Generated by Django 4.0.4 on 2026-10-17 21:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0034_joboccurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActualCalendar',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActualSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('is_substitution', models.BooleanField()),
+                ('assignment', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='models.assignment')),
+                ('job', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='models.job')),
+                ('original', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='models.volunteer')),
+                ('substitution', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='models.substitution')),
+                ('volunteer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='actual_slots', to='models.volunteer')),
+            ],
+        ),
+    ]
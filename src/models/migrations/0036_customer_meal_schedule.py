@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+from interfaces.recurrence import compile_recurrence
+
+
+def compile_meal_schedules(apps, schema_editor):
+    Customer = apps.get_model("models", "Customer")
+    customers = list(Customer.objects.only("pk", "meal_recurrence"))
+    for customer in customers:
+        customer.meal_schedule = compile_recurrence(customer.meal_recurrence)
+    Customer.objects.bulk_update(customers, ["meal_schedule"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0035_actualslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='meal_schedule',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(compile_meal_schedules, migrations.RunPython.noop),
+    ]
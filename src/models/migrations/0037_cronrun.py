@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-17 21:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0036_customer_meal_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('since', models.DateField(blank=True, null=True)),
+                ('succeeded', models.BooleanField(default=False)),
+                ('stages', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'ordering': ['-started'],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-17 21:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def rollup_customer_records(apps, schema_editor):
+    BillingDaily = apps.get_model("models", "BillingDaily")
+    CustomerRecord = apps.get_model("models", "CustomerRecord")
+    totals = (
+        CustomerRecord.objects.filter(num_meals__gte=1)
+        .values("date", "payment_type", "route_assigned")
+        .annotate(meals=models.Sum("num_meals"))
+        .order_by())
+    BillingDaily.objects.bulk_create(
+        (BillingDaily(
+            date=total["date"],
+            payment_type_id=total["payment_type"],
+            route_id=total["route_assigned"],
+            num_meals=total["meals"],
+        ) for total in totals),
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0039_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('num_meals', models.IntegerField(default=0)),
+                ('payment_type', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='models.payment')),
+                ('route', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='models.route')),
+            ],
+        ),
+        migrations.RunPython(rollup_customer_records, migrations.RunPython.noop),
+    ]
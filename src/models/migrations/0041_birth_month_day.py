@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-17 22:04
+
+from django.db import migrations, models
+from django.db.models.functions import ExtractDay, ExtractMonth
+
+
+def fill_birth_month_days(apps, schema_editor):
+    for model_name in ("Customer", "Volunteer"):
+        apps.get_model("models", model_name).objects.filter(birth_date__isnull=False).update(
+            birth_month_day=ExtractMonth("birth_date") * 100 + ExtractDay("birth_date"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0040_billingdaily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='birth_month_day',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='volunteer',
+            name='birth_month_day',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_birth_month_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.0.4 on 2026-10-17 22:22
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+from interfaces.search import search_text
+
+
+def fill_search_text(apps, schema_editor):
+    Volunteer = apps.get_model("models", "Volunteer")
+    Customer = apps.get_model("models", "Customer")
+    Job = apps.get_model("models", "Job")
+    volunteers = list(Volunteer.objects.select_related("user").only(
+        "pk", "user__first_name", "user__last_name"))
+    for volunteer in volunteers:
+        volunteer.search_text = search_text(volunteer.user.first_name, volunteer.user.last_name)
+    Volunteer.objects.bulk_update(volunteers, ["search_text"], batch_size=500)
+    customers = list(Customer.objects.only("pk", "first_name", "last_name"))
+    for customer in customers:
+        customer.search_text = search_text(customer.first_name, customer.last_name)
+    Customer.objects.bulk_update(customers, ["search_text"], batch_size=500)
+    jobs = list(Job.objects.only("pk", "name"))
+    for job in jobs:
+        job.search_text = search_text(job.name)
+    Job.objects.bulk_update(jobs, ["search_text"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0041_birth_month_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='volunteer',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('search_text', config='simple'), name='customer_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('search_text', config='simple'), name='job_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='volunteer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('search_text', config='simple'), name='volunteer_search_idx'),
+        ),
+    ]
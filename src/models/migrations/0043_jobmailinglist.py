@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-17 22:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('models', '0042_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobMailingList',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('assigned_emails', models.TextField(blank=True, default='')),
+                ('sub_emails', models.TextField(blank=True, default='')),
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mailing_list', to='models.job')),
+            ],
+        ),
+    ]
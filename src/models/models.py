@@ -9,17 +9,22 @@ TODO:
 """
 
 
-from collections import namedtuple
+import os
+import uuid
+from collections import Counter, defaultdict, namedtuple
 from datetime import date, datetime, timedelta
 from operator import mod
 
 from address.models import AddressField
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.db.models import F, Q, Value
-from django.db.models.signals import post_delete, post_save, pre_save
+from django.db.models.lookups import Exact
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 from recurrence import serialize
 from recurrence.fields import RecurrenceField
 import usaddress
@@ -35,14 +40,18 @@ from interfaces.recurrence import (
     DayOfMonth,
     Recurrence,
     Rule,
+    compile_recurrence,
     date_to_day_of_month,
+    day_of_month_bit,
     day_of_month_to_date,
     days_of_week,
     is_friday,
     is_weekend,
+    recurrence_days,
     weeks_of_month,
 )
-from meals.constants import RRULE_COUNT, RRULE_START
+from interfaces.search import search_text, search_vector
+from meals.constants import ACTUAL_SLOT_WINDOW, OCCURRENCE_HORIZON, RRULE_COUNT, RRULE_START
 
 NO_FILTER_SENTINAL = "NOFILTER"
 
@@ -73,9 +82,226 @@ def actual_dict_to_namedtuple(actual):
         actual["actual_is_substitution"])
 
 
+def clean_actuals_args(start_date, end_date, order_by):
+    """
+    Validate order_by and truncate the date range to dates for Assignment.actuals().
+    Returns start_date, end_date, order_by
+    """
+    if order_by:
+        if isinstance(order_by, str):
+            order_by = (order_by,)
+    else:
+        order_by = ()
+    allowed_order_bys = ("volunteer", "job", "date")
+    for o in order_by:
+        if o not in allowed_order_bys:
+            raise ValueError(
+                f"""Unsupported order_by, {o}.
+Can only order by {", ".join(allowed_order_bys)}"""
+            )
+
+    end_date = end_date or start_date + timedelta(days=1)
+    start_date = date(
+        year=start_date.year,
+        month=start_date.month,
+        day=start_date.day)
+    end_date = date(
+        year=end_date.year,
+        month=end_date.month,
+        day=end_date.day)
+    return start_date, end_date, order_by
+
+
+def actuals_filters(volunteer, original, job):
+    """
+    Build the Assignment, Substitution and VolunteerRecord filters for Assignment.actuals().
+    """
+    assignment_filters = Q()
+    substitute_filters = Q()
+    record_filters = Q()
+    if volunteer != NO_FILTER_SENTINAL:
+        assignment_filters &= Q(volunteer=volunteer)
+        substitute_filters &= Q(volunteer=volunteer)
+        record_filters &= Q(volunteer=volunteer)
+    if original != NO_FILTER_SENTINAL:
+        assignment_filters &= Q(volunteer=original)
+        substitute_filters &= Q(assignment__volunteer=original)
+        record_filters &= Q(original=original)
+    if job != NO_FILTER_SENTINAL:
+        assignment_filters &= Q(job=job)
+        substitute_filters &= Q(assignment__job=job)
+        record_filters &= Q(job=job)
+    return assignment_filters, substitute_filters, record_filters
+
+
+def recurrence_includes(recurrence, day):
+    """
+    Return True if the recurrence falls on day. Every day is checked with itself as
+    dtstart, which is how bonus routes have always been scheduled.
+    """
+    dt = datetime(year=day.year, month=day.month, day=day.day)
+    return recurrence.after(dt, inc=True, dtstart=dt) == dt
+
+
+def job_occurrence_days(jobs, start_date, end_date):
+    """
+    Return a dict of job pk -> set of the dates in [start_date, end_date) that the
+    job's recurrence falls on. Dates inside a job's materialized window are read from
+    JobOccurrence in one query, the rest are evaluated from the recurrence.
+    """
+    days = {job.pk: set() for job in jobs}
+    for job_pk, day in JobOccurrence.objects.filter(
+            job__in=days, date__gte=start_date, date__lt=end_date).values_list("job", "date"):
+        days[job_pk].add(day)
+    for job in jobs:
+        day = start_date
+        while day < end_date:
+            materialized = (
+                job.occurrences_start is not None
+                and job.occurrences_start <= day < job.occurrences_end)
+            if not materialized and recurrence_includes(job.recurrence, day):
+                days[job.pk].add(day)
+            day += timedelta(days=1)
+    return days
+
+
+def bonus_route_days(job_pks, start_date, end_date):
+    """
+    Return a dict of job pk -> set of the dates in [start_date, end_date) that the
+    bonus route runs on, according to the job's recurrence.
+    """
+    return job_occurrence_days(
+        list(Job.objects.filter(pk__in=job_pks)), start_date, end_date)
+
+
+def schedule_rows(start_date, end_date, assignment_filters=Q(), substitute_filters=Q(), exclusor={}):
+    """
+    Expand the assignments and substitutions into a list of the scheduled
+    (date, volunteer, job, original, is_substitution, assignment, substitution) pks for
+    the dates [start_date, end_date). Historical records are not included.
+    """
+    subs_in_range = Substitution.objects.filter(
+        date__gte=start_date, date__lt=end_date)
+    rows = [
+        (sub_date, vol, sub_job, orig, True, ass, pk)
+        for pk, sub_date, vol, sub_job, orig, ass in subs_in_range.filter(
+            substitute_filters) .exclude(
+            **exclusor) .values_list(
+            "pk", "date", "volunteer", "assignment__job", "assignment__volunteer", "assignment")]
+    # any substitution takes its assignment off that day, even a filtered out one
+    substituted = set(subs_in_range.values_list("assignment", "date"))
+
+    recurring = defaultdict(list)
+    bonus = []
+    for pk, day_of_week, week_of_month, vol, ass_job in Assignment.objects.filter(
+            assignment_filters) .exclude(**exclusor) .values_list(
+            "pk", "day_of_week", "week_of_month", "volunteer", "job"):
+        if day_of_week is None and week_of_month is None:
+            bonus.append((pk, vol, ass_job))
+        else:
+            recurring[DayOfMonth(day_of_week, week_of_month)].append(
+                (pk, vol, ass_job))
+    bonus_days = bonus_route_days(
+        {ass_job for _, _, ass_job in bonus}, start_date, end_date)
+
+    day = start_date
+    while day < end_date:
+        for pk, vol, ass_job in recurring.get(date_to_day_of_month(day), ()):
+            if (pk, day) not in substituted:
+                rows.append((day, vol, ass_job, vol, False, pk, None))
+        for pk, vol, ass_job in bonus:
+            if day in bonus_days[ass_job]:
+                rows.append((day, vol, ass_job, vol, False, pk, None))
+        day += timedelta(days=1)
+    return rows
+
+
+def order_ranks(objects, key):
+    """
+    Map the pk of each object in objects, which the database has already ordered, to its
+    position. Objects with the same key share a position, and None (a NULL foreign key)
+    goes last, the same as the database would order them.
+    """
+    ranks = {}
+    rank = -1
+    previous = None
+    for obj in objects:
+        if rank < 0 or key(obj) != previous:
+            rank += 1
+            previous = key(obj)
+        ranks[obj.pk] = rank
+    ranks[None] = rank + 1
+    return ranks
+
+
+def rows_to_actuals(rows, order_by=()):
+    """
+    Build Actuals from (date, volunteer, job, original, is_substitution) pk rows.
+    The volunteers and jobs for all of the rows are loaded together, so this takes
+    two queries no matter how many rows there are. The Actuals are sorted by order_by.
+    """
+    volunteers = list(
+        Volunteer.objects.select_related("user")
+        .filter(pk__in={row[1] for row in rows} | {row[3] for row in rows})
+        .order_by("user__last_name", "user__first_name")
+    )
+    jobs = list(
+        Job.objects.select_related("route", "job_type")
+        .filter(pk__in={row[2] for row in rows})
+        .order_by("route__number", "job_type__name", "name")
+    )
+    if order_by:
+        volunteer_ranks = order_ranks(
+            volunteers, lambda v: (v.user.last_name, v.user.first_name))
+        job_ranks = order_ranks(
+            jobs, lambda j: (j.get_route_number(), j.job_type.name, j.name))
+        keys = {
+            "date": lambda row: row[0],
+            "volunteer": lambda row: volunteer_ranks[row[1]],
+            "job": lambda row: job_ranks[row[2]],
+        }
+        rows = sorted(rows, key=lambda row: tuple(keys[o](row) for o in order_by))
+
+    volunteers = {v.pk: v for v in volunteers}
+    jobs = {j.pk: j for j in jobs}
+    return [
+        Actual(
+            volunteers.get(vol),
+            jobs.get(job),
+            day,
+            volunteers.get(orig),
+            is_substitution,
+        )
+        for day, vol, job, orig, is_substitution in rows
+    ]
+
+
 ## ----- Volunteers ----- ##
 
 
+def birth_month_day(birth_date):
+    """
+    A birth date as month * 100 + day, so birthdays sort and compare across years, or None.
+    """
+    if birth_date is None:
+        return None
+    return birth_date.month * 100 + birth_date.day
+
+
+def birthdays_between(start_date, end_date):
+    """
+    A filter on birth_month_day for the birthdays in [start_date, end_date], of any year.
+    The range may wrap past the end of the year, and covers every birthday if it spans a
+    year or more.
+    """
+    if (end_date - start_date).days >= 365:
+        return Q(birth_month_day__isnull=False)
+    start, end = birth_month_day(start_date), birth_month_day(end_date)
+    if start <= end:
+        return Q(birth_month_day__gte=start, birth_month_day__lte=end)
+    return Q(birth_month_day__gte=start) | Q(birth_month_day__lte=end)
+
+
 class Volunteer(models.Model):
     """
     Model for meals volunteers
@@ -91,16 +317,22 @@ class Volunteer(models.Model):
     cell_phone = models.CharField(max_length=50, default="", blank=True)
     work_phone = models.CharField(max_length=50, default="", blank=True)
     birth_date = models.DateField(null=True, blank=True)
+    # birth_date as birth_month_day(), indexed for the birthday reports
+    birth_month_day = models.PositiveSmallIntegerField(
+        null=True, blank=True, editable=False, db_index=True)
     notes = models.TextField(default="", blank=True)
     join_date = models.DateField(default=date.today)
     number_of_people = models.IntegerField(default=1)
     dont_email = models.BooleanField(default=False)
+    # the user's normalized name, see interfaces.search
+    search_text = models.TextField(default="", blank=True, editable=False)
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
 
     class Meta:
         ordering = ["user__last_name", "user__first_name"]
+        indexes = [GinIndex(search_vector(), name="volunteer_search_idx")]
 
 
 @receiver(post_save, sender=User)
@@ -119,6 +351,21 @@ def lower_username(sender, instance, **kwargs):
     instance.username = instance.username.lower()
 
 
+@receiver(pre_save, sender=Volunteer)
+def set_volunteer_search_text(sender, instance, **kwargs):
+    instance.search_text = search_text(instance.user.first_name, instance.user.last_name)
+
+
+@receiver(post_save, sender=User)
+def update_volunteer_search_text(sender, instance, created, **kwargs):
+    # the names live on the user, which is saved without its volunteer
+    update_fields = kwargs["update_fields"]
+    if created or (update_fields and not {"first_name", "last_name"} & update_fields):
+        return
+    text = search_text(instance.first_name, instance.last_name)
+    Volunteer.objects.filter(user=instance).exclude(search_text=text).update(search_text=text)
+
+
 class JobType(models.Model):
     name = models.CharField(max_length=100, unique=True, blank=False)
 
@@ -144,10 +391,76 @@ class Job(models.Model):
         on_delete=models.PROTECT,
         null=False,
         blank=False)
+    # the dates [occurrences_start, occurrences_end) that JobOccurrence holds for this job
+    occurrences_start = models.DateField(null=True, blank=True, editable=False)
+    occurrences_end = models.DateField(null=True, blank=True, editable=False)
+    # the normalized name, see interfaces.search
+    search_text = models.TextField(default="", blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def materialize_occurrences(self, start_date=None, end_date=None):
+        """
+        Rewrite the JobOccurrence rows of this job for the dates [start_date, end_date),
+        by default today through OCCURRENCE_HORIZON days from now.
+        """
+        start_date = start_date or date.today()
+        end_date = end_date or start_date + timedelta(days=OCCURRENCE_HORIZON)
+        # round trip through the field so include_dtstart is the same as a loaded job's
+        recurrence = Job._meta.get_field("recurrence").to_python(serialize(self.recurrence))
+        occurrences = []
+        day = start_date
+        while day < end_date:
+            if recurrence_includes(recurrence, day):
+                occurrences.append(JobOccurrence(job=self, date=day))
+            day += timedelta(days=1)
+        JobOccurrence.objects.filter(job=self).delete()
+        JobOccurrence.objects.bulk_create(occurrences)
+        Job.objects.filter(pk=self.pk).update(
+            occurrences_start=start_date, occurrences_end=end_date)
+        self.occurrences_start = start_date
+        self.occurrences_end = end_date
+
+    def extend_occurrences(self, end_date=None):
+        """
+        Add the JobOccurrence rows from the end of this job's window up to end_date, by
+        default OCCURRENCE_HORIZON days from now. A job without a window, or whose window
+        ended before today, is materialized from scratch.
+        """
+        today = date.today()
+        end_date = end_date or today + timedelta(days=OCCURRENCE_HORIZON)
+        if self.occurrences_start is None or self.occurrences_end < today:
+            self.materialize_occurrences(today, end_date)
+            return
+        if self.occurrences_end >= end_date:
+            return
+        # round trip through the field so include_dtstart is the same as a loaded job's
+        recurrence = Job._meta.get_field("recurrence").to_python(serialize(self.recurrence))
+        occurrences = []
+        day = self.occurrences_end
+        while day < end_date:
+            if recurrence_includes(recurrence, day):
+                occurrences.append(JobOccurrence(job=self, date=day))
+            day += timedelta(days=1)
+        JobOccurrence.objects.bulk_create(occurrences)
+        Job.objects.filter(pk=self.pk).update(occurrences_end=end_date)
+        self.occurrences_end = end_date
+
+    def occurrences_between(self, start_date, end_date):
+        """
+        Return the sorted dates in [start_date, end_date) that this job's recurrence
+        falls on.
+        """
+        return sorted(job_occurrence_days([self], start_date, end_date)[self.pk])
+
+    def runs_on(self, day):
+        """
+        Return True if this job's recurrence falls on day.
+        """
+        day = day.date() if isinstance(day, datetime) else day
+        return bool(self.occurrences_between(day, day + timedelta(days=1)))
+
     def get_route_pk(self):
         """
         Return the pk of the underlying route or -1 if this job is not a route.
@@ -176,6 +489,23 @@ class Job(models.Model):
 
     class Meta:
         ordering = ["route__number", "job_type", "name"]
+        indexes = [GinIndex(search_vector(), name="job_search_idx")]
+
+
+class JobOccurrence(models.Model):
+    """
+    A date that a job's recurrence falls on, materialized so that bonus routes can be
+    looked up by date instead of evaluating the recurrence rule for every day.
+    """
+
+    job = models.ForeignKey(
+        Job,
+        related_name="occurrences",
+        on_delete=models.CASCADE)
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ["job", "date"]
 
 
 class Route(Job):
@@ -191,6 +521,41 @@ class Route(Job):
 
 
 
+@receiver(pre_save, sender=Job)
+@receiver(pre_save, sender=Route)
+def set_job_search_text(sender, instance, **kwargs):
+    instance.search_text = search_text(instance.name)
+
+
+@receiver(pre_save, sender=Job)
+@receiver(pre_save, sender=Route)
+def check_job_occurrences(sender, instance, raw=False, **kwargs):
+    # only bonus routes are looked up by date, and only a new recurrence or bonus link
+    # moves their days, so renames and other jobs are left alone
+    instance._occurrences_changed = False
+    if raw:
+        return
+    is_bonus = getattr(instance, "bonusRoute_id", None) is not None
+    fields = ["recurrence", "occurrences_start"] + (["bonusRoute"] if sender is Route else [])
+    old = None if instance._state.adding else (
+        sender.objects.filter(pk=instance.pk).values(*fields).first())
+    if old is None:
+        instance._occurrences_changed = is_bonus
+        return
+    was_bonus = old.get("bonusRoute") is not None
+    recurrence_changed = serialize(old["recurrence"]) != serialize(instance.recurrence)
+    # a job that used to be a bonus route keeps its window until the recurrence changes
+    has_window = is_bonus or old["occurrences_start"] is not None
+    instance._occurrences_changed = has_window and (recurrence_changed or was_bonus != is_bonus)
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_save, sender=Route)
+def update_job_occurrences(sender, instance, raw=False, **kwargs):
+    if not raw and instance._occurrences_changed:
+        instance.materialize_occurrences()
+
+
 class Assignment(models.Model):
     """
     Recurring Assignments
@@ -232,12 +597,13 @@ class Assignment(models.Model):
         job=NO_FILTER_SENTINAL,
         order_by=None,
         exclude_unfilled=False,
+        as_of=None,
     ):
         """
         This static functions should be called on "Assignment", similar to how
         .objects is accessed on Assignment. However, unlike .objects, this does not
-        actually return a queryset. Instead, this returns a lazily evaluated iterable
-        of namedtuples, Actuals. Actuals represent what is actually happenning with a job
+        actually return a queryset. Instead, this returns an iterator of namedtuples,
+        Actuals. Actuals represent what is actually happenning with a job
         on a day, including who is volunteering for that job and who the orignal volunteer
         is. This method respects unsubstituted assignments, substituted assignments, and
         historical data.
@@ -262,49 +628,73 @@ class Assignment(models.Model):
         Also note that in the case of an unfilled substitution request for an open job, only
         the substitution request will be returned.
 
+        The assignments, substitutions and records for the whole range are each fetched once
+        and expanded by day of month in python, and the volunteers (with their users) and jobs
+        (with their routes and job types) are loaded in bulk, so the number of queries does not
+        grow with the length of the range or the number of actuals. When the upcoming part of
+        the range falls inside the ActualCalendar window it is read straight from ActualSlot
+        instead. Either way the results are the same as union_actuals().
+
+        as_of is the date to treat as today, which defaults to today. Records are only read
+        before it, so passing a past date schedules that day as it would have been scheduled,
+        for catching up on days the cron missed.
+
         Note: Please do not try to implement this logic yourself. This function has been heavily
         tested, and it's important that the whole app is consistent in how actuals are computed.
         """
-        if order_by:
-            if isinstance(order_by, str):
-                order_by = (order_by,)
-        else:
-            order_by = ()
-        allowed_order_bys = ("volunteer", "job", "date")
-        for o in order_by:
-            if o not in allowed_order_bys:
-                raise ValueError(
-                    f"""Unsupported order_by, {o}.
-Can only order by {", ".join(allowed_order_bys)}"""
-                )
+        start_date, end_date, order_by = clean_actuals_args(
+            start_date, end_date, order_by)
+        assignment_filters, substitute_filters, record_filters = actuals_filters(
+            volunteer, original, job)
+        exclusor = {"volunteer": None} if exclude_unfilled else {}
+        today = as_of or date.today()
+        future_start = max(start_date, today)
 
-        today = date.today()
-        end_date = end_date or start_date + timedelta(days=1)
-        start_date = date(
-            year=start_date.year,
-            month=start_date.month,
-            day=start_date.day)
-        end_date = date(
-            year=end_date.year,
-            month=end_date.month,
-            day=end_date.day)
-
-        assignment_filters = Q()
-        substitute_filters = Q()
-        record_filters = Q()
-        if volunteer != NO_FILTER_SENTINAL:
-            assignment_filters &= Q(volunteer=volunteer)
-            substitute_filters &= Q(volunteer=volunteer)
-            record_filters &= Q(volunteer=volunteer)
-        if original != NO_FILTER_SENTINAL:
-            assignment_filters &= Q(volunteer=original)
-            substitute_filters &= Q(assignment__volunteer=original)
-            record_filters &= Q(original=original)
-        if job != NO_FILTER_SENTINAL:
-            assignment_filters &= Q(job=job)
-            substitute_filters &= Q(assignment__job=job)
-            record_filters &= Q(job=job)
+        # rows are (date, volunteer, job, original, is_substitution) pks
+        rows = list(
+            VolunteerRecord.objects.filter(
+                date__gte=start_date,
+                date__lt=today) .filter(record_filters) .values_list(
+                "date", "volunteer", "job", "original", "is_substitution"))  # Don't exclude Nones, they are deleted vols
+
+        if future_start < end_date:
+            calendar = ActualCalendar.objects.first()
+            if (calendar and date.today() <= future_start
+                    and calendar.start_date <= future_start and end_date <= calendar.end_date):
+                rows.extend(
+                    ActualSlot.objects.filter(
+                        date__gte=future_start,
+                        date__lt=end_date) .filter(record_filters) .exclude(
+                        **exclusor) .values_list(
+                        "date", "volunteer", "job", "original", "is_substitution"))
+            else:
+                rows.extend(row[:5] for row in schedule_rows(
+                    future_start, end_date, assignment_filters, substitute_filters, exclusor))
+
+        # the same as a sql UNION, duplicate rows collapse into one
+        return iter(rows_to_actuals(list(dict.fromkeys(rows)), order_by))
 
+    @staticmethod
+    def union_actuals(
+        start_date,
+        end_date=None,
+        *,
+        volunteer=NO_FILTER_SENTINAL,
+        original=NO_FILTER_SENTINAL,
+        job=NO_FILTER_SENTINAL,
+        order_by=None,
+        exclude_unfilled=False,
+    ):
+        """
+        The original implementation of actuals(), which builds one subquery per day in the
+        range and UNIONs them together. It is kept as the reference that actuals() is tested
+        against; use actuals() everywhere else.
+        """
+        start_date, end_date, order_by = clean_actuals_args(
+            start_date, end_date, order_by)
+        assignment_filters, substitute_filters, record_filters = actuals_filters(
+            volunteer, original, job)
+        today = date.today()
         exclusor = {"volunteer": None} if exclude_unfilled else {}
 
         assignment_values = dict(
@@ -579,6 +969,9 @@ class Customer(models.Model):
     # difference between this and notes? landmarks gets put on the printout
     printed_notes = models.TextField(default="", blank=True)
     birth_date = models.DateField(null=True)
+    # birth_date as birth_month_day(), indexed for the birthday reports
+    birth_month_day = models.PositiveSmallIntegerField(
+        null=True, blank=True, editable=False, db_index=True)
     sex = models.CharField(max_length=50, default="", blank=True)
     contact = models.CharField(max_length=200, default="", blank=True)
     contact_phone = models.CharField(max_length=50, default="", blank=True)
@@ -616,11 +1009,15 @@ class Customer(models.Model):
     bill_to = models.CharField(max_length=200, default="", blank=True)
     notes = models.TextField(default="", blank=True)
     meal_recurrence = RecurrenceField(default="", null=True, blank=True)
+    # meal_recurrence compiled by compile_recurrence, None if it doesn't compile
+    meal_schedule = models.BigIntegerField(null=True, blank=True, editable=False)
     num_weekend_meals = models.PositiveIntegerField(default=0)
     dont_email = models.BooleanField(default=False)
     lat = models.FloatField(default=0, blank=True, null=True)
     lon = models.FloatField(default=0, blank=True, null=True)
     receivesBonusPantryDelivery = models.BooleanField("Receives Bonus Pantry Delivery", default=True, null=False)
+    # the normalized name, see interfaces.search
+    search_text = models.TextField(default="", blank=True, editable=False)
 
     class Meta:
         order_with_respect_to = "route"
@@ -629,6 +1026,7 @@ class Customer(models.Model):
             "last_name",
             "contact",
             "contact_phone"]
+        indexes = [GinIndex(search_vector(), name="customer_search_idx")]
 
     def clean(self):
         """
@@ -678,22 +1076,93 @@ class Customer(models.Model):
         return str(self.birth_date.strftime("%b")) + \
             " " + str(self.birth_date.day)
 
-    def num_meals_on_day(self, day):
+    @staticmethod
+    def meal_counts(customers, start_date, end_date=None, as_of=None):
         """
-        Return the number of meals on a specific day
+        This static function should be called on "Customer", like Assignment.actuals().
+        Return a dict of (customer pk, date) -> the number of meals, for every customer in
+        customers and every date in [start_date, end_date). Each count is the same as
+        num_meals_on_day would give. If only start_date is supplied, only that date is
+        counted.
+
+        The CustomerRecords and DateRanges of all the customers are fetched in one query
+        each. Compiled meal schedules are checked bit by bit and the other meal recurrences
+        are expanded once for the whole range, so the number of queries does not grow with
+        the number of customers or days. as_of is the date to treat as today, like in
+        Assignment.actuals().
         """
-        day = date(year=day.year, month=day.month, day=day.day)
-        if is_weekend(day):
-            return 0
+        customers = list(customers)
+        end_date = end_date or start_date + timedelta(days=1)
+        start_date = date(year=start_date.year, month=start_date.month, day=start_date.day)
+        end_date = date(year=end_date.year, month=end_date.month, day=end_date.day)
+        today = as_of or date.today()
+        future_start = max(start_date, today)
+        pks = [customer.pk for customer in customers]
+
+        records = {}
+        if start_date < today:
+            records = {
+                (customer_pk, day): num_meals
+                for customer_pk, day, num_meals in CustomerRecord.objects.filter(
+                    customer__in=pks,
+                    date__gte=start_date,
+                    date__lt=min(end_date, today)).values_list("customer", "date", "num_meals")
+            }
+        excluded = defaultdict(list)
+        if future_start < end_date:
+            for customer_pk, range_start, range_end in DateRange.objects.filter(
+                    customer__in=pks,
+                    start_date__lt=end_date,
+                    end_date__gte=future_start).values_list("customer", "start_date", "end_date"):
+                excluded[customer_pk].append((range_start, range_end))
+
+        future_bits = []
+        day = future_start
+        while day < end_date:
+            future_bits.append((day, day_of_month_bit(date_to_day_of_month(day))))
+            day += timedelta(days=1)
 
-        if day < date.today():  # Strict less-than VERY import here. Otherwise recursion!
-            try:
-                record = CustomerRecord.objects.get(date=day, customer=self)
-            except CustomerRecord.DoesNotExist:
-                return 0
-            return record.num_meals
-        if not self.active:
-            return False
+        counts = {}
+        for customer in customers:
+            meal_days = set()
+            if customer.active and customer.meal_schedule is not None:
+                meal_days = {
+                    day for day, bit in future_bits if customer.meal_schedule & bit}
+            elif customer.active and future_start < end_date:
+                meal_days = recurrence_days(customer.meal_recurrence, future_start, end_date)
+            day = start_date
+            while day < end_date:
+                if is_weekend(day):
+                    num_meals = 0
+                elif day < today:
+                    num_meals = records.get((customer.pk, day), 0)
+                elif day in meal_days and not any(
+                        range_start <= day <= range_end for range_start, range_end in excluded[customer.pk]):
+                    num_meals = 1 + (customer.num_weekend_meals if is_friday(day) else 0)
+                else:
+                    num_meals = 0
+                counts[(customer.pk, day)] = num_meals
+                day += timedelta(days=1)
+        return counts
+
+    @staticmethod
+    def schedule_filter(day):
+        """
+        Return a Q for the customers whose meal recurrence may fall on day: the ones with
+        the day's bit set in their compiled schedule, and the ones whose recurrence didn't
+        compile and have to be checked with meal_scheduled_on(). Being active, weekends
+        and date ranges are not considered.
+        """
+        bit = day_of_month_bit(date_to_day_of_month(day))
+        return Q(meal_schedule=None) | Q(Exact(F("meal_schedule").bitand(bit), bit))
+
+    def meal_scheduled_on(self, day):
+        """
+        Return True if the meal recurrence falls on day, from the compiled schedule when
+        there is one.
+        """
+        if self.meal_schedule is not None:
+            return bool(self.meal_schedule & day_of_month_bit(date_to_day_of_month(day)))
         dt = datetime(
             year=day.year,
             month=day.month,
@@ -712,7 +1181,25 @@ class Customer(models.Model):
                 days=1),
             inc=True,
         )
-        if len(possible_match) == 0 or self.date_range_excluded(dt):
+        return len(possible_match) != 0
+
+    def num_meals_on_day(self, day):
+        """
+        Return the number of meals on a specific day
+        """
+        day = date(year=day.year, month=day.month, day=day.day)
+        if is_weekend(day):
+            return 0
+
+        if day < date.today():  # Strict less-than VERY import here. Otherwise recursion!
+            try:
+                record = CustomerRecord.objects.get(date=day, customer=self)
+            except CustomerRecord.DoesNotExist:
+                return 0
+            return record.num_meals
+        if not self.active:
+            return False
+        if not self.meal_scheduled_on(day) or self.date_range_excluded(day):
             return 0
 
         return 1 + (self.num_weekend_meals if is_friday(day) else 0)
@@ -725,25 +1212,7 @@ class Customer(models.Model):
             return False
         if not self.active:
             return False
-        dt = datetime(
-            year=day.year,
-            month=day.month,
-            day=day.day,
-            hour=0,
-            minute=0,
-            second=0)
-        possible_match = self.meal_recurrence.between(
-            dt,
-            dt,
-            dtstart=dt -
-            timedelta(
-                days=1),
-            dtend=dt +
-            timedelta(
-                days=1),
-            inc=True,
-        )
-        if len(possible_match) == 0 or self.date_range_excluded(dt):
+        if not self.meal_scheduled_on(day) or self.date_range_excluded(day):
             return False
         return True
 
@@ -753,6 +1222,24 @@ class Customer(models.Model):
         ).exists()
 
 
+@receiver(pre_save, sender=Customer)
+def set_customer_search_text(sender, instance, **kwargs):
+    instance.search_text = search_text(instance.first_name, instance.last_name)
+
+
+@receiver(pre_save, sender=Customer)
+def compile_meal_schedule(sender, instance, **kwargs):
+    instance.meal_schedule = compile_recurrence(instance.meal_recurrence)
+
+
+@receiver(pre_save, sender=Customer)
+@receiver(pre_save, sender=Volunteer)
+def set_birth_month_day(sender, instance, **kwargs):
+    # birth_date may still be a string when it is set directly
+    birth_date = sender._meta.get_field("birth_date").to_python(instance.birth_date)
+    instance.birth_month_day = birth_month_day(birth_date)
+
+
 @receiver(pre_save, sender=Customer)
 def find_lat_lon(sender, instance, **kwargs):
     if kwargs["raw"]:
@@ -842,6 +1329,54 @@ class CustomerRecord(models.Model):
         unique_together = ["customer", "date"]
 
 
+class BillingDaily(models.Model):
+    """
+    The CustomerRecords of a day summed by payment type and route, so billing totals for
+    any range can be read from a few rows per day instead of every record. Written with
+    the CustomerRecords by the daily cron, and rebuilt with manage.py rebuild_billing_daily.
+    They are purged with the CustomerRecords, so a report's totals and per-customer detail
+    cover the same days.
+    """
+
+    date = models.DateField(db_index=True)
+    payment_type = models.ForeignKey(
+        Payment, on_delete=models.SET_NULL, default=None, null=True
+    )
+    route = models.ForeignKey(
+        Route, on_delete=models.SET_NULL, default=None, null=True
+    )
+    num_meals = models.IntegerField(default=0)
+
+    @staticmethod
+    def rollup(start_date, end_date=None):
+        """
+        Rewrite the rows for the dates [start_date, end_date) from the CustomerRecords of
+        those dates. end_date defaults to the day after start_date. Returns the number of
+        rows written.
+        """
+        end_date = end_date or start_date + timedelta(days=1)
+        totals = (
+            CustomerRecord.objects.filter(
+                num_meals__gte=1, date__gte=start_date, date__lt=end_date)
+            .values("date", "payment_type", "route_assigned")
+            .annotate(meals=models.Sum("num_meals"))
+            .order_by())
+        with transaction.atomic():
+            BillingDaily.objects.filter(date__gte=start_date, date__lt=end_date).delete()
+            rows = BillingDaily.objects.bulk_create(
+                BillingDaily(
+                    date=total["date"],
+                    payment_type_id=total["payment_type"],
+                    route_id=total["route_assigned"],
+                    num_meals=total["meals"],
+                )
+                for total in totals)
+        return len(rows)
+
+    def __str__(self):
+        return f"{self.num_meals} meals on {self.date}"
+
+
 class VolunteerRecord(models.Model):
     """
     This serves to record-keep volunteers and what jobs they actually did
@@ -868,3 +1403,440 @@ class VolunteerRecord(models.Model):
 
     class Meta:
         unique_together = ["volunteer", "job", "date"]
+
+
+class CronRun(models.Model):
+    """
+    A run of the daily cron, kept for monitoring. stages maps the name of each stage that
+    ran to how many seconds it took.
+    """
+
+    started = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(null=True, blank=True)
+    since = models.DateField(null=True, blank=True)
+    succeeded = models.BooleanField(default=False)
+    stages = models.JSONField(default=dict, blank=True)
+    error = models.TextField(default="", blank=True)
+
+    def __str__(self):
+        return f"Daily cron started {self.started}"
+
+    class Meta:
+        ordering = ["-started"]
+
+
+class ReportJob(models.Model):
+    """
+    A report queued to be generated off the request path by the report worker
+    (manage.py run_report_worker). args are the arguments of the report's url, and the
+    finished report is stored on disk under REPORT_ROOT at file_path.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = ((QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed"))
+
+    report_type = models.CharField(max_length=64)
+    args = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    file_path = models.CharField(max_length=255, default="", blank=True)
+    content_type = models.CharField(max_length=64, default="", blank=True)
+    error = models.TextField(default="", blank=True)
+
+    def __str__(self):
+        return f"{self.report_type} {' '.join(str(arg) for arg in self.args)} ({self.status})"
+
+    class Meta:
+        ordering = ["created"]
+        indexes = [models.Index(fields=["status", "created"])]
+
+
+class DataVersion(models.Model):
+    """
+    A token per table that changes whenever a row of the table is saved or deleted, so
+    anything derived from the table, like a cached report, can tell when it is stale.
+    The tables passed to track_data_versions() are bumped by signals, bulk writes and
+    queryset updates must call bump_data_version() themselves.
+    """
+
+    table = models.CharField(max_length=64, unique=True)
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.table} {self.version}"
+
+
+def bump_data_version(*model_classes):
+    for model in model_classes:
+        table = model._meta.db_table
+        version = uuid.uuid4().hex
+        if not DataVersion.objects.filter(table=table).update(version=version):
+            DataVersion.objects.get_or_create(table=table, defaults={"version": version})
+
+
+def data_version(*model_classes):
+    """
+    Return a token of the current versions of the tables of model_classes.
+    """
+    tables = sorted(model._meta.db_table for model in model_classes)
+    versions = dict(
+        DataVersion.objects.filter(table__in=tables).values_list("table", "version"))
+    return ",".join(f"{table}:{versions.get(table, '')}" for table in tables)
+
+
+class ActualSlot(models.Model):
+    """
+    The schedule that Assignment.actuals() would compute for a day in the ActualCalendar
+    window, one row per assignment or substitution. It is kept up to date by the signal
+    handlers below and rebuilt with the rebuild_actual_slots command.
+
+    The assignment and substitution keys have no database constraint, because the
+    handlers for a cascading delete can write slots for an assignment that is about to
+    be deleted. The Assignment delete handler removes them.
+    """
+
+    date = models.DateField(db_index=True)
+    job = models.ForeignKey(
+        Job,
+        on_delete=models.CASCADE,
+        null=True)
+    volunteer = models.ForeignKey(
+        Volunteer,
+        related_name="actual_slots",
+        on_delete=models.SET_NULL,
+        null=True)
+    original = models.ForeignKey(
+        Volunteer,
+        on_delete=models.SET_NULL,
+        null=True)
+    is_substitution = models.BooleanField()
+    assignment = models.ForeignKey(
+        Assignment,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True)
+    substitution = models.ForeignKey(
+        Substitution,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True)
+
+    def as_row(self):
+        return (
+            self.date,
+            self.volunteer_id,
+            self.job_id,
+            self.original_id,
+            self.is_substitution,
+            self.assignment_id,
+            self.substitution_id,
+        )
+
+
+class ActualCalendar(models.Model):
+    """
+    The dates [start_date, end_date) that ActualSlot holds. There is at most one row,
+    and no row means ActualSlot has not been built.
+    """
+
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+
+def slots_from_rows(rows):
+    return [
+        ActualSlot(
+            date=day,
+            volunteer_id=vol,
+            job_id=job,
+            original_id=orig,
+            is_substitution=is_sub,
+            assignment_id=ass,
+            substitution_id=sub,
+        )
+        for day, vol, job, orig, is_sub, ass, sub in rows
+    ]
+
+
+def rebuild_actual_slots(days=ACTUAL_SLOT_WINDOW):
+    """
+    Throw away ActualSlot and build it again for today through days from now.
+    Returns the number of slots written.
+    """
+    start_date = date.today()
+    end_date = start_date + timedelta(days=days)
+    with transaction.atomic():
+        ActualSlot.objects.all().delete()
+        ActualCalendar.objects.all().delete()
+        slots = ActualSlot.objects.bulk_create(
+            slots_from_rows(schedule_rows(start_date, end_date)))
+        ActualCalendar.objects.create(start_date=start_date, end_date=end_date)
+    return len(slots)
+
+
+def roll_actual_slots(days=ACTUAL_SLOT_WINDOW):
+    """
+    Move the ActualCalendar window so it starts today, dropping the days that have
+    passed and scheduling the days that have come into the window.
+    """
+    calendar = ActualCalendar.objects.first()
+    if calendar is None:
+        return rebuild_actual_slots(days)
+    today = date.today()
+    end_date = today + timedelta(days=days)
+    with transaction.atomic():
+        ActualSlot.objects.filter(date__lt=today).delete()
+        slots = ActualSlot.objects.bulk_create(
+            slots_from_rows(schedule_rows(max(calendar.end_date, today), end_date)))
+        calendar.start_date = today
+        calendar.end_date = end_date
+        calendar.save()
+    return len(slots)
+
+
+def verify_actual_slots():
+    """
+    Compare ActualSlot against the schedule computed from the assignments and
+    substitutions. Returns (missing, extra), Counters of the rows the table lacks and
+    the rows it should not have. Both are empty when the table is correct.
+    """
+    calendar = ActualCalendar.objects.first()
+    if calendar is None:
+        return Counter(), Counter()
+    start_date = max(calendar.start_date, date.today())
+    expected = Counter(schedule_rows(start_date, calendar.end_date))
+    actual = Counter(
+        slot.as_row() for slot in ActualSlot.objects.filter(
+            date__gte=start_date, date__lt=calendar.end_date))
+    return expected - actual, actual - expected
+
+
+def refresh_actual_slots(assignment_pks, substitution_pks=()):
+    """
+    Reschedule the slots of the given assignments and substitutions, including the
+    substitutions of those assignments, if ActualSlot has been built.
+    """
+    assignment_pks = [pk for pk in assignment_pks if pk is not None]
+    if not assignment_pks and not substitution_pks:
+        return
+    calendar = ActualCalendar.objects.first()
+    if calendar is None:
+        return
+    start_date = max(calendar.start_date, date.today())
+    ActualSlot.objects.filter(
+        Q(assignment__in=assignment_pks) | Q(substitution__in=substitution_pks)).delete()
+    ActualSlot.objects.bulk_create(slots_from_rows(schedule_rows(
+        start_date,
+        calendar.end_date,
+        Q(pk__in=assignment_pks),
+        Q(assignment__in=assignment_pks) | Q(pk__in=substitution_pks),
+    )))
+
+
+@receiver(post_save, sender=Assignment)
+def update_assignment_slots(sender, instance, **kwargs):
+    refresh_actual_slots([instance.pk])
+
+
+@receiver(post_delete, sender=Assignment)
+def delete_assignment_slots(sender, instance, **kwargs):
+    ActualSlot.objects.filter(assignment=instance.pk).delete()
+
+
+@receiver(post_save, sender=Substitution)
+def update_substitution_slots(sender, instance, **kwargs):
+    # the assignment it used to substitute for gets its day back
+    previous = ActualSlot.objects.filter(substitution=instance.pk).values_list("assignment", flat=True)
+    refresh_actual_slots({instance.assignment_id, *previous}, [instance.pk])
+
+
+@receiver(post_delete, sender=Substitution)
+def delete_substitution_slots(sender, instance, **kwargs):
+    ActualSlot.objects.filter(substitution=instance.pk).delete()
+    # past substitutions, like the ones purged by the cron, never had a slot to give back
+    if instance.date >= date.today():
+        refresh_actual_slots([instance.assignment_id])
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_save, sender=Route)
+def update_bonus_route_slots(sender, instance, **kwargs):
+    # a new recurrence moves the days of the bonus route assignments
+    refresh_actual_slots(Assignment.objects.filter(
+        job=instance.pk, day_of_week=None, week_of_month=None).values_list("pk", flat=True))
+
+
+class JobMailingList(models.Model):
+    """
+    The email addresses of the volunteers assigned to a job and of its substitutes from
+    date on, comma separated. Rows are deleted by the signal handlers below when they go
+    stale and built again by for_job() on the next read.
+    """
+
+    job = models.OneToOneField(
+        Job,
+        related_name="mailing_list",
+        on_delete=models.CASCADE)
+    date = models.DateField()
+    assigned_emails = models.TextField(default="", blank=True)
+    sub_emails = models.TextField(default="", blank=True)
+
+    @property
+    def all_emails(self):
+        return ",".join(sorted(
+            set(self.assigned_emails.split(",") + self.sub_emails.split(",")) - {""}))
+
+    @staticmethod
+    def build(job):
+        """
+        Return an unsaved JobMailingList of job for today, read with one query.
+        """
+        today = date.today()
+        assigned = Assignment.objects.filter(job=job).values_list(
+            "volunteer__user__email", Value(False))
+        substitutes = Substitution.objects.filter(
+            assignment__job=job, date__gte=today).values_list(
+            "volunteer__user__email", Value(True))
+        emails = {False: set(), True: set()}
+        for email, is_substitution in assigned.union(substitutes):
+            if email:
+                emails[is_substitution].add(email)
+        return JobMailingList(
+            job=job,
+            date=today,
+            assigned_emails=",".join(sorted(emails[False])),
+            sub_emails=",".join(sorted(emails[True])),
+        )
+
+    @staticmethod
+    def for_job(job):
+        """
+        Return the JobMailingList of job for today, building and saving it if needed.
+        """
+        mailing_list = JobMailingList.objects.filter(job=job, date=date.today()).first()
+        if mailing_list is None:
+            mailing_list = JobMailingList.build(job)
+            JobMailingList.objects.update_or_create(
+                job=job,
+                defaults={
+                    "date": mailing_list.date,
+                    "assigned_emails": mailing_list.assigned_emails,
+                    "sub_emails": mailing_list.sub_emails,
+                })
+        return mailing_list
+
+
+@receiver(pre_save, sender=Assignment)
+@receiver(pre_save, sender=Substitution)
+def check_mailing_list_jobs(sender, instance, raw=False, **kwargs):
+    # an edit may move the row off a job, whose list goes stale with the new job's
+    instance._old_mailing_list_jobs = set()
+    if raw or instance._state.adding:
+        return
+    field = "job" if sender is Assignment else "assignment__job"
+    instance._old_mailing_list_jobs = set(
+        sender.objects.filter(pk=instance.pk).values_list(field, flat=True))
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def delete_assignment_mailing_list(sender, instance, **kwargs):
+    jobs = {instance.job_id} | getattr(instance, "_old_mailing_list_jobs", set())
+    JobMailingList.objects.filter(job__in=jobs).delete()
+
+
+@receiver(post_save, sender=Substitution)
+@receiver(post_delete, sender=Substitution)
+def delete_substitution_mailing_list(sender, instance, **kwargs):
+    JobMailingList.objects.filter(
+        Q(job__assignment=instance.assignment_id)
+        | Q(job__in=getattr(instance, "_old_mailing_list_jobs", set()))).delete()
+
+
+def delete_volunteer_mailing_lists(volunteers):
+    """
+    Delete the lists of the jobs volunteers are assigned to or substitute on.
+    """
+    jobs = Assignment.objects.filter(
+        Q(volunteer__in=volunteers) | Q(substitution__volunteer__in=volunteers)).values("job")
+    JobMailingList.objects.filter(job__in=jobs).delete()
+
+
+@receiver(pre_save, sender=User)
+def check_user_changes(sender, instance, raw=False, **kwargs):
+    # logins save the user too, only its names and email are read by the reports and
+    # mailing lists
+    instance._changed_fields = set()
+    fields = {"first_name", "last_name", "email"}
+    update_fields = kwargs["update_fields"]
+    if update_fields:
+        fields &= set(update_fields)
+    if raw or instance._state.adding or not fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values(*fields).first() or {}
+    instance._changed_fields = {
+        field for field in fields if old.get(field) != getattr(instance, field)}
+
+
+@receiver(post_save, sender=User)
+def delete_user_mailing_lists(sender, instance, **kwargs):
+    # emails live on the user, only the lists of its volunteer's jobs hold it
+    if "email" in getattr(instance, "_changed_fields", ()):
+        delete_volunteer_mailing_lists(Volunteer.objects.filter(user=instance))
+
+
+@receiver(pre_delete, sender=Volunteer)
+def delete_deleted_volunteer_mailing_lists(sender, instance, **kwargs):
+    # deleting a volunteer clears its assignments and substitutions without saving them
+    delete_volunteer_mailing_lists([instance])
+
+
+@receiver(post_delete, sender=ReportJob)
+def delete_report_file(sender, instance, **kwargs):
+    if instance.file_path:
+        try:
+            os.remove(instance.file_path)
+        except FileNotFoundError:
+            pass
+
+
+
+def bump_changed_data_version(sender, instance, **kwargs):
+    bump_data_version(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_data_version(sender, instance, created=False, **kwargs):
+    # users are saved on every login, so only new, deleted and renamed users count
+    if (created or kwargs["signal"] is post_delete
+            or getattr(instance, "_changed_fields", None)):
+        bump_data_version(User)
+
+
+def track_data_versions(*model_classes):
+    for model in model_classes:
+        post_save.connect(bump_changed_data_version, sender=model)
+        post_delete.connect(bump_changed_data_version, sender=model)
+
+
+track_data_versions(
+    Assignment,
+    Customer,
+    CustomerRecord,
+    DateRange,
+    Diet,
+    Job,
+    Payment,
+    Pet,
+    PetFood,
+    Route,
+    Substitution,
+    Volunteer,
+)
@@ -1,8 +1,11 @@
+import json
 import logging
+from collections import Counter
 from datetime import date, timedelta
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.core import serializers
 from django.db import IntegrityError
 from django.db.models import BooleanField, DateField, F, Value
 from django.test import TestCase
@@ -12,6 +15,8 @@ from recurrence import serialize
 from interfaces.recurrence import (
     FR,
     MO,
+    MONTHLY,
+    TU,
     WE,
     WEEKLY,
     Recurrence,
@@ -25,7 +30,10 @@ from models.models import (
     Customer,
     CustomerRecord,
     DateRange,
+    ActualCalendar,
+    ActualSlot,
     Job,
+    JobOccurrence,
     JobType,
     Payment,
     Route,
@@ -33,6 +41,9 @@ from models.models import (
     Volunteer,
     VolunteerRecord,
     actual_dict_to_namedtuple,
+    rebuild_actual_slots,
+    recurrence_includes,
+    verify_actual_slots,
 )
 
 log = logging.getLogger(__name__)
@@ -129,6 +140,102 @@ class TestCustomer(TestCase):
                     month=1,
                     day=5)))
 
+    @freeze_time("2020-3-4")
+    def test_meal_counts(self):
+        """
+        Test that meal_counts() matches num_meals_on_day() for every customer and day,
+        in a fixed number of queries.
+        """
+        recurrences = [
+            Recurrence(rrules=[Rule(freq=WEEKLY, byday=(MO, WE, FR))]),
+            Recurrence(rrules=[Rule(freq=MONTHLY, byday=TU(2))]),
+            Recurrence(
+                rrules=[Rule(freq=WEEKLY, byday=(MO, TU, WE, FR))],
+                exrules=[Rule(freq=MONTHLY, byday=MO(1))],
+            ),
+            Recurrence(rrules=[Rule(freq=WEEKLY, interval=2, byday=(TU, FR))]),
+            Recurrence(rrules=[Rule(freq=WEEKLY, byday=(MO, WE, FR))]),
+        ]
+        customers = [
+            Customer.objects.create(
+                active=i != 4,
+                first_name="test",
+                last_name=f"customer{i}",
+                address="555 Main St.",
+                num_weekend_meals=i,
+                meal_recurrence=serialize(recurrence),
+            )
+            for i, recurrence in enumerate(recurrences)
+        ]
+        today = date.today()
+        DateRange.objects.create(
+            customer=customers[0],
+            start_date=today + timedelta(days=5),
+            end_date=today + timedelta(days=12),
+        )
+        DateRange.objects.create(
+            customer=customers[2],
+            start_date=today - timedelta(days=20),
+            end_date=today + timedelta(days=2),
+        )
+        for i in range(10):
+            CustomerRecord.objects.create(
+                customer=customers[i % 5],
+                date=today - timedelta(days=i),
+                num_meals=i,
+            )
+
+        start_date = today - timedelta(days=12)
+        end_date = today + timedelta(days=50)
+        with self.assertNumQueries(2):
+            counts = Customer.meal_counts(customers, start_date, end_date)
+        self.assertEqual(len(counts), len(customers) * 62)
+        for customer in customers:
+            day = start_date
+            while day < end_date:
+                self.assertEqual(
+                    counts[(customer.pk, day)], customer.num_meals_on_day(day) or 0)
+                day += timedelta(days=1)
+
+    def test_meal_schedule(self):
+        """
+        Test that the compiled schedule follows meal_recurrence and that schedule_filter
+        finds the customers scheduled on a day.
+        """
+        weekly = Customer.objects.create(
+            active=True,
+            first_name="test",
+            last_name="weekly",
+            address="555 Main St.",
+            meal_recurrence=serialize(Recurrence(rrules=[Rule(freq=WEEKLY, byday=(MO, WE))])),
+        )
+        last_friday = Customer.objects.create(
+            active=True,
+            first_name="test",
+            last_name="last friday",
+            address="555 Main St.",
+            meal_recurrence="RRULE:FREQ=MONTHLY;BYDAY=-1FR",
+        )
+        self.assertIsNotNone(weekly.meal_schedule)
+        self.assertIsNone(last_friday.meal_schedule)
+
+        monday = date(year=2050, month=1, day=3)
+        tuesday = date(year=2050, month=1, day=4)
+        self.assertEqual(
+            set(Customer.objects.filter(Customer.schedule_filter(monday))),
+            {weekly, last_friday})
+        self.assertEqual(
+            set(Customer.objects.filter(Customer.schedule_filter(tuesday))),
+            {last_friday})
+
+        weekly.meal_recurrence = serialize(Recurrence(rrules=[Rule(freq=WEEKLY, byday=(TU,))]))
+        weekly.save()
+        weekly.refresh_from_db()
+        self.assertTrue(weekly.num_meals_on_day(tuesday))
+        self.assertFalse(weekly.num_meals_on_day(monday))
+        self.assertTrue(last_friday.num_meals_on_day(date(year=2050, month=1, day=28)))
+        self.assertFalse(last_friday.num_meals_on_day(date(year=2050, month=1, day=21)))
+
     def test_num_meals_on_day_historical(self):
 
         payment = Payment.objects.create(name="testpayment")
@@ -767,6 +874,22 @@ class TestActuals(TestCase):
                 a.job.get_route_number(),
                 a.job.job_type.strip_space_in_name))
 
+    def test_order_by_job_name(self):
+        """
+        Test that jobs are ordered by name, not by when they were created.
+        """
+        today = date.today()
+        job_type = JobType.objects.get_or_create(name="test_type")[0]
+        jobs = [Job.objects.create(name=name, job_type=job_type) for name in ("zz job", "aa job")]
+        for job in jobs:
+            Assignment.objects.create(
+                job=job,
+                day_of_week=today.isoweekday(),
+                week_of_month=date_to_day_of_month(today).week_of_month)
+        actuals = Assignment.actuals(today, today + timedelta(days=1), order_by=("date", "job"))
+        self.assertEqual(
+            [a.job.name for a in actuals if a.job in jobs], ["aa job", "zz job"])
+
     def test_exclude_unfilled(self):
         today = date.today()
         days30 = timedelta(days=30)
@@ -788,3 +911,263 @@ class TestActuals(TestCase):
         for actual in excluded_actuals:
             if actual.date >= today:
                 self.assertTrue(actual.volunteer)
+
+    def test_parity_with_union_actuals(self):
+        """
+        Test that actuals() gives exactly what the original union_actuals() gives.
+        """
+        today = date.today()
+        days30 = timedelta(days=30)
+        bonus_route = Route.objects.create(
+            name="Bonus Job",
+            number=100,
+            job_type=JobType.objects.get_or_create(name="Bonus Delivery")[0],
+            bonusRoute=self.jobs[0],
+            recurrence=Recurrence(rrules=[Rule(freq=WEEKLY, byday=(FR,))]),
+        )
+        Assignment.objects.create(volunteer=self.vols[3], job=bonus_route)
+        Assignment.objects.create(volunteer=None, job=bonus_route)
+
+        def sort_values(actual, order_by):
+            values = []
+            for o in order_by:
+                if o == "date":
+                    values.append(actual.date)
+                elif o == "volunteer":
+                    values.append(actual.volunteer.user.last_name if actual.volunteer else None)
+                    values.append(actual.volunteer.user.first_name if actual.volunteer else None)
+                elif o == "job":
+                    values.append(actual.job.get_route_number())
+                    values.append(actual.job.job_type.name)
+                    values.append(actual.job.name)
+            return tuple(values)
+
+        ranges = [
+            (today - days30, today + days30),
+            (today, None),
+            (today - timedelta(days=10), today - timedelta(days=5)),
+            (today + timedelta(days=3), today + timedelta(days=17)),
+        ]
+        filters = [
+            {},
+            {"volunteer": self.vols[0]},
+            {"original": None},
+            {"job": self.jobs[2]},
+            {"job": bonus_route},
+            {"exclude_unfilled": True},
+        ]
+        order_bys = [None, "date", ("date", "job", "volunteer"), "volunteer"]
+        for start_date, end_date in ranges:
+            for kwargs in filters:
+                for order_by in order_bys:
+                    expected = list(Assignment.union_actuals(
+                        start_date, end_date, order_by=order_by, **kwargs))
+                    actuals = list(Assignment.actuals(
+                        start_date, end_date, order_by=order_by, **kwargs))
+                    self.assertEqual(len(actuals), len(expected))
+                    self.assertEqual(set(actuals), set(expected))
+                    if order_by:
+                        order_by = (order_by,) if isinstance(order_by, str) else order_by
+                        self.assertEqual(
+                            [sort_values(a, order_by) for a in actuals],
+                            [sort_values(a, order_by) for a in expected],
+                        )
+
+    def test_query_count(self):
+        """
+        Test that the number of queries doesn't grow with the range or the number of actuals,
+        including the queries for displaying the volunteers and jobs.
+        """
+        today = date.today()
+
+        def display(actuals):
+            return [
+                (str(a.volunteer), str(a.original), a.job.get_route_number(), a.job.job_type.name)
+                for a in actuals
+            ]
+
+        for days in (1, 30):
+            # ActualSlot has not been built, so this is computed from the assignments
+            with self.assertNumQueries(7):
+                display(Assignment.actuals(
+                    today - timedelta(days=days),
+                    today + timedelta(days=days),
+                    order_by=("date", "job", "volunteer"),
+                ))
+
+    def test_actual_slots(self):
+        """
+        Test that actuals() read from ActualSlot give what union_actuals() gives, and that
+        the signal handlers keep ActualSlot matching the schedule as it changes.
+        """
+        today = date.today()
+        bonus_route = Route.objects.create(
+            name="Bonus Job",
+            number=100,
+            job_type=JobType.objects.get_or_create(name="Bonus Delivery")[0],
+            bonusRoute=self.jobs[0],
+            recurrence=Recurrence(rrules=[Rule(freq=WEEKLY, byday=(FR,))]),
+        )
+        bonus_assignment = Assignment.objects.create(volunteer=self.vols[3], job=bonus_route)
+        rebuild_actual_slots(60)
+        self.assertEqual(ActualCalendar.objects.get().start_date, today)
+        self.assertTrue(ActualSlot.objects.filter(date__gte=today).exists())
+
+        def assert_matches():
+            self.assertEqual(verify_actual_slots(), (Counter(), Counter()))
+            for kwargs in ({}, {"volunteer": self.vols[1]}, {"job": self.jobs[2]}):
+                for exclude_unfilled in (False, True):
+                    self.assertEqual(
+                        list(Assignment.actuals(
+                            today - timedelta(days=5),
+                            today + timedelta(days=40),
+                            order_by=("date", "job", "volunteer"),
+                            exclude_unfilled=exclude_unfilled,
+                            **kwargs)),
+                        list(Assignment.union_actuals(
+                            today - timedelta(days=5),
+                            today + timedelta(days=40),
+                            order_by=("date", "job", "volunteer"),
+                            exclude_unfilled=exclude_unfilled,
+                            **kwargs)),
+                    )
+
+        assert_matches()
+
+        sub = [s for s in self.subs if s.date >= today][0]
+        sub.volunteer = self.vols[5]
+        sub.save()
+        assert_matches()
+        sub.delete()
+        assert_matches()
+
+        ass = self.assignments[7]
+        Substitution.objects.create(
+            volunteer=self.vols[0],
+            assignment=ass,
+            date=today + timedelta(days=21),
+        )
+        ass.volunteer = self.vols[9]
+        ass.save()
+        assert_matches()
+        ass.delete()
+        assert_matches()
+
+        bonus_route.recurrence = Recurrence(rrules=[Rule(freq=WEEKLY, byday=(MO, WE))])
+        bonus_route.save()
+        assert_matches()
+        bonus_assignment.volunteer = None
+        bonus_assignment.save()
+        assert_matches()
+
+        self.vols[2].delete()
+        assert_matches()
+        self.jobs[4].delete()
+        assert_matches()
+
+    def test_actual_slots_query_count(self):
+        """Test that actuals() inside the ActualSlot window is one query per table"""
+        today = date.today()
+        rebuild_actual_slots()
+        with self.assertNumQueries(5):
+            list(Assignment.actuals(
+                today - timedelta(days=30),
+                today + timedelta(days=30),
+                order_by=("date", "job", "volunteer"),
+            ))
+
+
+@freeze_time("2020-3-2")
+class TestJobOccurrence(TestCase):
+    def setUp(self):
+        job_type = JobType.objects.create(name="Bonus Delivery")
+        self.route = Route.objects.create(name="Route", number=1, job_type=job_type)
+        self.job = Route.objects.create(
+            name="Bonus Job",
+            number=2,
+            job_type=job_type,
+            bonusRoute=self.route,
+            recurrence=Recurrence(rrules=[Rule(freq=WEEKLY, byday=(FR,))]),
+        )
+
+    def test_materialized_on_save(self):
+        """Test that saving a job writes its occurrences from today through the horizon"""
+        today = date.today()
+        self.assertEqual(self.job.occurrences_start, today)
+        occurrences = list(
+            JobOccurrence.objects.filter(job=self.job).values_list("date", flat=True))
+        self.assertEqual(len(occurrences), 52)
+        for day in occurrences:
+            self.assertEqual(day.weekday(), 4)
+            self.assertTrue(self.job.occurrences_start <= day < self.job.occurrences_end)
+
+    def test_regenerated_on_save(self):
+        """Test that changing the recurrence replaces the occurrences"""
+        self.job.recurrence = Recurrence(rrules=[Rule(freq=WEEKLY, byday=(MO, WE))])
+        self.job.save()
+        weekdays = set(
+            day.weekday() for day in
+            JobOccurrence.objects.filter(job=self.job).values_list("date", flat=True))
+        self.assertEqual(weekdays, {0, 2})
+
+    def test_unchanged_days_not_regenerated(self):
+        """Test that renames, other jobs and fixtures leave the occurrences alone"""
+        first = JobOccurrence.objects.filter(job=self.job).first()
+        self.job.name = "Renamed Bonus Job"
+        self.job.save()
+        self.assertTrue(JobOccurrence.objects.filter(pk=first.pk).exists())
+        self.route.recurrence = Recurrence(rrules=[Rule(freq=WEEKLY, byday=(MO,))])
+        self.route.save()
+        self.assertFalse(JobOccurrence.objects.filter(job=self.route).exists())
+        self.assertIsNone(Route.objects.get(pk=self.route.pk).occurrences_start)
+        fixture = [
+            {"model": "models.job", "pk": 100, "fields": {
+                "name": "Fixture", "job_type": self.route.job_type.pk,
+                "recurrence": serialize(self.job.recurrence)}},
+            {"model": "models.route", "pk": 100, "fields": {
+                "number": 3, "bonusRoute": self.job.pk}},
+        ]
+        for obj in serializers.deserialize("json", json.dumps(fixture)):
+            obj.save()
+        self.assertTrue(Route.objects.filter(pk=100).exists())
+        self.assertFalse(JobOccurrence.objects.filter(job=100).exists())
+
+    def test_bonus_link_regenerates(self):
+        """Test that linking a route to a main route writes its occurrences"""
+        self.route.bonusRoute = self.job
+        self.route.recurrence = Recurrence(rrules=[Rule(freq=WEEKLY, byday=(MO,))])
+        self.route.save()
+        self.assertEqual(
+            JobOccurrence.objects.filter(job=self.route).first().date.weekday(), 0)
+
+    def test_extend_occurrences(self):
+        """Test that extending adds only the days past the end of the window"""
+        first = JobOccurrence.objects.filter(job=self.job).first()
+        end_date = self.job.occurrences_end
+        self.job.extend_occurrences(end_date + timedelta(days=14))
+        self.assertTrue(JobOccurrence.objects.filter(pk=first.pk).exists())
+        self.assertEqual(
+            JobOccurrence.objects.filter(job=self.job, date__gte=end_date).count(), 2)
+        self.assertEqual(
+            Job.objects.get(pk=self.job.pk).occurrences_end, end_date + timedelta(days=14))
+
+    def test_matches_recurrence(self):
+        """Test that lookups inside and outside the materialized window agree with the
+        recurrence"""
+        job = Job.objects.get(pk=self.job.pk)
+        start_date = job.occurrences_start - timedelta(days=30)
+        end_date = job.occurrences_end + timedelta(days=30)
+        expected = []
+        day = start_date
+        while day < end_date:
+            if recurrence_includes(job.recurrence, day):
+                expected.append(day)
+            self.assertEqual(job.runs_on(day), day in expected)
+            day += timedelta(days=1)
+        self.assertEqual(job.occurrences_between(start_date, end_date), expected)
+
+    def test_lookup_uses_table(self):
+        """Test that a lookup inside the window is a single query"""
+        job = Job.objects.get(pk=self.job.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(job.runs_on(date(2020, 3, 6)))
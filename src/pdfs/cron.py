@@ -1,138 +1,442 @@
+import os
+import time
+from contextlib import contextmanager
 from datetime import date, timedelta
 from logging import getLogger
 
+from django.db import connection, transaction
+from django.db.models import DO_NOTHING, Q
 from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
 
 from interfaces.recurrence import is_friday, is_weekend
-from meals.constants import RETENTION
+from meals.constants import (
+    DAILY_CRON_LOCK,
+    OCCURRENCE_HORIZON,
+    PURGE_BATCH_SIZE,
+    REPORT_RETENTION,
+    RETENTION,
+)
 from models.models import (
-    Actual,
+    ActualSlot,
     Assignment,
+    BillingDaily,
+    CronRun,
     Customer,
     CustomerRecord,
     DateRange,
     ManagerAnnouncement,
+    ReportJob,
+    Route,
     Substitution,
     VolunteerRecord,
+    bump_data_version,
+    roll_actual_slots,
 )
 
 log = getLogger(__name__)
 
 
-def write_customer_record():
+def write_customer_record(day=None):
     """
     This is a cron job that runs everyday to write the current customer/meal to CustomerRecord
     This ensures historical accuracy even when the Customer objects change over time
+
+    The meals are counted in one pass, and today's records are written with one insert, one
+    update and one delete. Returns the number of records created, updated and deleted.
+    day defaults to today, an earlier day writes the records the cron missed that day.
     """
 
-    today = date.today()
+    today = day or date.today()
 
-    customers = Customer.objects.filter(active=1)
+    customers = list(Customer.objects.filter(active=1))
+    meal_counts = Customer.meal_counts(customers, today, as_of=today)
+    existing = {
+        record.customer_id: record
+        for record in CustomerRecord.objects.filter(
+            date=today, customer__in=customers)}
 
+    to_create = []
+    to_update = []
+    to_delete = []
     for customer in customers:
-        num_meals = customer.num_meals_on_day(today)
-        if num_meals != 0:
-            _, created = CustomerRecord.objects.update_or_create(
-                customer=customer,
-                date=today,
-                defaults=dict(
-                    num_meals=num_meals,
-                    payment_type=customer.pays,
-                    route_assigned=customer.route,
-                ),
-            )
-            if created:
-                log.info(f"Created CustomerRecord for {customer}")
-        else:
-            try:
-                record = CustomerRecord.objects.get(
-                    customer=customer, date=today,)
-                record.delete()
+        num_meals = meal_counts[(customer.pk, today)]
+        record = existing.get(customer.pk)
+        if num_meals == 0:
+            if record is not None:
+                to_delete.append(customer.pk)
                 log.info(
                     f"Customer {customer} was recieving a meal, but now is not")
-            except CustomerRecord.DoesNotExist:
-                continue
+        elif record is None:
+            to_create.append(CustomerRecord(
+                customer=customer,
+                date=today,
+                num_meals=num_meals,
+                payment_type_id=customer.pays_id,
+                route_assigned_id=customer.route_id,
+            ))
+        elif (record.num_meals, record.payment_type_id, record.route_assigned_id) != (
+                num_meals, customer.pays_id, customer.route_id):
+            record.num_meals = num_meals
+            record.payment_type_id = customer.pays_id
+            record.route_assigned_id = customer.route_id
+            to_update.append(record)
+
+    CustomerRecord.objects.bulk_create(to_create)
+    CustomerRecord.objects.bulk_update(
+        to_update, ["num_meals", "payment_type", "route_assigned"])
+    deleted = 0
+    if to_delete:
+        deleted, _ = CustomerRecord.objects.filter(
+            date=today, customer__in=to_delete).delete()
+    counts = {"created": len(to_create), "updated": len(to_update), "deleted": deleted}
+    if any(counts.values()):
+        bump_data_version(CustomerRecord)
+    log.info(
+        f"CustomerRecords for {today}: {counts['created']} created, "
+        f"{counts['updated']} updated, {counts['deleted']} deleted")
+    return counts
+
+
+def write_billing_daily(start_date=None, end_date=None):
+    """
+    Roll the CustomerRecords of the days [start_date, end_date) up into BillingDaily, by
+    default just today's.
+    """
+    start_date = start_date or date.today()
+    count = BillingDaily.rollup(start_date, end_date)
+    log.info(f"BillingDaily from {start_date}: {count} rows written")
+    return count
 
 
-def write_volunteer_record():
+def volunteer_record_key(actual):
+    """
+    Return the (date, volunteer, job, original, is_substitution) pks of an Actual.
+    """
+    return (
+        actual.date,
+        actual.volunteer.pk if actual.volunteer else None,
+        actual.job.pk if actual.job else None,
+        actual.original.pk if actual.original else None,
+        actual.is_substitution,
+    )
+
+
+def write_volunteer_record(start_date=None, end_date=None):
     """
     This is a cron job that runs everyday to write the current volunteer/job to VolunteerRecord
     This ensures historical accuracy even when the Volunteer objects change over time
+
+    The actuals and the existing records are compared as tuples of pks, and the records are
+    written with one insert and one delete. start_date defaults to today and end_date
+    (exclusive) to the day after start_date, an earlier range writes the records of the days
+    the cron missed in one pass. Returns the number of records created and deleted.
     """
-    today = date.today()
-    actuals = set(Assignment.actuals(today, exclude_unfilled=True))
-    existing = set()
-    for record in VolunteerRecord.objects.filter(date=today):
-        existing.add(
-            Actual(
-                volunteer=record.volunteer,
-                job=record.job,
-                date=today,
-                original=record.original,
-                is_substitution=record.is_substitution,
-            )
+    start_date = start_date or date.today()
+    end_date = end_date or start_date + timedelta(days=1)
+    actuals = {
+        volunteer_record_key(actual)
+        for actual in Assignment.actuals(
+            start_date, end_date, exclude_unfilled=True, as_of=start_date)
+    }
+    existing = {}
+    for pk, *key in VolunteerRecord.objects.filter(
+            date__gte=start_date, date__lt=end_date).values_list(
+            "pk", "date", "volunteer", "job", "original", "is_substitution"):
+        existing.setdefault(tuple(key), []).append(pk)
+
+    to_create = [
+        VolunteerRecord(
+            date=day,
+            volunteer_id=volunteer,
+            job_id=job,
+            original_id=original,
+            is_substitution=is_substitution,
         )
-    to_add = actuals - existing
-    to_delete = existing - actuals
-    for actual in to_delete:
-        record = VolunteerRecord.objects.get(**actual._asdict())
-        record.delete()
-        log.info(f"VolunteerRecord {record} deleted")
-    for actual in to_add:
-        record = VolunteerRecord.objects.create(**actual._asdict())
-        log.info(f"VolunteerRecord {record} created")
-
-
-def delete_old_customer_record():
-    custs = CustomerRecord.objects.filter(
-        date__lt=date.today() - timedelta(days=RETENTION))
-    for cust in custs:
-        cust.delete()
-        log.info(f"Deleting {cust}")
-
-
-def delete_old_volunteer_record():
-    vols = VolunteerRecord.objects.filter(
-        date__lt=date.today() - timedelta(days=RETENTION))
-    for vol in vols:
-        log.info(f"Deleting {vol}")
-        vol.delete()
-
-
-def delete_old_substitutions():
-    subs = Substitution.objects.filter(
-        date__lt=date.today() - timedelta(days=RETENTION))
-    for sub in subs:
-        log.info(f"Deleting {sub}")
-        sub.delete()
-
-
-def delete_old_daterange():
-    drs = DateRange.objects.filter(
+        for day, volunteer, job, original, is_substitution in actuals - existing.keys()
+    ]
+    # duplicate records of an actual are removed along with the ones that no longer match
+    to_delete = [
+        pk
+        for key, pks in existing.items()
+        for pk in (pks if key not in actuals else pks[1:])
+    ]
+
+    # delete first, a changed record can share (volunteer, job, date) with its replacement
+    deleted = 0
+    if to_delete:
+        deleted, _ = VolunteerRecord.objects.filter(pk__in=to_delete).delete()
+    VolunteerRecord.objects.bulk_create(to_create)
+    if to_create or deleted:
+        bump_data_version(VolunteerRecord)
+    counts = {"created": len(to_create), "deleted": deleted}
+    log.info(
+        f"VolunteerRecords from {start_date} to {end_date}: "
+        f"{counts['created']} created, {counts['deleted']} deleted")
+    return counts
+
+
+def has_cascades(model):
+    """
+    Return True if deleting rows of model has to touch other rows, through a foreign key
+    that isn't DO_NOTHING or a many to many field.
+    """
+    return bool(model._meta.many_to_many) or any(
+        relation.on_delete is not DO_NOTHING for relation in model._meta.related_objects)
+
+
+def delete_rows(model, pks):
+    """
+    Delete the rows of model with the primary keys pks in one statement, without signals.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", pks)
+
+
+def purge(queryset, dry_run=False, batch_size=PURGE_BATCH_SIZE, on_batch=None):
+    """
+    Delete the rows of queryset in batches of batch_size primary keys, each batch in its
+    own short transaction, and log one summary line. With dry_run nothing is deleted and
+    only the count is logged. Returns the number of rows matched.
+
+    Rows without cascades are deleted with one statement per batch and no per-row
+    signals, so any side effects of the model's delete handlers are up to the caller:
+    on_batch is called with the queryset of each batch before it is deleted.
+    """
+    model = queryset.model
+    name = model.__name__
+    if dry_run:
+        count = queryset.count()
+        log.info(f"Would delete {count} {name} rows")
+        return count
+    count = 0
+    batches = 0
+    while True:
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            batch = model.objects.filter(pk__in=pks)
+            if on_batch is not None:
+                on_batch(batch)
+            if has_cascades(model):
+                batch.delete()
+            else:
+                delete_rows(model, pks)
+        count += len(pks)
+        batches += 1
+    log.info(f"Deleted {count} {name} rows in {batches} batches")
+    return count
+
+
+def delete_old_customer_record(dry_run=False):
+    count = purge(CustomerRecord.objects.filter(
+        date__lt=date.today() - timedelta(days=RETENTION)), dry_run)
+    if count and not dry_run:
+        bump_data_version(CustomerRecord)
+    return count
+
+
+def delete_old_billing_daily(dry_run=False):
+    return purge(BillingDaily.objects.filter(
+        date__lt=date.today() - timedelta(days=RETENTION)), dry_run)
+
+
+def delete_old_volunteer_record(dry_run=False):
+    count = purge(VolunteerRecord.objects.filter(
+        date__lt=date.today() - timedelta(days=RETENTION)), dry_run)
+    if count and not dry_run:
+        bump_data_version(VolunteerRecord)
+    return count
+
+
+def delete_substitution_slots(substitutions):
+    # the purged substitutions are in the past, so they give no day back to their
+    # assignments and were never on a mailing list, only their slots have to go
+    ActualSlot.objects.filter(substitution__in=substitutions.values("pk")).delete()
+
+
+def delete_old_substitutions(dry_run=False):
+    count = purge(Substitution.objects.filter(
+        date__lt=date.today() - timedelta(days=RETENTION)), dry_run,
+        on_batch=delete_substitution_slots)
+    if count and not dry_run:
+        bump_data_version(Substitution)
+    return count
+
+
+def delete_old_daterange(dry_run=False):
+    count = purge(DateRange.objects.filter(
         start_date__lt=date.today() - timedelta(days=RETENTION),
         end_date__lt=date.today() - timedelta(days=RETENTION),
-    )
-    for dr in drs:
-        log.info(f"Deleting {dr}")
-        dr.delete()
+    ), dry_run)
+    if count and not dry_run:
+        bump_data_version(DateRange)
+    return count
 
 
-def delete_old_announcement():
-    announces = ManagerAnnouncement.objects.filter(
+def delete_old_announcement(dry_run=False):
+    return purge(ManagerAnnouncement.objects.filter(
         display_until__lt=date.today() - timedelta(days=RETENTION)
-    )
-    for a in announces:
-        log.info(f"Deleting {a}")
-        a.delete()
+    ), dry_run)
 
 
-def daily_cron(request):
-    write_customer_record()
-    write_volunteer_record()
-    delete_old_customer_record()
-    delete_old_volunteer_record()
-    delete_old_substitutions()
-    delete_old_daterange()
-    delete_old_announcement()
+def delete_report_files(report_jobs):
+    for file_path in report_jobs.exclude(file_path="").values_list("file_path", flat=True):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def delete_old_report_jobs(dry_run=False):
+    return purge(ReportJob.objects.filter(
+        created__lt=timezone.now() - timedelta(days=REPORT_RETENTION)
+    ), dry_run, on_batch=delete_report_files)
+
+
+def materialize_job_occurrences():
+    """
+    Extend the JobOccurrence window of every bonus route so it reaches
+    OCCURRENCE_HORIZON days ahead. Saving a route rebuilds its window when its days
+    change, so only the days past the end of each window are added here.
+    """
+    horizon = date.today() + timedelta(days=OCCURRENCE_HORIZON)
+    routes = Route.objects.exclude(bonusRoute=None).filter(
+        Q(occurrences_end=None) | Q(occurrences_end__lt=horizon))
+    for route in routes:
+        route.extend_occurrences(horizon)
+    log.info("Extended job occurrences")
+
+
+def missed_days(model, since):
+    """
+    Return the days from since up to, but not including, today that have no records of model.
+    """
+    today = date.today()
+    if since is None or since >= today:
+        return []
+    written = set(
+        model.objects.filter(date__gte=since, date__lt=today).values_list("date", flat=True))
+    days = (since + timedelta(days=i) for i in range((today - since).days))
+    return [day for day in days if day not in written]
+
+
+def default_since():
+    """
+    Return the day after the last successful run of the daily cron, at most RETENTION
+    days ago, so a run writes the records of the days the cron missed. Returns None if
+    the cron never succeeded.
+    """
+    last_run = CronRun.objects.filter(succeeded=True).order_by("-started").first()
+    if last_run is None:
+        return None
+    return max(
+        timezone.localdate(last_run.started) + timedelta(days=1),
+        date.today() - timedelta(days=RETENTION))
+
+
+def day_ranges(days):
+    """
+    Group sorted days into [start, end) ranges of consecutive days.
+    """
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return [tuple(r) for r in ranges]
+
+
+def run_stage(cron_run, name, func, *args):
+    """
+    Run one stage of the daily cron and record how long it took on cron_run.
+    """
+    start = time.monotonic()
+    result = func(*args)
+    cron_run.stages[name] = round(time.monotonic() - start, 3)
+    log.info(f"{name} took {cron_run.stages[name]}s")
+    return result
+
+
+@contextmanager
+def advisory_lock(key):
+    """
+    Hold a postgres session advisory lock while in the block. Yields whether it was
+    acquired, without waiting for it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [key])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [key])
+
+
+def run_daily(since=None, dry_run=False):
+    """
+    Run every stage of the daily cron under an advisory lock, so runs never overlap, and
+    record the run as a CronRun. since backfills the records of the days from since up
+    to today that have none, without touching days that were already written, and
+    defaults to the day after the last successful run. dry_run only reports what the
+    retention purge would delete. Returns the CronRun, or None if another run holds the
+    lock.
+    """
+    with advisory_lock(DAILY_CRON_LOCK) as acquired:
+        if not acquired:
+            log.warning("The daily cron is already running")
+            return None
+        if since is None:
+            since = default_since()
+        cron_run = CronRun.objects.create(since=since)
+        try:
+            customer_days = missed_days(CustomerRecord, since)
+            for day in customer_days:
+                run_stage(cron_run, f"write_customer_record {day}", write_customer_record, day)
+            for start, end in day_ranges(customer_days):
+                run_stage(
+                    cron_run, f"write_billing_daily {start} to {end}",
+                    write_billing_daily, start, end)
+            for start, end in day_ranges(missed_days(VolunteerRecord, since)):
+                run_stage(
+                    cron_run, f"write_volunteer_record {start} to {end}",
+                    write_volunteer_record, start, end)
+            run_stage(cron_run, "write_customer_record", write_customer_record)
+            run_stage(cron_run, "write_billing_daily", write_billing_daily)
+            run_stage(cron_run, "write_volunteer_record", write_volunteer_record)
+            run_stage(cron_run, "delete_old_customer_record", delete_old_customer_record, dry_run)
+            run_stage(cron_run, "delete_old_billing_daily", delete_old_billing_daily, dry_run)
+            run_stage(cron_run, "delete_old_volunteer_record", delete_old_volunteer_record, dry_run)
+            run_stage(cron_run, "delete_old_substitutions", delete_old_substitutions, dry_run)
+            run_stage(cron_run, "delete_old_daterange", delete_old_daterange, dry_run)
+            run_stage(cron_run, "delete_old_announcement", delete_old_announcement, dry_run)
+            run_stage(cron_run, "delete_old_report_jobs", delete_old_report_jobs, dry_run)
+            run_stage(cron_run, "materialize_job_occurrences", materialize_job_occurrences)
+            run_stage(cron_run, "roll_actual_slots", roll_actual_slots)
+            cron_run.succeeded = True
+        except Exception as e:
+            cron_run.error = repr(e)
+            raise
+        finally:
+            cron_run.finished = timezone.now()
+            cron_run.save()
     log.info("daily cron successful")
-    return JsonResponse({"status": "ok"})
+    return cron_run
+
+
+def daily_cron(request):
+    """
+    Trigger the daily cron over http by hand. It runs inside the web worker, so the cron
+    container runs manage.py run_daily instead.
+    """
+    cron_run = run_daily()
+    if cron_run is None:
+        return JsonResponse({"status": "already running"}, status=409)
+    return JsonResponse({"status": "ok", "stages": cron_run.stages})
@@ -0,0 +1,234 @@
+"""
+The data the kitchen's daily delivery documents (labels, pet labels, the daily count
+and the route sheets) are built from, gathered once per day so the documents can be
+built together.
+"""
+
+import datetime
+import io
+import time
+import zipfile
+from collections import defaultdict
+from functools import cached_property
+from logging import getLogger
+
+from django.template.loader import get_template
+
+from models.models import Assignment, Customer, DateRange, Diet, Pet, PetFood, Route
+from pdfs.renderer import get_renderer
+
+log = getLogger(__name__)
+
+# Customer wants frozen meals to just always be 25 for some reason.
+FROZEN_MEALS = 25
+
+LABELS_STYLE_SHEET = "/collected-static/pdfs/label_pdf.css"
+ROUTES_STYLE_SHEET = "/collected-static/pdfs/route_all_pdf.css"
+
+
+class DeliveryDay:
+    """
+    The customers, meal counts, diets, pets and route volunteers for one day. Every part
+    is loaded the first time it is used, with a fixed number of queries.
+    """
+
+    def __init__(self, day):
+        self.datetime = datetime.datetime(year=day.year, month=day.month, day=day.day)
+        self.date = self.datetime.date()
+
+    @cached_property
+    def customers(self):
+        """
+        The active customers with their diets and routes, in route order.
+        """
+        return list(
+            Customer.objects.filter(active=True)
+            .select_related("diet", "route", "address")
+            .order_by("route__number", "_order", "pk"))
+
+    @cached_property
+    def meal_counts(self):
+        counts = Customer.meal_counts(self.customers, self.date)
+        return {customer.pk: counts[(customer.pk, self.date)] for customer in self.customers}
+
+    @cached_property
+    def excluded(self):
+        """
+        The pks of the customers with a date range covering the day.
+        """
+        return set(
+            DateRange.objects.filter(
+                start_date__lte=self.date, end_date__gte=self.date).values_list(
+                "customer", flat=True))
+
+    @cached_property
+    def diets(self):
+        return list(Diet.objects.values())
+
+    @cached_property
+    def pets(self):
+        return list(Pet.objects.values())
+
+    @cached_property
+    def petfoods(self):
+        return list(PetFood.objects.values())
+
+    @cached_property
+    def routes(self):
+        return list(Route.objects.all().order_by("number"))
+
+    @cached_property
+    def route_volunteers(self):
+        """
+        A dict of route pk -> the names of the volunteers delivering it, comma separated.
+        """
+        volunteers = defaultdict(list)
+        for actual in Assignment.actuals(self.date, order_by="volunteer"):
+            # records of deleted jobs have no job to deliver
+            if actual.job is not None:
+                volunteers[actual.job.pk].append(str(actual.volunteer))
+        return {route_pk: ", ".join(names) for route_pk, names in volunteers.items()}
+
+    def meal_customers(self):
+        """
+        The customers on a route who receive meals on the day, with num_meals set.
+        """
+        customers = []
+        for customer in self.customers:
+            customer.num_meals = self.meal_counts[customer.pk]
+            if customer.route_id is not None and customer.num_meals:
+                customers.append(customer)
+        return customers
+
+
+def group_by_route(routes, customers):
+    """
+    Pair each route with its customers, in route order. customers must already be in
+    route order; routes without customers get an empty list.
+    """
+    by_route = defaultdict(list)
+    for customer in customers:
+        by_route[customer.route_id].append(customer)
+    return [(route, by_route[route.pk]) for route in routes]
+
+
+def labels_context(day):
+    customers = sorted(
+        day.meal_customers(), key=lambda c: (c.route.number, c.last_name))
+    return {
+        "cust_query": customers,
+        "diet_query": day.diets,
+        "date": day.datetime,
+    }
+
+
+def pet_labels_context(day):
+    customers = [
+        c for c in day.customers if c.route_id is not None and c.pk not in day.excluded]
+    return {
+        "cust_query": customers,
+        "pet_query": day.pets,
+        "petfood_query": day.petfoods,
+    }
+
+
+def daily_count_context(day):
+    diets = defaultdict(int)
+    total = 0
+    no_diet = 0
+    for customer in day.customers:
+        num_meals = day.meal_counts[customer.pk]
+        total += num_meals
+        if customer.diet is not None:
+            diets[(customer.diet, customer.diet.code)] += num_meals
+        else:
+            no_diet += num_meals
+            log.info(f"Customer {customer} has no diet.")
+    total += FROZEN_MEALS
+
+    return {
+        "diets": sorted(
+            ((diet, code, count) for (diet, code), count in diets.items()),
+            key=lambda row: row[0].name),
+        "date": day.datetime,
+        "day_of_week": day.datetime.strftime("%A"),
+        "today": datetime.datetime.now(),
+        "total": total,
+        "frozen": FROZEN_MEALS,
+        "no_diet": no_diet,
+    }
+
+
+def routes_context(day):
+    data = []
+    for route, route_customers in group_by_route(day.routes, day.meal_customers()):
+        data.append({
+            "route": route,
+            "customer_list": route_customers,
+            "total_meals": sum(c.num_meals for c in route_customers),
+            "date": day.date,
+            "vols": day.route_volunteers.get(route.pk, ""),
+        })
+    return {"data": data}
+
+
+# the documents of the morning packet, in print order:
+# (name, template, context builder, style sheet)
+MORNING_PACKET = [
+    ("labels", "pdfs/label_pdf.html", labels_context, LABELS_STYLE_SHEET),
+    ("pet-labels", "pdfs/label-pet-pdf.html", pet_labels_context, LABELS_STYLE_SHEET),
+    ("daily-count", "pdfs/daily-count-report.html", daily_count_context, None),
+    ("routes", "pdfs/generate-routes-report.html", routes_context, ROUTES_STYLE_SHEET),
+]
+
+
+def morning_packet(day, merged=True):
+    """
+    Build every document of MORNING_PACKET for day from one DeliveryDay. Returns
+    (content, content_type, timings): one merged pdf, or a zip of one pdf per document,
+    and how many seconds each stage took.
+    """
+    timings = {}
+
+    def timed(stage, func, *args):
+        start = time.monotonic()
+        result = func(*args)
+        timings[stage] = round(time.monotonic() - start, 3)
+        return result
+
+    day = DeliveryDay(day)
+    for part in ("customers", "meal_counts", "excluded", "diets", "pets", "petfoods",
+                 "routes", "route_volunteers"):
+        timed(f"load {part}", getattr, day, part)
+    pages = [
+        (name, timed(f"build {name}", lambda: get_template(template).render(context(day))),
+         style_sheet)
+        for name, template, context, style_sheet in MORNING_PACKET
+    ]
+
+    renderer = get_renderer()
+    if merged:
+        content = timed(
+            "render", lambda: renderer.submit_pages(
+                [(html, style_sheet) for _, html, style_sheet in pages],
+                "morning-packet").result())
+        content_type = "application/pdf"
+    else:
+        def render_zip():
+            # the documents are queued together so they render in parallel
+            futures = [
+                (name, renderer.submit(html, f"morning-packet {name}", style_sheet))
+                for name, html, style_sheet in pages
+            ]
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w") as packet:
+                for name, future in futures:
+                    packet.writestr(f"{name}-{day.date.isoformat()}.pdf", future.result())
+            return buffer.getvalue()
+        content = timed("render", render_zip)
+        content_type = "application/zip"
+
+    log.info(
+        f"Morning packet for {day.date}: "
+        + ", ".join(f"{stage} {seconds}s" for stage, seconds in timings.items()))
+    return content, content_type, timings
@@ -0,0 +1,104 @@
+import os
+import time
+from logging import getLogger
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import HttpRequest
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from models.models import ReportJob
+
+log = getLogger(__name__)
+
+REPORT_EXTENSIONS = {
+    "application/pdf": "pdf",
+    "text/csv": "csv",
+}
+
+
+def enqueue_report(report_type, args, user=None):
+    """
+    Queue the pdfs:<report_type> report with its url args to be generated by the report
+    worker. Raises NoReverseMatch if there is no such report.
+    """
+    reverse(f"pdfs:{report_type}", args=args)
+    job = ReportJob.objects.create(report_type=report_type, args=list(args), requested_by=user)
+    log.info(f"Queued report job {job}")
+    return job
+
+
+def claim_report_job():
+    """
+    Mark the oldest queued job as running and return it, or None if the queue is empty.
+    Workers skip the rows other workers have locked, so a job is only claimed once.
+    """
+    with transaction.atomic():
+        job = (
+            ReportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ReportJob.QUEUED)
+            .order_by("created")
+            .first()
+        )
+        if job is not None:
+            job.status = ReportJob.RUNNING
+            job.started = timezone.now()
+            job.save(update_fields=["status", "started"])
+    return job
+
+
+def run_report_job(job):
+    """
+    Generate the report of a claimed job by calling its view as the staff member who
+    requested it, and store the response on disk under REPORT_ROOT.
+    """
+    try:
+        user = job.requested_by
+        if user is None or not (user.is_active and user.is_staff):
+            raise PermissionDenied("Reports can only be generated for staff")
+        match = resolve(reverse(f"pdfs:{job.report_type}", args=job.args))
+        request = HttpRequest()
+        request.method = "GET"
+        request.user = user
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            raise ValueError(f"The report responded with status {response.status_code}")
+        content_type = response["Content-Type"].split(";")[0]
+        extension = REPORT_EXTENSIONS.get(content_type, "html")
+
+        os.makedirs(settings.REPORT_ROOT, exist_ok=True)
+        job.file_path = os.path.join(
+            settings.REPORT_ROOT, f"{job.pk}-{job.report_type}.{extension}")
+        with open(job.file_path, "wb") as f:
+            # streamed reports are written as they are generated
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    f.write(chunk)
+            else:
+                f.write(response.content)
+        job.content_type = content_type
+        job.status = ReportJob.DONE
+    except Exception as e:
+        log.exception(f"Report job {job} failed")
+        job.status = ReportJob.FAILED
+        job.error = repr(e)
+    job.finished = timezone.now()
+    job.save()
+    log.info(f"Report job {job} finished in {(job.finished - job.started).total_seconds():.2f}s")
+    return job
+
+
+def work(poll_interval=1, once=False):
+    """
+    Run queued report jobs until stopped. once stops as soon as the queue is empty.
+    """
+    while True:
+        job = claim_report_job()
+        if job is not None:
+            run_report_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
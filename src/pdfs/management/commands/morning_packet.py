@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from pdfs.delivery import morning_packet
+
+
+class Command(BaseCommand):
+    """
+     - run with python3 manage.py morning_packet
+     - or python3 manage.py morning_packet 2020-03-25 --zip --output packet.zip
+    """
+
+    help = "Build the labels, pet labels, daily count and route sheets for a day"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "date",
+            nargs="?",
+            type=date.fromisoformat,
+            default=None,
+            help="day (YYYY-MM-DD) to build the packet for, defaults to today",
+        )
+        parser.add_argument(
+            "--zip",
+            action="store_true",
+            default=False,
+            help="write a zip of one pdf per document instead of one merged pdf",
+        )
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="file to write, defaults to morning-packet-<date>.pdf or .zip",
+        )
+
+    def handle(self, *args, **kwargs):
+        day = kwargs["date"] or date.today()
+        content, _, timings = morning_packet(day, merged=not kwargs["zip"])
+        output = kwargs["output"] or (
+            f"morning-packet-{day.isoformat()}.{'zip' if kwargs['zip'] else 'pdf'}")
+        with open(output, "wb") as f:
+            f.write(content)
+        for stage, seconds in timings.items():
+            self.stdout.write(f"{stage}: {seconds}s")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
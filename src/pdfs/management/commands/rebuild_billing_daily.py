@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+
+from models.models import BillingDaily, CustomerRecord
+
+
+class Command(BaseCommand):
+    """
+     - run with python3 manage.py rebuild_billing_daily
+     - or python3 manage.py rebuild_billing_daily --since 2020-01-01 --until 2020-02-01
+    """
+
+    help = "Rebuild the BillingDaily rollup from the CustomerRecords"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            default=None,
+            help="first day (YYYY-MM-DD) to rebuild, by default the oldest CustomerRecord",
+        )
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            default=None,
+            help="day (YYYY-MM-DD) to stop before, by default tomorrow",
+        )
+
+    def handle(self, *args, **kwargs):
+        # days older than the oldest record have been purged with their rollup
+        since = kwargs["since"] or CustomerRecord.objects.aggregate(
+            Min("date"))["date__min"]
+        until = kwargs["until"] or date.today() + timedelta(days=1)
+        if since is None:
+            self.stdout.write("There are no CustomerRecords to roll up")
+            return
+        count = BillingDaily.rollup(since, until)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {count} BillingDaily rows from {since} to {until}"))
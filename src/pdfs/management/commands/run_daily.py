@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from pdfs.cron import run_daily
+
+
+class Command(BaseCommand):
+    """
+     - run with python3 manage.py run_daily
+     - or python3 manage.py run_daily --since 2020-01-01 to write the records of missed days
+       from a given day, by default they are written from the last successful run on
+    """
+
+    help = "Run the daily cron: write today's records, purge old rows and roll the schedule"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            default=None,
+            help="first day (YYYY-MM-DD) to write records for if the cron missed it, "
+            "by default the day after the last successful run",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="only count the rows the retention purge would delete",
+        )
+
+    def handle(self, *args, **kwargs):
+        cron_run = run_daily(since=kwargs["since"], dry_run=kwargs["dry_run"])
+        if cron_run is None:
+            self.stderr.write(self.style.ERROR("The daily cron is already running"))
+            return
+        for stage, seconds in cron_run.stages.items():
+            self.stdout.write(f"{stage}: {seconds}s")
+        self.stdout.write(self.style.SUCCESS("Daily cron successful"))
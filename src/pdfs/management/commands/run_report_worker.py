@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from pdfs.jobs import work
+
+
+class Command(BaseCommand):
+    """
+     - run with python3 manage.py run_report_worker
+     - or python3 manage.py run_report_worker --once to drain the queue and exit
+    """
+
+    help = "Generate the queued report jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1,
+            help="seconds to wait before checking an empty queue again",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            default=False,
+            help="exit once the queue is empty",
+        )
+
+    def handle(self, *args, **kwargs):
+        work(poll_interval=kwargs["poll_interval"], once=kwargs["once"])
+        self.stdout.write(self.style.SUCCESS("Report queue is empty"))
@@ -0,0 +1,170 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+import pdfkit
+from pyvirtualdisplay import Display
+
+from meals.constants import PDF_RENDER_TIMEOUT, PDF_RENDER_WORKERS
+
+log = getLogger(__name__)
+
+PDF_OPTIONS = {
+    "page-size": "Letter",
+    "margin-top": "0.74in",
+    "margin-right": "0.39in",
+    "margin-bottom": "0.39in",
+    "margin-left": "0.39in",
+}
+
+
+class RenderError(Exception):
+    pass
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+class PDFRenderer:
+    """
+    Renders html to pdf with wkhtmltopdf. Jobs are queued on a fixed pool of workers, so at
+    most `workers` renders run at once in a process, and each render is killed after
+    `timeout` seconds. The virtual display is started once and shared by every render, and
+    the queue and render times are kept per report type.
+    """
+
+    def __init__(self, workers=PDF_RENDER_WORKERS, timeout=PDF_RENDER_TIMEOUT):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pdf-render")
+        self._display = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _start_display(self):
+        with self._lock:
+            if self._display is None:
+                self._display = Display(visible=0, size=(320, 240)).start()
+
+    def _command(self, pages):
+        """
+        Build the wkhtmltopdf command that renders pages, a list of (source, style sheet),
+        into one pdf on stdout. A source of "-" is read from stdin.
+        """
+        args = [pdfkit.configuration().wkhtmltopdf, "--quiet"]
+        for option, value in PDF_OPTIONS.items():
+            args += [f"--{option}", value]
+        for source, style_sheet in pages:
+            args += [source, "--print-media-type"]
+            if style_sheet:
+                args += ["--user-style-sheet", style_sheet]
+        return args + ["-"]
+
+    def _render(self, pages, report, queued):
+        started = time.monotonic()
+        self._start_display()
+        with tempfile.TemporaryDirectory() as directory:
+            if len(pages) == 1:
+                (html, style_sheet), = pages
+                sources = [("-", style_sheet)]
+                html_input = html.encode("utf-8")
+            else:
+                sources = []
+                for i, (html, style_sheet) in enumerate(pages):
+                    path = os.path.join(directory, f"{i}.html")
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(html)
+                    sources.append((path, style_sheet))
+                html_input = b""
+            try:
+                result = subprocess.run(
+                    self._command(sources),
+                    input=html_input,
+                    capture_output=True,
+                    timeout=self.timeout,
+                )
+            except subprocess.TimeoutExpired:
+                self._record(report, started - queued, time.monotonic() - started, failed=True)
+                raise RenderTimeout(f"Rendering {report} took longer than {self.timeout}s")
+        finished = time.monotonic()
+        # like pdfkit, missing resources only warn as long as a pdf comes out
+        failed = not result.stdout.startswith(b"%PDF")
+        self._record(report, started - queued, finished - started, failed=failed)
+        if failed:
+            raise RenderError(
+                f"wkhtmltopdf failed rendering {report}: "
+                f"{result.stderr.decode('utf-8', errors='replace')}")
+        if result.returncode != 0:
+            log.warning(
+                f"wkhtmltopdf warned rendering {report}: "
+                f"{result.stderr.decode('utf-8', errors='replace')}")
+        return result.stdout
+
+    def _record(self, report, waited, rendered, failed=False):
+        with self._lock:
+            stats = self._stats.setdefault(
+                report, {"renders": 0, "failures": 0, "wait": 0.0, "render": 0.0, "max": 0.0})
+            stats["renders"] += 1
+            stats["failures"] += failed
+            stats["wait"] += waited
+            stats["render"] += rendered
+            stats["max"] = max(stats["max"], rendered)
+        log.info(
+            f"Rendered {report} in {rendered:.2f}s after {waited:.2f}s in the queue"
+            + (" (failed)" if failed else ""))
+
+    def submit(self, html, report="report", style_sheet=None):
+        """
+        Queue html to be rendered and return a Future of the pdf bytes.
+        """
+        return self.submit_pages([(html, style_sheet)], report)
+
+    def submit_pages(self, pages, report="report"):
+        """
+        Queue pages, a list of (html, style sheet), to be rendered into one pdf, each with
+        its own style sheet, and return a Future of the pdf bytes.
+        """
+        return self._executor.submit(self._render, list(pages), report, time.monotonic())
+
+    def render(self, html, report="report", style_sheet=None):
+        """
+        Render html to pdf bytes, waiting for a free worker if they are all busy.
+        """
+        return self.submit(html, report, style_sheet).result()
+
+    def stats(self):
+        """
+        Return a dict of report type -> renders, failures and the average wait, average
+        render and longest render in seconds.
+        """
+        with self._lock:
+            return {
+                report: {
+                    "renders": stats["renders"],
+                    "failures": stats["failures"],
+                    "average_wait": stats["wait"] / stats["renders"],
+                    "average_render": stats["render"] / stats["renders"],
+                    "max_render": stats["max"],
+                }
+                for report, stats in self._stats.items()
+            }
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """
+    Return the process's PDFRenderer, starting it on first use.
+    """
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = PDFRenderer()
+        return _renderer
@@ -0,0 +1,131 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from datetime import date
+from logging import getLogger
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from meals.constants import REPORT_CACHE_MAX_BYTES
+from models.models import data_version
+
+log = getLogger(__name__)
+
+
+class ReportCache:
+    """
+    Generated reports on the local filesystem, keyed by a hash of the report type, its
+    parameters and the data version of the tables it reads. Reading an entry marks it as
+    recently used, and the least recently used entries are evicted once the cache grows
+    past max_bytes. Hits and misses are counted per report type.
+    """
+
+    def __init__(self, root, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    @staticmethod
+    def key(report_type, params, version):
+        return hashlib.sha256(
+            json.dumps([report_type, params, version], default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def _count(self, report_type, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(report_type, {"hits": 0, "misses": 0})
+            counters[outcome] += 1
+
+    def get(self, report_type, key):
+        """
+        Return the (content_type, content) of an entry, or None if it is not cached.
+        """
+        try:
+            with open(self._path(key), "rb") as f:
+                content_type, content = f.read().split(b"\n", 1)
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            self._count(report_type, "misses")
+            return None
+        self._count(report_type, "hits")
+        return content_type.decode(), content
+
+    def put(self, key, content_type, content):
+        """
+        Store an entry, then evict the least recently used entries over max_bytes. The
+        cache is only an optimization, so failing to write it is logged and ignored.
+        """
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            partial = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.partial"
+            with open(partial, "wb") as f:
+                f.write(content_type.encode() + b"\n" + content)
+            os.replace(partial, self._path(key))
+            self.evict()
+        except OSError:
+            log.warning("Could not write to the report cache", exc_info=True)
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith(".partial"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def counters(self):
+        """
+        Return a dict of report type -> hits and misses in this process.
+        """
+        with self._lock:
+            return {report_type: dict(c) for report_type, c in self._counters.items()}
+
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache(settings.REPORT_CACHE_ROOT)
+        return _report_cache
+
+
+def cached_report(report_type, *model_classes):
+    """
+    Serve a report view from the report cache. The entry is keyed by the view's arguments,
+    today's date and the data version of model_classes, the tables the report reads, so
+    saving or deleting any of their rows regenerates the report.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cache = get_report_cache()
+            key = cache.key(
+                report_type, [args, kwargs, date.today()], data_version(*model_classes))
+            entry = cache.get(report_type, key)
+            if entry is not None:
+                content_type, content = entry
+                return HttpResponse(content, content_type=content_type)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.put(key, response["Content-Type"], response.content)
+            return response
+        return wrapper
+    return decorator
@@ -1,33 +1,55 @@
+import collections
 import datetime
+import io
+import os
+import tempfile
 from unittest import SkipTest
 
 # https://docs.python.org/3/library/unittest.mock.html
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.http import FileResponse
 from django.test import Client, TestCase
 from django.urls import reverse
+from django.utils import timezone
 from freezegun import freeze_time
 from recurrence import serialize
 
 from interfaces.recurrence import FR, MO, TH, TU, WE, WEEKLY, Recurrence, Rule
-from meals.constants import RETENTION
+from meals.constants import OCCURRENCE_HORIZON, REPORT_RETENTION, RETENTION
+from pdfs.cron import (
+    delete_old_customer_record,
+    delete_old_report_jobs,
+    delete_old_substitutions,
+    materialize_job_occurrences,
+    purge,
+    write_customer_record,
+    write_volunteer_record,
+)
 from models.models import (
     Actual,
+    ActualSlot,
     Assignment,
+    BillingDaily,
+    CronRun,
     Customer,
     CustomerRecord,
     DateRange,
     Job,
+    JobOccurrence,
     JobType,
     ManagerAnnouncement,
     Payment,
+    ReportJob,
     Route,
     Substitution,
     User,
     Volunteer,
     VolunteerRecord,
+    bump_data_version,
+    data_version,
 )
 
 
@@ -85,9 +107,9 @@ class TestCronCustomerRecord(TestCase):
         )
 
     @freeze_time("2020-1-8")
-    @patch("pdfs.cron.Customer.num_meals_on_day")
-    def test_week_day(self, mocked_num_meals_on_day):
-        mocked_num_meals_on_day.return_value = 1
+    @patch("pdfs.cron.Customer.meal_counts")
+    def test_week_day(self, mocked_meal_counts):
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 1)
         response = self.client.get(reverse("cron_daily"))
         self.assertEqual(response.status_code, 200)
         CustomerRecord.objects.get(
@@ -99,9 +121,9 @@ class TestCronCustomerRecord(TestCase):
         )
 
     @freeze_time("2020-1-8")
-    @patch("pdfs.cron.Customer.num_meals_on_day")
-    def test_week_day_doesnt_receive(self, mocked_num_meals_on_day):
-        mocked_num_meals_on_day.return_value = 0
+    @patch("pdfs.cron.Customer.meal_counts")
+    def test_week_day_doesnt_receive(self, mocked_meal_counts):
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 0)
         response = self.client.get(reverse("cron_daily"))
         self.assertEqual(response.status_code, 200)
         with self.assertRaises(CustomerRecord.DoesNotExist):
@@ -113,9 +135,9 @@ class TestCronCustomerRecord(TestCase):
             )
 
     @freeze_time("2020-1-10")
-    @patch("pdfs.cron.Customer.num_meals_on_day")
-    def test_friday(self, mocked_num_meals_on_day):
-        mocked_num_meals_on_day.return_value = 3
+    @patch("pdfs.cron.Customer.meal_counts")
+    def test_friday(self, mocked_meal_counts):
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 3)
         response = self.client.get(reverse("cron_daily"))
         self.assertEqual(response.status_code, 200)
         CustomerRecord.objects.get(
@@ -127,11 +149,11 @@ class TestCronCustomerRecord(TestCase):
         )
 
     @freeze_time("2020-1-11")
-    @patch("pdfs.cron.Customer.num_meals_on_day")
-    def test_weekend(self, mocked_num_meals_on_day):
+    @patch("pdfs.cron.Customer.meal_counts")
+    def test_weekend(self, mocked_meal_counts):
         raise SkipTest  # TODO move to test_num_meals_on_day in models project
 
-        mocked_num_meals_on_day.return_value = True
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: True)
         response = self.client.get(reverse("cron_daily"))
         self.assertEqual(response.status_code, 200)
         with self.assertRaises(CustomerRecord.DoesNotExist):
@@ -144,9 +166,9 @@ class TestCronCustomerRecord(TestCase):
             )
 
     @freeze_time("2020-1-8")
-    @patch("pdfs.cron.Customer.num_meals_on_day")
-    def test_successive_no_change(self, mocked_num_meals_on_day):
-        mocked_num_meals_on_day.return_value = 1
+    @patch("pdfs.cron.Customer.meal_counts")
+    def test_successive_no_change(self, mocked_meal_counts):
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 1)
         response = self.client.get(reverse("cron_daily"))
         self.assertEqual(response.status_code, 200)
         CustomerRecord.objects.get(
@@ -167,11 +189,11 @@ class TestCronCustomerRecord(TestCase):
         )
 
     @freeze_time("2020-1-8")
-    @patch("pdfs.cron.Customer.num_meals_on_day")
+    @patch("pdfs.cron.Customer.meal_counts")
     @patch("interfaces.address_lookup.validate",
            lambda *a, **k: {"lat": None, "lng": None})
-    def test_successive_with_change(self, mocked_num_meals_on_day):
-        mocked_num_meals_on_day.return_value = 1
+    def test_successive_with_change(self, mocked_meal_counts):
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 1)
         response = self.client.get(reverse("cron_daily"))
         self.assertEqual(response.status_code, 200)
         CustomerRecord.objects.get(
@@ -202,6 +224,30 @@ class TestCronCustomerRecord(TestCase):
                 route_assigned=self.route,
             )
 
+    @freeze_time("2020-1-8")
+    @patch("pdfs.cron.Customer.meal_counts")
+    def test_counts(self, mocked_meal_counts):
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 1)
+        # the table has a version row already, so the bump is a single update
+        bump_data_version(CustomerRecord)
+        version = data_version(CustomerRecord)
+        with self.assertNumQueries(4):
+            counts = write_customer_record()
+        self.assertEqual(counts, {"created": 1, "updated": 0, "deleted": 0})
+        self.assertNotEqual(data_version(CustomerRecord), version)
+        version = data_version(CustomerRecord)
+        self.assertEqual(
+            write_customer_record(), {"created": 0, "updated": 0, "deleted": 0})
+        self.assertEqual(data_version(CustomerRecord), version)
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 3)
+        self.assertEqual(
+            write_customer_record(), {"created": 0, "updated": 1, "deleted": 0})
+        self.assertEqual(CustomerRecord.objects.get(customer=self.customer).num_meals, 3)
+        mocked_meal_counts.return_value = collections.defaultdict(lambda: 0)
+        self.assertEqual(
+            write_customer_record(), {"created": 0, "updated": 0, "deleted": 1})
+        self.assertFalse(CustomerRecord.objects.exists())
+
 
 @freeze_time("2020-03-18")
 @patch("models.models.Assignment.actuals")
@@ -426,6 +472,43 @@ class TestCronVolunteerRecord(TestCase):
             self.assertEqual(records, all_today)
 
 
+    def test_range_counts(self, mocked_actuals):
+        today = datetime.date.today()
+        yesterday = today - datetime.timedelta(days=1)
+        mocked_actuals.return_value = (
+            Actual(
+                volunteer=self.vols[0],
+                job=self.jobs[0],
+                date=yesterday,
+                original=self.vols[0],
+                is_substitution=False,
+            ),
+            Actual(
+                volunteer=self.vols[1],
+                job=self.jobs[1],
+                date=today,
+                original=self.vols[1],
+                is_substitution=False,
+            ),
+        )
+        bump_data_version(VolunteerRecord)
+        # one read, one delete, one insert and one data version bump for the whole range
+        with self.assertNumQueries(4):
+            self.assertEqual(
+                write_volunteer_record(yesterday, today + datetime.timedelta(days=1)),
+                {"created": 2, "deleted": 1})
+        self.assertEqual(
+            set(VolunteerRecord.objects.values_list("date", "volunteer", "job", "original")),
+            {
+                (yesterday, self.vols[0].pk, self.jobs[0].pk, self.vols[0].pk),
+                (today, self.vols[1].pk, self.jobs[1].pk, self.vols[1].pk),
+            },
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                write_volunteer_record(yesterday, today + datetime.timedelta(days=1)),
+                {"created": 0, "deleted": 0})
+
 class TestCronDeletions(TestCase):
     __author__ = "Josh Santana"
 
@@ -610,6 +693,82 @@ class TestCronDeletions(TestCase):
                 1),
         )
 
+    @freeze_time("2020-03-15")
+    def test_purge_substitutions(self):
+        """
+        old substitutions are deleted a batch at a time without per-row signals,
+        their slots go with them and the table version is bumped once
+        """
+        for day in range(1, 21):
+            sub = Substitution.objects.create(
+                volunteer=None,
+                assignment=self.assignment,
+                date=datetime.date(year=2019, month=3, day=day),
+            )
+            ActualSlot.objects.create(
+                date=sub.date, job=self.job, is_substitution=True, substitution=sub)
+        version = data_version(Substitution)
+        # select, savepoint, slots, substitutions, release, the empty select and the bump
+        with self.assertNumQueries(7):
+            self.assertEqual(delete_old_substitutions(), 20)
+        self.assertFalse(Substitution.objects.exists())
+        self.assertFalse(ActualSlot.objects.filter(substitution__isnull=False).exists())
+        self.assertNotEqual(data_version(Substitution), version)
+
+    @freeze_time("2020-03-15")
+    def test_purge_customer_records(self):
+        """
+        purging old customer records bumps the table version for the cached reports
+        """
+        CustomerRecord.objects.create(
+            customer=self.customer,
+            date=datetime.date(year=2019, month=3, day=15),
+            num_meals=1,
+            payment_type=self.payment,
+            route_assigned=self.route,
+        )
+        version = data_version(CustomerRecord)
+        self.assertEqual(delete_old_customer_record(dry_run=True), 1)
+        self.assertEqual(data_version(CustomerRecord), version)
+        self.assertEqual(delete_old_customer_record(), 1)
+        self.assertFalse(CustomerRecord.objects.exists())
+        self.assertNotEqual(data_version(CustomerRecord), version)
+
+    @freeze_time("2020-03-15")
+    def test_billing_daily(self):
+        """
+        the billing rollup is purged with the customer records it sums
+        """
+        old = BillingDaily.objects.create(
+            date=datetime.date.today() - datetime.timedelta(days=RETENTION + 1),
+            payment_type=self.payment, route=self.route, num_meals=1)
+        kept = BillingDaily.objects.create(
+            date=datetime.date.today() - datetime.timedelta(days=RETENTION - 1),
+            payment_type=self.payment, route=self.route, num_meals=1)
+        response = self.client.get(reverse("cron_daily"))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(BillingDaily.objects.filter(pk=old.pk).exists())
+        self.assertTrue(BillingDaily.objects.filter(pk=kept.pk).exists())
+
+    def test_purge_report_jobs(self):
+        """
+        old report jobs are purged with their files
+        """
+        report_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(report_dir.cleanup)
+        old_path = os.path.join(report_dir.name, "old.pdf")
+        new_path = os.path.join(report_dir.name, "new.pdf")
+        for path in (old_path, new_path):
+            open(path, "w").close()
+        ReportJob.objects.create(
+            report_type="labels", file_path=old_path,
+            created=timezone.now() - datetime.timedelta(days=REPORT_RETENTION + 1))
+        ReportJob.objects.create(report_type="labels", file_path=new_path)
+        self.assertEqual(delete_old_report_jobs(), 1)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(new_path))
+        self.assertEqual(ReportJob.objects.get().file_path, new_path)
+
     @freeze_time("2020-03-15")
     def test_daterange(self):
         # one to delete
@@ -691,3 +850,166 @@ class TestCronDeletions(TestCase):
                 1),
             announcement="HELLO",
         )
+
+    @freeze_time("2020-03-15")
+    def test_purge_batches(self):
+        for day in range(1, 6):
+            CustomerRecord.objects.create(
+                customer=None,
+                date=datetime.date(year=2019, month=3, day=day),
+                num_meals=1,
+            )
+        CustomerRecord.objects.create(
+            customer=self.customer,
+            date=datetime.date.today(),
+            num_meals=1,
+        )
+        old_records = CustomerRecord.objects.filter(
+            date__lt=datetime.date.today() - datetime.timedelta(days=RETENTION))
+
+        # dry run only counts
+        self.assertEqual(purge(old_records, dry_run=True), 5)
+        self.assertEqual(CustomerRecord.objects.count(), 6)
+
+        # three batches of at most two, each with its own transaction
+        with self.assertNumQueries(3 * 4 + 1):
+            self.assertEqual(purge(old_records, batch_size=2), 5)
+        self.assertEqual(CustomerRecord.objects.count(), 1)
+
+
+class TestRunDaily(TestCase):
+
+    @patch("interfaces.address_lookup.validate",
+           lambda *a, **k: {"lat": None, "lng": None})
+    def setUp(self):
+        self.payment = Payment.objects.create(name="testpayment")
+        self.route = Route.objects.create(
+            description="testroute desc",
+            number="1",
+            job_type=JobType.objects.create(name="test_type"),
+        )
+        self.customer = Customer.objects.create(
+            route=self.route,
+            pays=self.payment,
+            active=True,
+            first_name="test",
+            last_name="customer",
+            address="555 Main St.",
+            meal_recurrence=serialize(
+                Recurrence(Rule(freq=WEEKLY, byday=(MO, TU, WE, TH, FR)))
+            ),
+        )
+
+    @freeze_time("2020-1-10")
+    def test_records_run(self):
+        call_command("run_daily", stdout=io.StringIO())
+        cron_run = CronRun.objects.get()
+        self.assertTrue(cron_run.succeeded)
+        self.assertIsNotNone(cron_run.finished)
+        self.assertIn("write_customer_record", cron_run.stages)
+        self.assertIn("roll_actual_slots", cron_run.stages)
+
+    @freeze_time("2020-1-10")
+    def test_since(self):
+        CustomerRecord.objects.create(
+            customer=None,
+            date=datetime.date(year=2020, month=1, day=8),
+            num_meals=5,
+        )
+        call_command("run_daily", "--since", "2020-01-07", stdout=io.StringIO())
+        self.assertEqual(
+            set(CustomerRecord.objects.filter(customer=self.customer)
+                .values_list("date", flat=True)),
+            {datetime.date(year=2020, month=1, day=day) for day in (7, 9, 10)},
+        )
+        # a day that already has records is left alone
+        self.assertEqual(
+            CustomerRecord.objects.get(date=datetime.date(year=2020, month=1, day=8)).num_meals, 5)
+
+        # running it again changes nothing
+        records = set(CustomerRecord.objects.values_list("customer", "date", "num_meals"))
+        call_command("run_daily", "--since", "2020-01-07", stdout=io.StringIO())
+        self.assertEqual(
+            set(CustomerRecord.objects.values_list("customer", "date", "num_meals")), records)
+        self.assertEqual(CronRun.objects.filter(succeeded=True).count(), 2)
+
+    def test_default_since(self):
+        def customer_days():
+            return set(CustomerRecord.objects.filter(customer=self.customer)
+                       .values_list("date", flat=True))
+
+        # the first run has nothing to catch up
+        with freeze_time("2020-1-6 12:00"):
+            call_command("run_daily", stdout=io.StringIO())
+        self.assertEqual(customer_days(), {datetime.date(2020, 1, 6)})
+        # a later run writes the days since the last successful one
+        with freeze_time("2020-1-10 12:00"):
+            call_command("run_daily", stdout=io.StringIO())
+        self.assertEqual(
+            customer_days(),
+            {datetime.date(year=2020, month=1, day=day) for day in range(6, 11)})
+        self.assertEqual(CronRun.objects.first().since, datetime.date(2020, 1, 7))
+        # a failed run is not a successful one
+        CronRun.objects.filter(since=datetime.date(2020, 1, 7)).update(succeeded=False)
+        CustomerRecord.objects.filter(date=datetime.date(2020, 1, 8)).delete()
+        with freeze_time("2020-1-10 13:00"):
+            call_command("run_daily", stdout=io.StringIO())
+        self.assertIn(datetime.date(2020, 1, 8), customer_days())
+
+    @freeze_time("2020-1-10")
+    def test_billing_daily(self):
+        CustomerRecord.objects.create(
+            customer=None,
+            date=datetime.date(year=2020, month=1, day=8),
+            num_meals=5,
+        )
+
+        def totals(records):
+            sums = collections.Counter()
+            for day, payment, route, meals in records.all():
+                sums[(day, payment, route)] += meals
+            return sums
+
+        call_command("run_daily", "--since", "2020-01-07", stdout=io.StringIO())
+        records = CustomerRecord.objects.values_list(
+            "date", "payment_type", "route_assigned", "num_meals")
+        billing = BillingDaily.objects.values_list("date", "payment_type", "route", "num_meals")
+        # the days the cron wrote are rolled up, the day that already had records is not
+        self.assertEqual(
+            totals(billing), totals(records.exclude(date=datetime.date(2020, 1, 8))))
+
+        call_command("rebuild_billing_daily", stdout=io.StringIO())
+        self.assertEqual(totals(billing), totals(records))
+        self.assertEqual(BillingDaily.objects.count(), 4)
+
+        # a rebuild only replaces the days it covers
+        CustomerRecord.objects.filter(date=datetime.date(2020, 1, 10)).delete()
+        call_command(
+            "rebuild_billing_daily", "--since", "2020-01-10", stdout=io.StringIO())
+        self.assertEqual(totals(billing), totals(records))
+        self.assertEqual(BillingDaily.objects.count(), 3)
+
+    def test_materialize_job_occurrences(self):
+        bonus = Route.objects.create(
+            name="bonus",
+            number=2,
+            job_type=self.route.job_type,
+            bonusRoute=self.route,
+            recurrence=Recurrence(rrules=[Rule(freq=WEEKLY, byday=(FR,))]),
+        )
+        first = JobOccurrence.objects.filter(job=bonus).first()
+        self.assertIsNone(Route.objects.get(pk=self.route.pk).occurrences_end)
+        with freeze_time(datetime.date.today() + datetime.timedelta(days=14)):
+            materialize_job_occurrences()
+            horizon = datetime.date.today() + datetime.timedelta(days=OCCURRENCE_HORIZON)
+        # the window is extended, not rebuilt, and routes that aren't bonus routes are skipped
+        self.assertEqual(Route.objects.get(pk=bonus.pk).occurrences_end, horizon)
+        self.assertTrue(JobOccurrence.objects.filter(pk=first.pk).exists())
+        today = datetime.date.today()
+        fridays = [today + datetime.timedelta(days=i)
+                   for i in range((horizon - today).days)
+                   if (today + datetime.timedelta(days=i)).weekday() == 4]
+        self.assertEqual(
+            list(JobOccurrence.objects.filter(job=bonus).order_by("date")
+                 .values_list("date", flat=True)), fridays)
+        self.assertIsNone(Route.objects.get(pk=self.route.pk).occurrences_end)
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from pdfs.renderer import PDFRenderer, RenderError, RenderTimeout
+
+
+@patch("pdfs.renderer.PDFRenderer._start_display", lambda self: None)
+class TestPDFRenderer(SimpleTestCase):
+
+    def test_render(self):
+        renderer = PDFRenderer(workers=2, timeout=5)
+        with patch.object(PDFRenderer, "_command", lambda self, pages: ["cat"]):
+            futures = [renderer.submit(f"%PDF {i}", "labels") for i in range(4)]
+            self.assertEqual(
+                [future.result() for future in futures],
+                [f"%PDF {i}".encode() for i in range(4)])
+        stats = renderer.stats()
+        self.assertEqual(list(stats), ["labels"])
+        self.assertEqual(stats["labels"]["renders"], 4)
+        self.assertEqual(stats["labels"]["failures"], 0)
+
+    def test_failure(self):
+        renderer = PDFRenderer(workers=1, timeout=5)
+        with patch.object(PDFRenderer, "_command", lambda self, pages: ["false"]):
+            with self.assertRaises(RenderError):
+                renderer.render("<html></html>", "routes-report")
+        self.assertEqual(renderer.stats()["routes-report"]["failures"], 1)
+
+    def test_timeout(self):
+        renderer = PDFRenderer(workers=1, timeout=0.1)
+        with patch.object(PDFRenderer, "_command", lambda self, pages: ["sleep", "5"]):
+            with self.assertRaises(RenderTimeout):
+                renderer.render("<html></html>", "routes-report")
+        self.assertEqual(renderer.stats()["routes-report"]["failures"], 1)
+
+    def test_pages(self):
+        renderer = PDFRenderer(workers=1, timeout=5)
+        command = patch.object(
+            PDFRenderer, "_command",
+            lambda self, pages: ["cat"] + [source for source, style_sheet in pages])
+        with command:
+            self.assertEqual(
+                renderer.submit_pages(
+                    [("%PDF labels", "labels.css"), (" routes", None)], "packet").result(),
+                b"%PDF labels routes")
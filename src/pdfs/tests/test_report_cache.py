@@ -0,0 +1,94 @@
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from freezegun import freeze_time
+
+from models.models import Customer, Diet, Payment, data_version
+from pdfs.report_cache import ReportCache
+
+
+class TestReportCache(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+
+    def test_get_put(self):
+        cache = ReportCache(self.root.name)
+        key = cache.key("labels", ["03-25-2020"], "v1")
+        self.assertIsNone(cache.get("labels", key))
+        cache.put(key, "application/pdf", b"%PDF\nreport")
+        self.assertEqual(cache.get("labels", key), ("application/pdf", b"%PDF\nreport"))
+        self.assertNotEqual(key, cache.key("labels", ["03-25-2020"], "v2"))
+        self.assertEqual(cache.counters(), {"labels": {"hits": 1, "misses": 1}})
+
+    def test_lru_eviction(self):
+        cache = ReportCache(self.root.name, max_bytes=250)
+        keys = [cache.key("labels", [i], "v1") for i in range(3)]
+        for i, key in enumerate(keys[:2]):
+            cache.put(key, "text/csv", b"x" * 100)
+            os.utime(os.path.join(self.root.name, key), (i, i))
+        # reading the oldest entry makes the other one the least recently used
+        self.assertIsNotNone(cache.get("labels", keys[0]))
+        cache.put(keys[2], "text/csv", b"x" * 100)
+        self.assertIsNotNone(cache.get("labels", keys[0]))
+        self.assertIsNone(cache.get("labels", keys[1]))
+        self.assertIsNotNone(cache.get("labels", keys[2]))
+
+
+@freeze_time("2020-3-25")
+class TestCachedReport(TestCase):
+
+    @patch("interfaces.address_lookup.validate",
+           lambda *a, **k: {"lat": None, "lng": None})
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create(username="admin", is_staff=True))
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        cache = ReportCache(self.root.name)
+        patcher = patch("pdfs.report_cache.get_report_cache", lambda: cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.customer = Customer.objects.create(
+            first_name="test",
+            last_name="customer",
+            address="555 Main St.",
+            pays=Payment.objects.create(name="testpayment"),
+            diet=Diet.objects.create(name="Regular", code="R"),
+            active=True,
+        )
+
+    @patch("interfaces.address_lookup.validate",
+           lambda *a, **k: {"lat": None, "lng": None})
+    def test_invalidated_by_edit(self):
+        url = reverse("pdfs:daily_count_report", args=["03-25-2020"])
+        to_pdf = MagicMock(side_effect=lambda html, *a, **k: HttpResponse(html))
+        with patch("pdfs.views.to_pdf", to_pdf):
+            first = self.client.get(url)
+            second = self.client.get(url)
+            self.assertEqual(to_pdf.call_count, 1)
+            self.assertEqual(first.content, second.content)
+
+            self.customer.first_name = "changed"
+            self.customer.save()
+            self.client.get(url)
+            self.assertEqual(to_pdf.call_count, 2)
+
+    def test_user_version(self):
+        user = User.objects.create(username="volunteer", first_name="first")
+        version = data_version(User)
+        # logins and saves that change nothing the reports read keep the cache
+        user.last_login = timezone.now()
+        user.save(update_fields=["last_login"])
+        user.save()
+        self.assertEqual(data_version(User), version)
+        user.last_name = "changed"
+        user.save()
+        self.assertNotEqual(data_version(User), version)
@@ -1,13 +1,20 @@
+import csv
 import datetime
+import io
+import tempfile
+import zipfile
 from unittest import SkipTest
 
 # https://docs.python.org/3/library/unittest.mock.html
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.http import FileResponse, HttpResponse
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.formats import date_format
 from freezegun import freeze_time
 from recurrence import serialize
 
@@ -43,12 +50,19 @@ from models.models import (
     Pet,
     PetFood,
     Route,
+    Run,
     Substitution,
     User,
     Volunteer,
     VolunteerRecord,
 )
-from pdfs.views import monthly_billing_report
+from pdfs.delivery import DeliveryDay, morning_packet
+from pdfs.report_cache import ReportCache
+from pdfs.views import (
+    customer_feedback_fields,
+    monthly_billing_report,
+    route_volunteers_by_date,
+)
 
 
 class TestCustomerMealReports(TestCase):
@@ -219,7 +233,7 @@ class TestCustomerMealReports(TestCase):
             self.assertContains(response, route.name, count=2 + (i <= 1))
 
     @freeze_time("2020-3-26")
-    @patch("pdfs.views.to_pdf", lambda html: HttpResponse(html))
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
     def test_monthly_billing_normal_day(self):
         today = datetime.date.today()
         self.cron_on_day("2020-3-26")
@@ -244,7 +258,7 @@ class TestCustomerMealReports(TestCase):
         self.assertContains(response, f"Total Meals: {10} ", html=True)
 
     @freeze_time("2020-3-27")
-    @patch("pdfs.views.to_pdf", lambda html: HttpResponse(html))
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
     def test_monthly_billing_weekend_meals(self):
         today = datetime.date.today()
         self.cron_on_day("2020-3-27")
@@ -274,7 +288,7 @@ class TestCustomerMealReports(TestCase):
             html=True)
 
     @freeze_time("2020-3-27")
-    @patch("pdfs.views.to_pdf", lambda html: HttpResponse(html))
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
     def test_monthly_billing_multiple_days(self):
         wednesday = datetime.date.today() - datetime.timedelta(days=2)
         thursday = datetime.date.today() - datetime.timedelta(days=1)
@@ -282,9 +296,12 @@ class TestCustomerMealReports(TestCase):
         self.cron_on_day("2020-3-25")
         self.cron_on_day("2020-3-26")
         self.cron_on_day("2020-3-27")
-        response = self.client.get(
-            f"/pdfs/monthly-billing-report/{self.wednesday_str}/{self.friday_str}/"
-        )
+        # session, user, meals by date and by payment type from the rollup, and the
+        # meals by customer
+        with self.assertNumQueries(5):
+            response = self.client.get(
+                f"/pdfs/monthly-billing-report/{self.wednesday_str}/{self.friday_str}/"
+            )
         for i, cust in enumerate(self.mwf_customers):
             self.assertContains(
                 response,
@@ -321,7 +338,19 @@ class TestCustomerMealReports(TestCase):
             f"Total Meals: {sum(range(1, 11)) + 20} ",
             html=True)
 
-    @patch("pdfs.views.to_pdf", lambda html: HttpResponse(html))
+    @freeze_time("2020-3-27")
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
+    def test_monthly_billing_purged_range(self):
+        self.cron_on_day("2020-3-27")
+        response = self.client.get(
+            f"/pdfs/monthly-billing-report/{self.friday_str}/{self.friday_str}/")
+        self.assertNotContains(response, "have been purged")
+        oldest_kept = datetime.date.today() - datetime.timedelta(days=RETENTION)
+        response = self.client.get(
+            f"/pdfs/monthly-billing-report/01-01-2019/{self.friday_str}/")
+        self.assertContains(response, f"Records before {date_format(oldest_kept)}")
+
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
     def test_daily_count(self):
         # dietless = Customer.objects.create(
         #     first_name=f"Customer",
@@ -349,7 +378,63 @@ class TestCustomerMealReports(TestCase):
         # )
         raise SkipTest
 
-    @patch("pdfs.views.to_pdf", lambda html: HttpResponse(html))
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
+    @patch("interfaces.address_lookup.validate",
+           lambda *a, **k: {"lat": None, "lng": None})
+    @freeze_time("2020-3-25")
+    def test_daily_count_query_count(self):
+        report_root = tempfile.TemporaryDirectory()
+        self.addCleanup(report_root.cleanup)
+        cache = ReportCache(report_root.name)
+        url = f"/pdfs/daily-count-report/{self.friday_str}/"
+        with patch("pdfs.report_cache.get_report_cache", lambda: cache):
+            # session, user, data version, customers with their diets and date ranges
+            with self.assertNumQueries(5):
+                response = self.client.get(url)
+            for i, diet in enumerate(self.diets):
+                self.assertContains(
+                    response,
+                    f'<td style="width:80%">{diet} ({diet.code})</td> '
+                    f'<td>{sum(range(1 + i, 11, 4))}</td>',
+                    html=True,
+                )
+            self.assertContains(
+                response, f"<td><b>Total</b></td> <td><b>{sum(range(1, 11)) + 25}</b></td>",
+                html=True)
+
+            for customer in self.tuth_customers:
+                customer.meal_recurrence = serialize(
+                    Recurrence(Rule(freq=WEEKLY, byday=(MO, WE, FR))))
+                customer.save()
+            with self.assertNumQueries(5):
+                response = self.client.get(url)
+            self.assertContains(
+                response, f"<td><b>Total</b></td> <td><b>{sum(range(1, 11)) + len(self.tuth_customers) + 25}</b></td>",
+                html=True)
+
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
+    def test_customers_by_route(self):
+        Customer.objects.filter(pk=self.mwf_customers[0].pk).update(
+            receivesBonusPantryDelivery=False)
+        for url, excluded in (
+                ("/pdfs/get-all-customers-by-route", []),
+                ("/pdfs/bonus-pantry-report", [self.mwf_customers[0]])):
+            # session, user, routes, customers
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            html = "".join(response.content.decode().split())
+            for route in self.routes:
+                custs = [
+                    c for c in self.mwf_customers + self.tuth_customers
+                    if c.route == route and c not in excluded]
+                self.assertIn(
+                    "".join(f"{route} | Customers: {len(custs)}".split()), html)
+                rows = [
+                    html.index("".join(f"<td>{ci + 1}</td><td>{c}</td>".split()))
+                    for ci, c in enumerate(custs)]
+                self.assertEqual(rows, sorted(rows))
+
+    @patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
     @freeze_time("2020-3-27")
     def test_generate_routes(self):
         today = datetime.date.today()
@@ -397,7 +482,7 @@ class TestCustomerMealReports(TestCase):
 
 
 @freeze_time("2020-3-25")
-@patch("pdfs.views.to_pdf", lambda html: HttpResponse(html))
+@patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
 class TestJobReports(TestCase):
     __author__ = "Max Patek"
 
@@ -491,9 +576,11 @@ class TestJobReports(TestCase):
         ]
 
     def test_substitutions(self):
-        response = self.client.get(
-            f"/pdfs/substitutions-report/{self.thursday_str}/{self.friday_str}/"
-        )
+        # session, user and the substitutions with everything displayed
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                f"/pdfs/substitutions-report/{self.thursday_str}/{self.friday_str}/"
+            )
         for sub in self.substitutions:
             self.assertContains(
                 response,
@@ -504,6 +591,13 @@ class TestJobReports(TestCase):
                 """,
                 html=True,
             )
+        # thursday before friday, and each day's routes by number
+        html = response.content.decode()
+        positions = [
+            html.index(f'<td class="col-xs-4">{sub.assignment.job.name}</td>', start)
+            for start in (0, html.index("Friday"))
+            for sub in (self.thursday_filled_sub, self.thursday_open_sub)]
+        self.assertEqual(positions, sorted(positions))
 
     def test_job_overview(self):
         response = self.client.get(
@@ -518,9 +612,71 @@ class TestJobReports(TestCase):
         self.assertContains(response, OPEN_SUBSTITUTION, count=2)
         self.assertContains(response, UNASSIGNED_JOB, count=2)
 
+    def test_route_volunteers_deleted_job(self):
+        # a record whose job was deleted is left out of the route volunteers
+        day = datetime.date(2020, 1, 3)
+        VolunteerRecord.objects.create(
+            volunteer=self.vols[0], job=self.routes[0], date=day, is_substitution=False)
+        VolunteerRecord.objects.create(
+            volunteer=self.vols[1], job=None, date=day, is_substitution=False)
+        self.assertEqual(
+            DeliveryDay(day).route_volunteers, {self.routes[0].pk: str(self.vols[0])})
+
+    def test_route_volunteers_by_date_deleted_job(self):
+        day = datetime.date(2020, 1, 3)
+        VolunteerRecord.objects.create(
+            volunteer=self.vols[0], job=self.routes[0], date=day, is_substitution=False)
+        VolunteerRecord.objects.create(
+            volunteer=self.vols[1], job=None, date=day, is_substitution=False)
+        self.assertEqual(
+            route_volunteers_by_date(day, day),
+            {(self.routes[0].pk, day): str(self.vols[0])})
+
+    def feedback_csv(self, report):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f"/pdfs/{report}/{self.thursday_str}/{self.friday_str}/")
+            rows = list(csv.reader(
+                io.StringIO(b"".join(response.streaming_content).decode())))
+        return rows, len(queries)
+
+    def test_feedback_reports(self):
+        for i, customer in enumerate(self.mwf_customers):
+            Run.objects.create(
+                customer=customer, run_date=self.friday,
+                delivery_status="Delivered" if i % 2 else None,
+                customer_status="Home" if i % 2 else None)
+        # the filled sub replaces route 1's volunteer, route 2's sub is open
+        volunteers = {
+            self.routes[0].pk: str(self.vols[0]),
+            self.routes[1].pk: str(self.vols[-1]),
+        }
+
+        missing, missing_queries = self.feedback_csv("missing-feedback-report")
+        statuses, status_queries = self.feedback_csv("customer-status-report")
+        self.assertEqual(missing[0], customer_feedback_fields)
+        self.assertEqual(statuses[0], customer_feedback_fields)
+        for rows, parity in ((missing, 0), (statuses, 1)):
+            self.assertEqual(rows[1:], [
+                [str(self.friday), str(c.route), str(c),
+                 "Delivered" if parity else "", "Home" if parity else "", "",
+                 volunteers.get(c.route.pk, "N/A")]
+                for i, c in sorted(
+                    enumerate(self.mwf_customers), key=lambda ic: ic[1].route.number)
+                if i % 2 == parity])
+
+        # more runs on more days take no more queries
+        for customer in self.tuth_customers:
+            Run.objects.create(customer=customer, run_date=self.thursday)
+        rows, queries = self.feedback_csv("missing-feedback-report")
+        self.assertEqual(len(rows), len(missing) + len(self.tuth_customers))
+        self.assertEqual(queries, missing_queries)
+        rows, queries = self.feedback_csv("customer-status-report")
+        self.assertEqual(queries, status_queries)
+
 
 @freeze_time("2020-3-25")
-@patch("pdfs.views.to_pdf", lambda html: HttpResponse(html))
+@patch("pdfs.views.to_pdf", lambda html, *args, **kwargs: HttpResponse(html))
 @patch("interfaces.address_lookup.validate",
        lambda *a, **k: {"lat": None, "lng": None})
 class TestSpecialDates(TestCase):
@@ -589,6 +745,39 @@ class TestSpecialDates(TestCase):
         for vol in vols:
             self.assertContains(response, vol)
 
+    def test_upcoming_birthdays(self):
+        route = Route.objects.create(
+            number=1, job_type=JobType.objects.create(name="route_job_type"))
+        # 1952 is a leap year
+        dates = [
+            datetime.date(1952, 1, 1) + datetime.timedelta(days=i) for i in range(366)]
+        for date in dates:
+            Customer.objects.create(
+                first_name="Born on", last_name=str(date), birth_date=date, address="",
+                route=route)
+            Volunteer.objects.filter(user=User.objects.create(
+                username=f"born{date}", first_name="Born on", last_name=str(date),
+            )).update(birth_date=date, birth_month_day=date.month * 100 + date.day)
+
+        for today, days, born in (
+                # across the end of a month
+                ("2020-3-25", None, dates[84:98]),
+                # across the end of the year, from the given number of days
+                ("2020-12-25", 10, dates[-7:] + dates[:3]),
+                # february 29th is between february 28th and march 1st
+                ("2021-2-28", 2, dates[58:61])):
+            for report in ("client-birthday-report", "volunteer-birthday-report"):
+                url = f"/pdfs/{report}/upcoming/" + (f"{days}/" if days else "")
+                with freeze_time(today):
+                    self.client.force_login(User.objects.get(username="admin"))
+                    # session, user and the birthdays
+                    with self.assertNumQueries(3):
+                        response = self.client.get(url)
+                html = response.content.decode()
+                positions = [html.index(f"Born on {date}") for date in born]
+                self.assertEqual(positions, sorted(positions))
+                self.assertEqual(html.count("Born on"), len(born))
+
     def test_volunteer_join_date(self):
         vols = []
         for date in self.bunch_of_dates():
@@ -606,6 +795,58 @@ class TestSpecialDates(TestCase):
             self.assertContains(response, vol)
 
 
+def fake_wkhtmltopdf(self, pages):
+    # writes a "pdf" of the html of every page
+    return ["sh", "-c", 'printf "%%PDF"; cat "$@"', "sh"] + [source for source, _ in pages]
+
+
+@freeze_time("2020-3-25")
+@patch("pdfs.renderer.PDFRenderer._start_display", lambda self: None)
+@patch("pdfs.renderer.PDFRenderer._command", fake_wkhtmltopdf)
+class TestMorningPacket(TestCase):
+
+    def setUp(self):
+        TestCustomerMealReports.setUp(self)  # reuse previous setup
+
+    def test_merged(self):
+        response = self.client.get(
+            reverse("pdfs:morning_packet", args=[self.friday_str]))
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        html = response.content.decode()
+        for title in ("Labels PDF", "Pet Labels PDF", "Daily Count Report", "Route Report"):
+            self.assertIn(title, html)
+        for customer in self.mwf_customers:
+            self.assertIn(customer.first_name, html)
+
+    def test_zip(self):
+        response = self.client.get(
+            reverse("pdfs:morning_packet", args=[self.friday_str]), {"format": "zip"})
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with zipfile.ZipFile(io.BytesIO(response.content)) as packet:
+            self.assertEqual(packet.namelist(), [
+                "labels-2020-03-27.pdf",
+                "pet-labels-2020-03-27.pdf",
+                "daily-count-2020-03-27.pdf",
+                "routes-2020-03-27.pdf",
+            ])
+            self.assertIn(
+                b"Total", packet.read("daily-count-2020-03-27.pdf"))
+
+    @patch("interfaces.address_lookup.validate",
+           lambda *a, **k: {"lat": None, "lng": None})
+    def test_query_count(self):
+        day = datetime.date(year=2020, month=3, day=27)
+        # the shared dataset is loaded once, no matter how many customers there are
+        with self.assertNumQueries(12):
+            morning_packet(day)
+        for customer in self.tuth_customers:
+            customer.route = self.routes[0]
+            customer.save()
+        with self.assertNumQueries(12):
+            morning_packet(day)
+
+
 class TestPDFs(TestCase):
     def setUp(self):
         # set up customer, payment, route,
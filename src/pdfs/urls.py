@@ -42,6 +42,26 @@ urlpatterns = [
         views.volunteer_birthday_report,
         name="volunteer_birthday_report",
     ),
+    path(
+        "client-birthday-report/upcoming/",
+        views.client_upcoming_birthday_report,
+        name="client_upcoming_birthday_report",
+    ),
+    path(
+        "client-birthday-report/upcoming/<int:days>/",
+        views.client_upcoming_birthday_report,
+        name="client_upcoming_birthday_report",
+    ),
+    path(
+        "volunteer-birthday-report/upcoming/",
+        views.volunteer_upcoming_birthday_report,
+        name="volunteer_upcoming_birthday_report",
+    ),
+    path(
+        "volunteer-birthday-report/upcoming/<int:days>/",
+        views.volunteer_upcoming_birthday_report,
+        name="volunteer_upcoming_birthday_report",
+    ),
     re_path(
         r"^daily-count-report/(?P<date>\d{2}-\d{2}-\d{4})/$",
         views.daily_count_report,
@@ -57,6 +77,11 @@ urlpatterns = [
         views.generate_routes_report,
         name="generate_routes_report",
     ),
+    path(
+        "morning-packet/<str:date>/",
+        views.morning_packet_report,
+        name="morning_packet",
+    ),
 
     path(
         "get-all-customers-by-route",
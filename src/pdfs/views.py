@@ -1,60 +1,66 @@
-import collections
 import csv
 import datetime
+from calendar import monthrange
+from collections import defaultdict
 from logging import getLogger
 
-import pdfkit
-
 # Create your views here.
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count, Sum
-from django.http import HttpResponse
+from django.contrib.auth.models import User
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.template.loader import get_template
-from pyvirtualdisplay import Display
 from django.shortcuts import get_object_or_404
 
 
-from interfaces.recurrence import date_to_day_of_month, months
-from meals.constants import OPEN_ROUTE, OPEN_SUBSTITUTION, UNASSIGNED_JOB
+from interfaces.recurrence import months
+from meals.constants import (
+    OPEN_ROUTE,
+    OPEN_SUBSTITUTION,
+    RETENTION,
+    UNASSIGNED_JOB,
+    UPCOMING_BIRTHDAYS_DAYS,
+)
 from models.models import (
     Assignment,
+    BillingDaily,
     Customer,
     CustomerRecord,
+    DateRange,
     Run,
     Diet,
-    Pet,
-    PetFood,
+    Job,
     Route,
     Substitution,
     Volunteer,
+    VolunteerRecord,
+    birth_month_day,
+    birthdays_between,
 )
+from pdfs.delivery import (
+    ROUTES_STYLE_SHEET,
+    DeliveryDay,
+    daily_count_context,
+    group_by_route,
+    labels_context,
+    morning_packet,
+    pet_labels_context,
+    routes_context,
+)
+from pdfs.renderer import get_renderer
+from pdfs.report_cache import cached_report
 from staff.views.job_management import actuals_to_display
 
-_display = None
-
 log = getLogger(__name__)
 
 customer_feedback_fields = ["Date", "Route Number", "Client",
                             "Delivery Status", "Client Status", "Notes", "Volunteer"]
 
 
-def to_pdf(html, styleSheetPath=None):
-    global _display
-    if not _display:
-        _display = Display(visible=0, size=(320, 240)).start()
-    options = {
-        "page-size": "Letter",
-        "margin-top": "0.74in",
-        "margin-right": "0.39in",
-        "margin-bottom": "0.39in",
-        "margin-left": "0.39in",
-        "print-media-type": True,
-        "user-style-sheet": styleSheetPath
-    }
-
-    pdf = pdfkit.from_string(html, False, options)
-
+def to_pdf(html, styleSheetPath=None, report="report"):
+    pdf = get_renderer().render(html, report, styleSheetPath)
     return HttpResponse(pdf, content_type="application/pdf")
 
 #######helper functions#######
@@ -64,84 +70,99 @@ def reverse_date(date):
     return datetime.datetime.strptime(date, "%m-%d-%Y")
 
 
-def get_run_row(obj, assignment_object):
-    # find the volunteer associated with the route and date.
-    if len(assignment_object) > 0:
-        return [obj.run_date, obj.customer.route, obj.customer, obj.delivery_status, obj.customer_status, obj.notes, assignment_object[0].volunteer]
-    else:
-        return [obj.run_date, obj.customer.route, obj.customer, obj.delivery_status, obj.customer_status, obj.notes, "N/A"]
+class Echo:
+    """
+    A file-like object that hands back what is written to it, so csv.writer can format
+    the rows of a StreamingHttpResponse one at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def route_volunteers_by_date(begin_date, end_date):
+    """
+    A dict of (route pk, date) -> the names of the volunteers delivering the route on the
+    date, comma separated, for the dates [begin_date, end_date]. Substitutions and records
+    are resolved by one Assignment.actuals() call for the whole range.
+    """
+    volunteers = defaultdict(list)
+    for actual in Assignment.actuals(
+            begin_date, end_date + datetime.timedelta(days=1), order_by="volunteer"):
+        # records of deleted jobs have no job to deliver
+        if actual.volunteer is not None and actual.job is not None:
+            volunteers[(actual.job.pk, actual.date)].append(str(actual.volunteer))
+    return {key: ", ".join(names) for key, names in volunteers.items()}
+
 
+def feedback_rows(runs, begin_date, end_date):
+    """
+    The header and then one row per run, with the volunteer who delivered it
+    """
+    yield customer_feedback_fields
+    volunteers = route_volunteers_by_date(begin_date, end_date)
+    for run in runs.iterator(chunk_size=2000):
+        yield [
+            run.run_date, run.customer.route, run.customer, run.delivery_status,
+            run.customer_status, run.notes,
+            volunteers.get((run.customer.route_id, run.run_date), "N/A")]
 
-def initialize_feedback_report(begin_date, end_date, prefix=""):
-    begin_date = reverse_date(begin_date)
-    end_date = reverse_date(end_date)
+
+def feedback_report(begin_date, end_date, prefix, runs):
+    """
+    Stream the runs in runs between begin_date and end_date, of customers on a route, as a
+    csv file named prefix-<dates>.csv
+    """
+    begin_date = reverse_date(begin_date).date()
+    end_date = reverse_date(end_date).date()
     if begin_date == end_date:
         date = begin_date.strftime("%m-%d-%Y")
     else:
         date = begin_date.strftime("%m-%d-%Y") + \
             "--" + end_date.strftime("%m-%d-%Y")
 
-    response = HttpResponse(content_type="text/csv")
+    runs = (
+        runs.filter(
+            run_date__gte=begin_date, run_date__lte=end_date, customer__route__isnull=False)
+        .select_related("customer", "customer__route")
+        .order_by("run_date", "customer__route__number", "customer___order", "pk"))
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in feedback_rows(runs, begin_date, end_date)),
+        content_type="text/csv")
     filename = prefix + "-" + date + ".csv"
     response["Content-Disposition"] = 'attachment; filename="' + filename + '"'
-
-    writer = csv.writer(response)
-    writer.writerow(customer_feedback_fields)
-
-    feedback = Run.objects.filter(
-        run_date__gte=begin_date, run_date__lte=end_date)
-
-    return response, writer, feedback
+    return response
 
 #################################
 
 
 @staff_member_required
+@cached_report("labels", Customer, CustomerRecord, DateRange, Diet, Job, Route)
 def labels(request, date):
-    date = datetime.datetime.strptime(date, "%m-%d-%Y")
-
-    cust_query = Customer.objects.filter(
-        active=1).exclude(
-        route=None).order_by('route', 'last_name')
-    cust_query = [c for c in cust_query if c.num_meals_on_day(date)]
-    diet_query = Diet.objects.values()
-
-    context = {
-        "cust_query": cust_query,
-        "diet_query": diet_query,
-        "date": date}
-    return render(request, "pdfs/label_pdf.html", context)
+    day = DeliveryDay(datetime.datetime.strptime(date, "%m-%d-%Y"))
+    return render(request, "pdfs/label_pdf.html", labels_context(day))
 
 
 @staff_member_required
 def pet_labels(request, date):
-    date = datetime.datetime.strptime(date, "%m-%d-%Y")
-
-    cust_query = Customer.objects.filter(
-        active=1).exclude(
-        route=None).order_by('route')
-    cust_query = [
-        c for c in cust_query if c.active and not c.date_range_excluded(date)]
-
-    pet_query = Pet.objects.values()
-    petfood_query = PetFood.objects.values()
-
-    context = {'cust_query': cust_query,
-               'pet_query': pet_query,
-               'petfood_query': petfood_query,
-               }
-
+    day = DeliveryDay(datetime.datetime.strptime(date, "%m-%d-%Y"))
     # Front-end handles association of customers with pets/pet foods
-    return render(request, "pdfs/label-pet-pdf.html", context)
+    return render(request, "pdfs/label-pet-pdf.html", pet_labels_context(day))
 
 
 class SubDisplay:
+    """
+    A substitution as displayed on the substitutions report. sub must be annotated with
+    route_number (-1 if the job is not a route) and job_type_name, and have its
+    assignment's job and both volunteers' users selected.
+    """
+
     def __init__(self, sub):
-        self.job_name = sub.assignment.job.name
-        self.route_number = sub.assignment.job.get_route_number()
         # job used for sorting
         self.job_name = sub.assignment.job.name
-        self.job_type = sub.assignment.job.job_type.name
+        self.route_number = sub.route_number
+        self.job_type = sub.job_type_name
         if sub.volunteer:
             self.volunteer = f"{sub.volunteer.user.first_name} {sub.volunteer.user.last_name}"
         else:
@@ -161,34 +182,39 @@ def substitutions_report(request, begin_date, end_date):
     takes in a beginning date and end date, displays for these days and
     everything in between
     """
-    day_dict = {}  # passed into context
-    begin_date_datetime = datetime.datetime.strptime(begin_date, "%m-%d-%Y")
-    end_date_datetime = datetime.datetime.strptime(end_date, "%m-%d-%Y")
-    count = (end_date_datetime - begin_date_datetime).days
-    # loop over the count
-    for i in range(count + 1):
-        day = begin_date_datetime + datetime.timedelta(days=i)
-        if day.isoweekday() == 6 or day.isoweekday() == 7:
-            continue
-        day_dict[day] = []
-        # ge the subs table, loop over and create the person objects
-        subs_on_day = Substitution.objects.filter(date=day)
-        # loop over the substitutions for this day
-        routes_on_day = []
-        other_jobs_on_day = []
-        for sub in subs_on_day:
-            # create display item for context
-            list_item = SubDisplay(sub)
-            # append to routes or other jobs so items can be sorted
-            if list_item.route_number != -1:
-                routes_on_day.append(list_item)
-            else:
-                other_jobs_on_day.append(list_item)
-
-        # sorting for display
-        routes_on_day.sort(key=lambda r: (r.route_number, r.volunteer))
-        # sort by type then by job name
-        other_jobs_on_day.sort(key=lambda j: (j.job_type, j.job_name))
+    begin_date = datetime.datetime.strptime(begin_date, "%m-%d-%Y").date()
+    end_date = datetime.datetime.strptime(end_date, "%m-%d-%Y").date()
+    # every weekday in the range is displayed, even without substitutions
+    day_dict = {
+        day: []
+        for day in (
+            begin_date + datetime.timedelta(days=i)
+            for i in range((end_date - begin_date).days + 1))
+        if day.isoweekday() not in (6, 7)
+    }
+
+    # all of the substitutions in the range, with everything displayed, in one query
+    subs = (
+        Substitution.objects.filter(date__gte=begin_date, date__lte=end_date)
+        .select_related(
+            "assignment__job", "assignment__volunteer__user", "volunteer__user")
+        .annotate(
+            route_number=Coalesce("assignment__job__route__number", Value(-1)),
+            job_type_name=F("assignment__job__job_type__name"))
+    )
+    for sub in subs:
+        if sub.date in day_dict:
+            day_dict[sub.date].append(SubDisplay(sub))
+
+    for day, subs_on_day in day_dict.items():
+        # routes first, sorted by number then volunteer, then the other jobs sorted by
+        # type then by job name
+        routes_on_day = sorted(
+            (item for item in subs_on_day if item.route_number != -1),
+            key=lambda r: (r.route_number, r.volunteer))
+        other_jobs_on_day = sorted(
+            (item for item in subs_on_day if item.route_number == -1),
+            key=lambda j: (j.job_type, j.job_name))
         day_dict[day] = routes_on_day + other_jobs_on_day
 
     template = get_template("pdfs/substitutions-report.html")
@@ -198,7 +224,8 @@ def substitutions_report(request, begin_date, end_date):
                 "res": sorted(day_dict.items(), key=lambda item: (item[0])),
                 "today": datetime.datetime.now(),
             }
-        )
+        ),
+        report="substitutions-report",
     )
 
 
@@ -222,7 +249,8 @@ def job_overview_report(request, begin_date, end_date):
                 "open_substitution": OPEN_SUBSTITUTION,
                 "unassigned_job": UNASSIGNED_JOB,
             }
-        )
+        ),
+        report="job-overview-report",
     )
 
 
@@ -233,37 +261,11 @@ def missing_feedback_report(request, begin_date, end_date):
     takes in a beginning date and end date, displays for these days and
     everything in between
     """
-    response, writer, feedback = initialize_feedback_report(
-        begin_date, end_date, "missing-feedback")
-
-    if feedback is not None and len(feedback) > 0:
-        for obj in feedback:
-            # check if feedback exists. Add only those records that DO NOT have any feedback. /missingCustomerFeedback/ will insert blank records for incomplete/missing feedback
-            if not obj.delivery_status and not obj.customer_status and obj.customer.route.id > -1:
-                runDate = date_to_day_of_month(obj.run_date)
-
-                # get assignments for volunteer users feedback
-                try:
-                    assignments = Assignment.objects.filter(
-                        job=obj.customer.route, day_of_week=runDate.day_of_week, week_of_month=runDate.week_of_month)
-                except Assignment.DoesNotExist:
-                    assignments = None
-
-                # get assignment id from assignments to find the substitute volunteer for the route
-                if len(assignments) > 0:
-                    for assignment in assignments:
-                        assignmentId = assignment.id
-                        subs = Substitution.objects.filter(
-                            assignment=assignmentId, date=obj.run_date)
-
-                # if assignment contains a sub, pass substitute object to
-                # get_run_row function and print the correct volunteer name in the report
-                if len(subs) > 0:
-                    writer.writerow(get_run_row(obj, subs))
-                else:
-                    writer.writerow(get_run_row(obj, assignments))
-
-    return response
+    # /missingCustomerFeedback/ inserts blank runs for incomplete/missing feedback
+    runs = Run.objects.filter(
+        Q(delivery_status__isnull=True) | Q(delivery_status=""),
+        Q(customer_status__isnull=True) | Q(customer_status=""))
+    return feedback_report(begin_date, end_date, "missing-feedback", runs)
 
 
 @ staff_member_required
@@ -273,36 +275,9 @@ def customer_status_report(request, begin_date, end_date):
     takes in a beginning date and end date, displays for these days and
     everything in between
     """
-    response, writer, feedback = initialize_feedback_report(
-        begin_date, end_date, "customer-statuses")
-
-    if feedback is not None and len(feedback) > 0:
-        for obj in feedback:
-            if obj.delivery_status and obj.customer_status and obj.customer and obj.customer.route.id > -1:
-                runDate = date_to_day_of_month(obj.run_date)
-
-                # get assignments for volunteer users feedback
-                try:
-                    assignments = Assignment.objects.filter(
-                        job=obj.customer.route, day_of_week=runDate.day_of_week, week_of_month=runDate.week_of_month)
-                except Assignment.DoesNotExist:
-                    assignments = None
-
-                # get assignment id from assignments to find the substitute volunteer for the route
-                if len(assignments) > 0:
-                    for assignment in assignments:
-                        assignmentId = assignment.id
-                        subs = Substitution.objects.filter(
-                            assignment=assignmentId, date=obj.run_date)
-
-                # if assignment contains a sub, pass substitute object to
-                # get_run_row function and print the correct volunteer name in the report
-                if len(subs) > 0:
-                    writer.writerow(get_run_row(obj, subs))
-                else:
-                    writer.writerow(get_run_row(obj, assignments))
-
-    return response
+    runs = Run.objects.exclude(delivery_status__isnull=True).exclude(
+        delivery_status="").exclude(customer_status__isnull=True).exclude(customer_status="")
+    return feedback_report(begin_date, end_date, "customer-statuses", runs)
 
 
 @ staff_member_required
@@ -312,62 +287,51 @@ def monthly_billing_report(request, begin_date, end_date):
     begin_date = datetime.datetime.strptime(begin_date, "%m-%d-%Y")
     end_date = datetime.datetime.strptime(end_date, "%m-%d-%Y")
 
-    # Fetch all the CustomerRecord objects within the given range and sum up
-    # the total meals per day
-    date_meals_query = (
-        CustomerRecord.objects.filter(
-            num_meals__gte=1,
-            date__gte=begin_date,
-            date__lte=end_date) .values("date") .annotate(
-            total_meals=Sum("num_meals")) .order_by("date"))
-
-    # Convert the QuerySet to a usable dictionary
-    date_meals = {}
-    total = 0
-    for record in date_meals_query:
-        key = record["date"]
-        value = record["total_meals"]
-
-        date_meals[key] = value
-        total += value
-
-    # Fetch all the customers within query and count their number of meals
-    customer_meals_query = (
-        CustomerRecord.objects.filter(
-            num_meals__gte=1,
-            date__gte=begin_date,
-            date__lte=end_date) .values(
-            "customer",
-            "payment_type",
-            "route_assigned") .annotate(
-                total_meals=Sum("num_meals")) .order_by("payment_type"))
-
-    # Front-end logic handles separation and rendering of customer_meals
-    # QuerySet
-
-    # Last thing we need is ability to count meals by payment type
-    payment_meals_query = (
-        CustomerRecord.objects.filter(
-            num_meals__gte=1,
-            date__gte=begin_date,
-            date__lte=end_date) .values("payment_type") .annotate(
-            total_meals=Sum("num_meals"),
-            num_customers=Count(
-                "customer",
-                distinct=True)) .order_by("payment_type"))
-
-    # Convert to usable dictionary
-    payments_meals = {}
-    payments_customers = {}
-    for elem in payment_meals_query:
-        payment, meals, customers = (
-            elem["payment_type"],
-            elem["total_meals"],
-            elem["num_customers"],
-        )
-
-        payments_meals[payment] = meals
-        payments_customers[payment] = customers
+    # The records and their rollup are purged after RETENTION days, the report says
+    # when the range starts before what is left
+    oldest_kept = datetime.date.today() - datetime.timedelta(days=RETENTION)
+    purged_before = oldest_kept if begin_date.date() < oldest_kept else None
+
+    # The meals per day and per payment type come from the BillingDaily rollup
+    billing = BillingDaily.objects.filter(date__gte=begin_date, date__lte=end_date)
+    date_meals = {
+        record["date"]: record["total_meals"]
+        for record in billing.values("date").annotate(
+            total_meals=Sum("num_meals")).order_by("date")
+    }
+    total = sum(date_meals.values())
+    payments_meals = {
+        record["payment_type"]: record["total_meals"]
+        for record in billing.values("payment_type").annotate(
+            total_meals=Sum("num_meals")).order_by()
+    }
+
+    # Count every customer's meals, with the names of the customer, payment and route,
+    # in one query. Front-end logic handles separation of customer_meals by payment type
+    customer_meals = []
+    payments_customers = defaultdict(set)
+    for record in (
+            CustomerRecord.objects.filter(
+                num_meals__gte=1,
+                date__gte=begin_date,
+                date__lte=end_date) .values(
+                "customer", "customer__first_name", "customer__last_name",
+                "payment_type", "payment_type__name", "route_assigned__name") .annotate(
+                total_meals=Sum("num_meals")) .order_by(
+                "payment_type", "customer__last_name", "customer__first_name", "customer")):
+        if record["customer"] is not None:
+            payments_customers[record["payment_type"]].add(record["customer"])
+        customer_meals.append({
+            "customer": (
+                f"{record['customer__first_name']} {record['customer__last_name']}"
+                if record["customer"] is not None else "No Customer Type Found"),
+            "total_meals": record["total_meals"],
+            "payment_type": record["payment_type"],
+            "payment": record["payment_type__name"] or "No Payment Type Found",
+            "route": record["route_assigned__name"] or "No Route Number Found",
+        })
+    payments_customers = {
+        payment: len(customers) for payment, customers in payments_customers.items()}
 
     template = get_template("pdfs/monthly-billing.html")
 
@@ -376,40 +340,83 @@ def monthly_billing_report(request, begin_date, end_date):
             {
                 "date_meals": date_meals,
                 "total": total,
-                "cust_meals": customer_meals_query,
+                "cust_meals": customer_meals,
                 "pay_meals": payments_meals,
                 "pay_customers": payments_customers,
                 "today": datetime.datetime.now(),
                 "begin_date": begin_date,
                 "end_date": end_date,
+                "purged_before": purged_before,
             }
-        ), '/collected-static/pdfs/common.css'
+        ), '/collected-static/pdfs/common.css',
+        report="monthly-billing-report",
+    )
+
+
+def birthday_report(queryset, template, title, period, start_date, end_date, report):
+    """
+    Render the people in queryset with a birthday in [start_date, end_date], in birthday
+    order from start_date
+    """
+    start = birth_month_day(start_date)
+    birthdays = sorted(
+        queryset.filter(birthdays_between(start_date, end_date)),
+        # birthdays before start_date are next year's
+        key=lambda person: person.birth_month_day < start)
+    return to_pdf(
+        get_template(template).render(
+            {"birthdays": birthdays,
+                "month": title, "period": period, "today": datetime.datetime.now(), }
+        ),
+        report=report,
     )
 
 
+def month_dates(month):
+    """
+    The first and last day of month in a leap year, so February 29th is included
+    """
+    return datetime.date(2000, month, 1), datetime.date(2000, month, monthrange(2000, month)[1])
+
+
+def upcoming_dates(days):
+    today = datetime.date.today()
+    return today, today + datetime.timedelta(days=max(days, 1) - 1)
+
+
+def upcoming_title(start_date, end_date):
+    return f"{start_date.strftime('%B %d')} to {end_date.strftime('%B %d')}"
+
+
+# clients on a route, in birthday order
+client_birthdays = Customer.objects.filter(route__isnull=False).select_related(
+    "route").order_by("birth_month_day", "birth_date", "route", "last_name", "first_name")
+
+# volunteers in birthday order
+volunteer_birthdays = Volunteer.objects.select_related("user").order_by(
+    "birth_month_day", "birth_date", "user")
+
+
 @ staff_member_required
 def client_birthday_report(request, month):
     """
     generates a pdf list of client birthdays by inputted month
     """
+    return birthday_report(
+        client_birthdays, "pdfs/client-birthday-report.html", months[month], "this month",
+        *month_dates(month), report="client-birthday-report")
 
-    # get list of all the clients whose birthdays fall in the selected month
-    birthdays = Customer.objects.filter(
-        route__isnull=False,
-        birth_date__month=str(month)).order_by(
-        "birth_date__day",
-        "birth_date__year",
-        "route",
-        "last_name",
-        "first_name")
-    template = get_template("pdfs/client-birthday-report.html")
 
-    return to_pdf(
-        template.render(
-            {"birthdays": birthdays,
-                "month": months[month], "today": datetime.datetime.now(), }
-        )
-    )
+@ staff_member_required
+def client_upcoming_birthday_report(request, days=UPCOMING_BIRTHDAYS_DAYS):
+    """
+    generates a pdf list of client birthdays in the next days days, starting today
+    """
+    start_date, end_date = upcoming_dates(days)
+    return birthday_report(
+        client_birthdays, "pdfs/client-birthday-report.html",
+        upcoming_title(start_date, end_date), "in these days", start_date, end_date,
+        report="client-birthday-report")
 
 
 @ staff_member_required
@@ -417,19 +424,21 @@ def volunteer_birthday_report(request, month):
     """
     generates a pdf list of volunteer birthdays by inputted month
     """
+    return birthday_report(
+        volunteer_birthdays, "pdfs/volunteer-birthday-report.html", months[month],
+        "this month", *month_dates(month), report="volunteer-birthday-report")
 
-    # get list of all the clients whose birthdays fall in the selected month
-    birthdays = Volunteer.objects.filter(
-        birth_date__month=str(month)).order_by(
-        "birth_date__day", "birth_date__year", "user")
-    template = get_template("pdfs/volunteer-birthday-report.html")
 
-    return to_pdf(
-        template.render(
-            {"birthdays": birthdays,
-                "month": months[month], "today": datetime.datetime.now(), }
-        )
-    )
+@ staff_member_required
+def volunteer_upcoming_birthday_report(request, days=UPCOMING_BIRTHDAYS_DAYS):
+    """
+    generates a pdf list of volunteer birthdays in the next days days, starting today
+    """
+    start_date, end_date = upcoming_dates(days)
+    return birthday_report(
+        volunteer_birthdays, "pdfs/volunteer-birthday-report.html",
+        upcoming_title(start_date, end_date), "in these days", start_date, end_date,
+        report="volunteer-birthday-report")
 
 
 @ staff_member_required
@@ -443,144 +452,77 @@ def volunteer_join_date_report(request):
     template = get_template("pdfs/volunteer-join-date-report.html")
 
     return to_pdf(template.render(
-        {"join_dates": join_dates, "today": datetime.datetime.now(), }))
+        {"join_dates": join_dates, "today": datetime.datetime.now(), }),
+        report="volunteer-join-date-report")
 
 
 @ staff_member_required
+@cached_report("daily-count-report", Customer, CustomerRecord, DateRange, Diet)
 def daily_count_report(request, date):
-    date_as_datetime = datetime.datetime.strptime(date, "%m-%d-%Y")
-    diets = collections.defaultdict(int)
-    total = 0
-    frozen = 25
-    no_diet = 0
-
-    date = date_as_datetime
-
-    # Count customer meals per diet
-    for customer in Customer.objects.filter(active=True):
-        total += customer.num_meals_on_day(date)
-        if customer.diet is not None:
-            diets[(customer.diet, customer.diet.code)
-                  ] += customer.num_meals_on_day(date)
-        else:
-            no_diet += customer.num_meals_on_day(date)
-            log.info(f"Customer {customer} has no diet.")
-
-        # Customer wants frozen meals to just always be 25 for some reason.
-        # if is_friday(date) and customer.num_weekend_meals and customer.num_meals_on_day(date):
-        #     frozen += customer.num_weekend_meals
-    total += frozen
-
-    diet_list = []
-    for key, val in diets.items():
-        diet_list.append((key[0], key[1], val))
-    context = {
-        "diets": diet_list,
-        "date": date,
-        "day_of_week": date_as_datetime.strftime("%A"),
-        "today": datetime.datetime.now(),
-        "total": total,
-        "frozen": frozen,
-        "no_diet": no_diet,
-    }
-
+    day = DeliveryDay(datetime.datetime.strptime(date, "%m-%d-%Y"))
     template = get_template("pdfs/daily-count-report.html")
+    return to_pdf(template.render(daily_count_context(day)), report="daily-count-report")
 
-    return to_pdf(template.render(context))
-
-@ staff_member_required
-def get_all_customers_by_route(request):
+def customers_by_route_data(**filters):
+    """
+    The active customers matching filters grouped by route, for the customer list
+    reports. One query for the routes and one for the customers, whatever the number of
+    routes.
+    """
     routes = Route.objects.all().order_by("number")
-    routes = list(routes)
-
-    # Context variable
-    data = []
+    customers = (
+        Customer.objects.filter(active=True, route__isnull=False, **filters)
+        .select_related("address", "diet")
+        .order_by("route__number", "_order", "pk"))
     today = datetime.datetime.now()
+    return [
+        {"route": route, "customer_list": custs, "total_customers": len(custs),
+         "today": today}
+        for route, custs in group_by_route(routes, customers)
+    ]
 
-    for route in routes:
-        # These are in correct route order
-        custs = (
-            Customer.objects.filter(
-                active=1).exclude(
-                route=None).filter(
-                route__pk=route.pk)
-                )
-        total_customers = len(custs)
-        # Append to data
-        data.append(
-            {"route": route, "customer_list": custs, "total_customers": total_customers, 
-            "today": today}
-        )
 
+@ staff_member_required
+def get_all_customers_by_route(request):
     template = get_template("pdfs/all-customers-by-route.html")
-    context = {"data": data}
+    context = {"data": customers_by_route_data()}
 
-    return to_pdf(template.render(context), '/collected-static/pdfs/route_all_pdf.css')
+    return to_pdf(
+        template.render(context), '/collected-static/pdfs/route_all_pdf.css',
+        report="customers-by-route-report")
 
 @ staff_member_required
 def generate_bonus_pantry_report(request):
-    routes = Route.objects.all().order_by("number")
-    routes = list(routes)
-
-    # Context variable
-    data = []
-    today = datetime.datetime.now()
-
-    for route in routes:
-        # These are in correct route order
-        custs = (
-            Customer.objects.filter(
-                active=1, receivesBonusPantryDelivery=True).exclude(
-                route=None).filter(
-                route__pk=route.pk)
-                )
-        total_customers = len(custs)
-        # Append to data
-        data.append(
-            {"route": route, "customer_list": custs, "total_customers": total_customers, 
-            "today": today}
-        )
-
     template = get_template("pdfs/bonus-pantry-report.html")
-    context = {"data": data}
+    context = {"data": customers_by_route_data(receivesBonusPantryDelivery=True)}
 
-    return to_pdf(template.render(context), '/collected-static/pdfs/route_all_pdf.css')
+    return to_pdf(
+        template.render(context), '/collected-static/pdfs/route_all_pdf.css',
+        report="bonus-pantry-report")
 
 
 @ staff_member_required
+@cached_report(
+    "routes-report", Assignment, Customer, CustomerRecord, DateRange, Job, Route,
+    Substitution, User, Volunteer, VolunteerRecord)
 def generate_routes_report(request, date):
-    date = datetime.datetime.strptime(date, "%m-%d-%Y")
-    date = datetime.date(year=date.year, month=date.month, day=date.day)
-    # Just gonna loop over this query for each route_pk
-    routes = Route.objects.all().order_by("number")
-    routes = list(routes)
-
-    # Context variable
-    data = []
-
-    for route in routes:
-        # These are in correct route order
-        custs = (
-            Customer.objects.filter(
-                active=1).exclude(
-                route=None).filter(
-                route__pk=route.pk))
-        custs = [c for c in custs if c.num_meals_on_day(date)]
-
-        actuals = Assignment.actuals(date, job=route)
-
-        vols = ", ".join(str(act.volunteer) for act in actuals)
-
-        # Count the meals the customer receives
-        total_meals = 0
-        for c in custs:
-            total_meals += c.num_meals_on_day(date)
-
-        # Append to data
-        data.append({"route": route, "customer_list": custs,
-                     "total_meals": total_meals, "date": date, "vols": vols})
-
+    day = DeliveryDay(datetime.datetime.strptime(date, "%m-%d-%Y"))
     template = get_template("pdfs/generate-routes-report.html")
-    context = {"data": data}
+    return to_pdf(
+        template.render(routes_context(day)), ROUTES_STYLE_SHEET, report="routes-report")
+
 
-    return to_pdf(template.render(context), '/collected-static/pdfs/route_all_pdf.css')
+@ staff_member_required
+def morning_packet_report(request, date):
+    """
+    The labels, pet labels, daily count and route sheets for a day as one pdf, or as a
+    zip of one pdf each with ?format=zip
+    """
+    day = datetime.datetime.strptime(date, "%m-%d-%Y")
+    merged = request.GET.get("format", "pdf") != "zip"
+    content, content_type, timings = morning_packet(day, merged=merged)
+    response = HttpResponse(content, content_type=content_type)
+    if not merged:
+        response["Content-Disposition"] = (
+            f'attachment; filename="morning-packet-{day.strftime("%m-%d-%Y")}.zip"')
+    return response
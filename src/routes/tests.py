@@ -6,7 +6,8 @@ from freezegun import freeze_time
 
 import interfaces.address_lookup
 from meals.constants import MOW_LAT, MOW_LON, ROUTE_TYPE_NAME
-from models.models import Customer, JobType, Route, User
+from interfaces.recurrence import WEEKLY, Recurrence, Rule, Weekday
+from models.models import Customer, CustomerRecord, JobType, Route, User
 from routes import utility
 from routes.forms import AddCustomerForm, RouteFormNoType
 
@@ -612,6 +613,22 @@ class TestViewRouteOnDay(TestCase):
         response = self.client.get(f"/routes/1/{4}/")
         self.assertRedirects(response, f"/routes/{self.route.number}/")
 
+    @patch("interfaces.address_lookup.validate",
+           lambda *a, **k: {"lat": None, "lng": None})
+    def test_past_day_changed_schedule(self):
+        """ A customer who got a meal on a past day is on that day's route after their schedule changed """
+        past_day = datetime.date.today() - datetime.timedelta(days=7)
+        while past_day.isoweekday() > 5:
+            past_day -= datetime.timedelta(days=1)
+        CustomerRecord.objects.create(customer=self.c1, date=past_day, num_meals=1)
+        other_day = past_day.weekday() + 1 if past_day.weekday() < 4 else 0
+        self.c1.meal_recurrence = Recurrence(rrules=[Rule(freq=WEEKLY, byday=(Weekday(other_day),))])
+        self.c1.save()
+        self.c1.refresh_from_db()
+        self.assertFalse(self.c1.meal_scheduled_on(past_day))
+        self.assertEqual(self.c1.num_meals_on_day(past_day), 1)
+        self.assertEqual(list(views.get_customers(self.route, past_day)), [self.c1])
+
     def test_date_format_volunteer(self):
         """ This checks that a bad date format as a volunteer errors correctly """
         __author__ = "Alex Hicks"
@@ -1,4 +1,4 @@
-from models.models import Customer
+from models.models import Customer, bump_data_version
 
 
 def remove_customer_from_route(customer):
@@ -33,3 +33,4 @@ def add_customer_to_route(customer, route):
     # reset the ordering on the route
     customers_on_route.append(customer.pk)
     route.set_customer_order(customers_on_route)
+    bump_data_version(Customer)
@@ -10,7 +10,7 @@ from django.shortcuts import get_object_or_404, redirect, render, reverse
 
 import config.config as CONFIG
 from meals.constants import MOW_LAT, MOW_LON
-from models.models import Customer, Job, Route, Volunteer
+from models.models import Customer, Job, Route, Volunteer, bump_data_version
 from routes import utility
 from routes.forms import AddCustomerForm, RouteFormNoType
 from staff.forms import DateForm
@@ -29,8 +29,7 @@ def get_customers(route, date=None, isBonusRoute=False):
     """
     # get_customer_order returns a list of pks, we need customer objects
     if isBonusRoute and date:
-        recurrenceDate = route.recurrence.after(date, inc=True, dtstart= date)
-        if recurrenceDate == date:
+        if route.runs_on(date):
             return Customer.objects.filter(route=route.bonusRoute, receivesBonusPantryDelivery=True).order_by("_order")
         else:
             return []
@@ -40,7 +39,12 @@ def get_customers(route, date=None, isBonusRoute=False):
         customers = Customer.objects.filter(route=route).order_by("_order")
 
     if date is not None:
-        customers = [c for c in customers if c.num_meals_on_day(date)]
+        day = datetime.date(year=date.year, month=date.month, day=date.day)
+        # past days are counted from CustomerRecord, whatever the schedule is now
+        if day >= datetime.date.today():
+            customers = customers.filter(Customer.schedule_filter(day))
+        meal_counts = Customer.meal_counts(customers, day)
+        customers = [c for c in customers if meal_counts[(c.pk, day)]]
     return customers
 
 
@@ -180,6 +184,7 @@ def move_customer(request, route_number, index, direction):
             customers[index],
         )
         route.set_customer_order(customers)
+        bump_data_version(Customer)
 
     return HttpResponseRedirect(
         reverse(
@@ -27,8 +27,8 @@ from staff import views
 from staff.forms import CreateAssignmentForm, EditMultipleAssignmentsForm, get_job_choices
 from staff.views.assignment_management import (
     MultipleDayAssignment,
-    Row,
     SingleDayAssignment,
+    assignment_rows,
     generate_assignments_display,
 )
 from staff.views.email import send_email
@@ -193,6 +193,59 @@ class TestManageAssignmentsTable(TestCase):
             f"/staff/manage-assignments-table/0/{self.vol_1.pk}/")
         self.assertContains(res, "Nothing to display.")
 
+    def test_filters_rows(self):
+        """
+        the q parameter keeps the rows matching any '&&' separated filter
+        """
+        url = "/staff/manage-assignments-table/"
+        name = f"{self.vol_1.user.first_name} {self.vol_1.user.last_name}"
+        res = self.client.get(url, {"q": "PACKER"})
+        self.assertContains(res, OPEN_ROUTE)
+        self.assertNotContains(res, name)
+        res = self.client.get(url, {"q": "firstname1 last"})
+        self.assertNotContains(res, OPEN_ROUTE)
+        self.assertContains(res, name)
+        res = self.client.get(url, {"q": "nobody && open"})
+        self.assertContains(res, OPEN_ROUTE)
+        self.assertNotContains(res, name)
+        day = f"{abbreviated_weeks_of_month[self.week_of_month_next]} {abbreviated_days_of_week[self.next_day.isoweekday()]}"
+        res = self.client.get(url, {"q": day})
+        self.assertContains(res, name)
+        res = self.client.get(url, {"q": "nobody"})
+        self.assertContains(res, "Nothing to display.")
+
+    @patch("staff.views.assignment_management.ASSIGNMENTS_TABLE_PAGE_SIZE", 2)
+    def test_pages_rows(self):
+        """
+        rows are ordered routes first, then by job type, job and volunteer,
+        and each page is loaded with the same number of queries
+        """
+        route = Route.objects.create(
+            name="route", number=1, num_vols_required=1,
+            job_type=self.job_1.job_type)
+        Assignment.objects.create(
+            job=route, day_of_week=1, week_of_month=1, volunteer=self.vol_1)
+        for week in range(1, 6):
+            Assignment.objects.create(
+                job=self.job_1, day_of_week=2, week_of_month=week,
+                volunteer=self.vol_1)
+
+        url = "/staff/manage-assignments-table/"
+        # session, user, count, page, assignments, emails
+        with self.assertNumQueries(6):
+            res = self.client.get(url)
+        self.assertEqual(
+            [(row.job.pk, row.volunteer) for row in res.context["rows"]],
+            [(route.pk, self.vol_1), (self.job_2_pk, self.vol_1)])
+        self.assertEqual(res.context["emails"], self.vol_1.user.email)
+        with self.assertNumQueries(6):
+            res = self.client.get(url, {"page": 2})
+        self.assertEqual(
+            [(row.job.pk, row.volunteer) for row in res.context["rows"]],
+            [(self.job_1_pk, self.vol_1), (self.job_1_pk, None)])
+        self.assertEqual(res.context["rows"][0].visible_assignments, "Tuesdays")
+        self.assertContains(res, "Page 2 of 2")
+
 
 class TestDisplayItems(TestCase):
     def test_str_single_day_display(self):
@@ -255,62 +308,63 @@ class TestRowSort(TestCase):
             day_of_week=1, week_of_month=1, job=packer_2)
         shuttle_a = Assignment.objects.create(
             day_of_week=1, week_of_month=1, job=shuttle)
-        # create rows
-        self.row_1 = Row(route_1_a_1)
-        self.row_2 = Row(route_1_a_2)
-        self.row_3 = Row(route_1_a_3)
-        self.row_4 = Row(route_2_a)
-        self.row_5 = Row(packer_1_a)
-        self.row_6 = Row(packer_2_a)
-        self.row_7 = Row(shuttle_a)
+        # position of each row in the database ordering
+        order = [(pair["job"], pair["volunteer"])
+                 for pair in assignment_rows(Assignment.objects.all())]
+        (self.row_1, self.row_2, self.row_3, self.row_4,
+         self.row_5, self.row_6, self.row_7) = (
+            order.index((assignment.job_id, assignment.volunteer_id))
+            for assignment in (
+                route_1_a_1, route_1_a_2, route_1_a_3, route_2_a,
+                packer_1_a, packer_2_a, shuttle_a))
 
     def test_route_number_order(self):
         """
         rows should display in order of route number if they are routes
         """
-        self.assertTrue(self.row_1.__lt__(self.row_4))
+        self.assertLess(self.row_1, self.row_4)
 
     def test_same_job_vol_order_no_open_job(self):
         """
         rows should display in volunteer order if they are the same job
         """
-        self.assertTrue(self.row_1.__lt__(self.row_2))
+        self.assertLess(self.row_1, self.row_2)
 
     def test_same_job_vol_order_open_job_caller(self):
         """
-        open job should be compared alphabetically, open job calls __lt__
+        open job should be compared alphabetically, open job first
         """
-        self.assertFalse(self.row_3.__lt__(self.row_1))
+        self.assertGreater(self.row_3, self.row_1)
 
     def test_same_job_vol_order_open_job_compare(self):
         """
-        open job should be compared alphabetically, filled job calls __lt__
+        open job should be compared alphabetically, filled job first
         """
-        self.assertTrue(self.row_1.__lt__(self.row_3))
+        self.assertLess(self.row_1, self.row_3)
 
     def test_routes_get_priority_route_caller(self):
         """
-        routes get priority in sorting, route calls __lt__
+        routes get priority in sorting, route first
         """
-        self.assertTrue(self.row_1.__lt__(self.row_6))
+        self.assertLess(self.row_1, self.row_6)
 
     def test_routes_get_priority_route_compare(self):
         """
-        routes get priority in sorting, other job calls __lt__
+        routes get priority in sorting, other job first
         """
-        self.assertFalse(self.row_6.__lt__(self.row_1))
+        self.assertGreater(self.row_6, self.row_1)
 
     def test_display_in_job_type_order(self):
         """
         if they aren't routes, display in job_type order
         """
-        self.assertTrue(self.row_5.__lt__(self.row_7))
+        self.assertLess(self.row_5, self.row_7)
 
     def test_display_job_name_order(self):
         """
         same job type, different job name
         """
-        self.assertTrue(self.row_5.__lt__(self.row_6))
+        self.assertLess(self.row_5, self.row_6)
 
 
 class TestGenerateAssignmentDisplay(TestCase):
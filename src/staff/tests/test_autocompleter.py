@@ -1,4 +1,5 @@
 import json
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
 from django.test import Client, TestCase
@@ -72,3 +73,65 @@ class TestAutocompleter(TestCase):
                                        for item in data["results"]])
         self.assertNotIn(self.staffvol.id,
                          [int(item["id"]) for item in data["results"]])
+
+    def test_volunteer_query_rank(self):
+        """
+        whole word matches rank above prefix matches, renames are searchable
+        """
+        other = User.objects.create(
+            username="other",
+            first_name="First",
+            last_name="Lastname",
+        )
+        response = self.client.get(
+            "/staff/volunteer-autocomplete/", dict(q="first last"))
+        data = json.loads(response.content)
+        self.assertEqual([int(item["id"]) for item in data["results"]],
+                         [other.volunteer.id, self.vol.id])
+        self.user.first_name = "Renamed"
+        self.user.save()
+        response = self.client.get(
+            "/staff/volunteer-autocomplete/", dict(q="renamed"))
+        data = json.loads(response.content)
+        self.assertEqual([int(item["id"]) for item in data["results"]],
+                         [self.vol.id])
+
+    def test_results_capped(self):
+        __author__ = "Maxwell Patek"
+        for i in range(15):
+            User.objects.create(
+                username=f"user{i}", first_name="Same", last_name=f"Name{i}")
+        response = self.client.get(
+            "/staff/volunteer-autocomplete/", dict(q="same"))
+        data = json.loads(response.content)
+        self.assertEqual(len(data["results"]), 10)
+        self.assertTrue(data["pagination"]["more"])
+
+    @patch("interfaces.address_lookup.validate", lambda *a, **k: {"lat": None, "lng": None})
+    def test_customer_query(self):
+        customer = Customer.objects.create(
+            first_name="Zoë", last_name="O'Brien", address="1 Main St")
+        Customer.objects.create(
+            first_name="Zoe", last_name="Smith", address="2 Main St")
+        self.assertEqual(customer.search_text, "zoe o brien")
+        response = self.client.get(
+            "/staff/customer-autocomplete/", dict(q="zoe brie"))
+        data = json.loads(response.content)
+        self.assertEqual([int(item["id"]) for item in data["results"]],
+                         [customer.id])
+
+    def test_assignment_query(self):
+        job_type = JobType.objects.create(name="type")
+        packer = Job.objects.create(name="Morning Packer", job_type=job_type)
+        shuttle = Job.objects.create(name="Shuttle", job_type=job_type)
+        packing = Assignment.objects.create(
+            job=packer, volunteer=self.vol, day_of_week=1, week_of_month=1)
+        Assignment.objects.create(
+            job=shuttle, volunteer=self.vol, day_of_week=1, week_of_month=1)
+        Assignment.objects.create(
+            job=packer, volunteer=self.vol, day_of_week=2, week_of_month=1)
+        response = self.client.get(
+            "/staff/assignment-autocomplete/", dict(q="pack first monday"))
+        data = json.loads(response.content)
+        self.assertEqual([int(item["id"]) for item in data["results"]],
+                         [packing.id])
@@ -1,16 +1,26 @@
+import dataclasses
 import datetime
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from freezegun import freeze_time
 
-from interfaces.recurrence import abbreviated_days_of_week, abbreviated_weeks_of_month
+from interfaces.recurrence import (
+    abbreviated_days_of_week,
+    abbreviated_weeks_of_month,
+    date_to_day_of_month,
+)
 from meals.constants import OPEN_ROUTE
 from models.models import (
     Assignment,
     Customer,
     Job,
+    JobMailingList,
     JobType,
     ManagerAnnouncement,
     Route,
@@ -19,6 +29,8 @@ from models.models import (
 )
 from staff import views
 from staff.views.email import send_email
+from staff.views import job_management
+from staff.views.job_management import actuals_to_display, get_emails_by_job
 
 
 @freeze_time("2020-03-13")
@@ -45,6 +57,163 @@ class TestManageJobs(TestCase):
             response, "/staff/manage-jobs/{}/".format(day.strftime("%m-%d-%Y"))
         )
 
+    def test_actuals_to_display(self):
+        """
+        every job is displayed on every date, grouped by job type, with the date's
+        volunteers and their emails
+        """
+        route_type = JobType.objects.get(name="Route")
+        routes = [
+            Route.objects.create(name=f"Route {i}", number=i, job_type=route_type)
+            for i in (1, 2)]
+        packing = Job.objects.create(
+            name="Packing", job_type=JobType.objects.create(name="Packer"))
+        vols = [
+            Volunteer.objects.get(user=User.objects.create(
+                username=f"vol{i}", first_name=f"Vol{i}", email=f"vol{i}@mow.org"))
+            for i in range(3)]
+        monday = datetime.date(2020, 3, 16)
+        tuesday = datetime.date(2020, 3, 17)
+        assignments = []
+        for vol, job, day in (
+                (vols[0], routes[1], monday),
+                (vols[1], routes[0], tuesday),
+                (vols[2], packing, tuesday)):
+            dom = date_to_day_of_month(day)
+            assignments.append(Assignment.objects.create(
+                volunteer=vol, job=job, day_of_week=dom.day_of_week,
+                week_of_month=dom.week_of_month))
+        # vol0 fills in for vol2 packing, the week after too
+        sub = Substitution.objects.create(
+            assignment=assignments[2], date=tuesday, volunteer=vols[0])
+        Substitution.objects.create(
+            assignment=assignments[2], date=tuesday + datetime.timedelta(days=7),
+            volunteer=vols[0])
+
+        end_date = tuesday + datetime.timedelta(days=1)
+        with CaptureQueriesContext(connection) as actuals_queries:
+            list(Assignment.actuals(monday, end_date))
+        # the jobs, and the assignments and substitutions of every actual
+        with self.assertNumQueries(len(actuals_queries) + 3):
+            dates = actuals_to_display(monday, end_date)
+        self.assertEqual([d.date for d in dates], [monday, tuesday])
+        for d in dates:
+            self.assertEqual(
+                [(jt.job_type.name, [j.job.pk for j in jt.jobs]) for jt in d.job_types],
+                [("Route", [r.pk for r in routes]), ("Packer", [packing.pk])])
+        self.assertEqual(
+            [[[p.name for p in j.todays_volunteers] for jt in d.job_types for j in jt.jobs]
+             for d in dates],
+            [[[], [str(vols[0])], []], [[str(vols[1])], [], [str(vols[0])]]])
+        self.assertEqual(
+            [(p.assignment_pk, p.sub_pk, p.original)
+             for d in dates for jt in d.job_types for j in jt.jobs
+             for p in j.todays_volunteers],
+            [(assignments[0].pk, None, str(vols[0])),
+             (assignments[1].pk, None, str(vols[1])),
+             (assignments[2].pk, sub.pk, str(vols[2]))])
+        self.assertEqual(dates[0].email_str, "vol0@mow.org")
+        self.assertEqual(dates[1].job_types[0].email_str, "vol1@mow.org")
+        self.assertEqual(dates[1].job_types[1].jobs[0].email_str, "vol0@mow.org")
+
+
+class TestJobEmails(TestCase):
+    def test_get_emails_by_job(self):
+        """
+        the mailing list is read with one query, stored, and rebuilt after changes
+        """
+        job_type = JobType.objects.create(name="test_type")
+        job = Job.objects.create(name="packer", job_type=job_type)
+        today = datetime.date.today()
+        assignment = Assignment.objects.create(
+            job=job, day_of_week=today.isoweekday(),
+            week_of_month=(today.day - 1) // 7 + 1)
+        sub = User.objects.create(username="sub", email="sub@domain.com")
+        Substitution.objects.create(
+            date=today, assignment=assignment, volunteer=sub.volunteer)
+        assigned = User.objects.create(username="assigned", email="assigned@domain.com")
+        Assignment.objects.create(
+            job=job, volunteer=assigned.volunteer, day_of_week=1, week_of_month=1)
+        past = User.objects.create(username="past", email="past@domain.com")
+        Substitution.objects.create(
+            date=today - datetime.timedelta(days=7), assignment=assignment,
+            volunteer=past.volunteer)
+
+        with self.assertNumQueries(1):
+            emails = get_emails_by_job(job, cached=False)
+        self.assertEqual(emails.assigned_emails, "assigned@domain.com")
+        self.assertEqual(emails.sub_emails, "sub@domain.com")
+        self.assertEqual(emails.all_emails, "assigned@domain.com,sub@domain.com")
+
+        get_emails_by_job(job)
+        with self.assertNumQueries(1):
+            emails = get_emails_by_job(job)
+        self.assertEqual(emails.all_emails, "assigned@domain.com,sub@domain.com")
+
+        # a new substitute and a changed email are picked up
+        Substitution.objects.create(
+            date=today + datetime.timedelta(days=7), assignment=assignment,
+            volunteer=past.volunteer)
+        self.assertEqual(get_emails_by_job(job).sub_emails,
+                         "past@domain.com,sub@domain.com")
+        assigned.email = "changed@domain.com"
+        assigned.save()
+        self.assertEqual(get_emails_by_job(job).assigned_emails, "changed@domain.com")
+        # the stored list is for one day, since substitutes are counted from today
+        with freeze_time(today + datetime.timedelta(days=8)):
+            self.assertEqual(get_emails_by_job(job).sub_emails, "")
+            self.assertEqual(JobMailingList.objects.get(job=job).date,
+                             datetime.date.today())
+
+
+    def test_mailing_list_invalidation(self):
+        """
+        writes only delete the mailing lists of the jobs they touch
+        """
+        job_type = JobType.objects.create(name="test_type")
+        packer = Job.objects.create(name="packer", job_type=job_type)
+        driver = Job.objects.create(name="driver", job_type=job_type)
+        other = Job.objects.create(name="other", job_type=job_type)
+        user = User.objects.create(username="vol", email="vol@domain.com")
+        assignment = Assignment.objects.create(
+            job=packer, volunteer=user.volunteer, day_of_week=1, week_of_month=1)
+
+        def cached_jobs():
+            for job in (packer, driver, other):
+                get_emails_by_job(job)
+            return set(JobMailingList.objects.values_list("job__name", flat=True))
+
+        self.assertEqual(cached_jobs(), {"packer", "driver", "other"})
+        # moving the assignment stales its old and new job
+        assignment.job = driver
+        assignment.save()
+        self.assertEqual(
+            set(JobMailingList.objects.values_list("job__name", flat=True)), {"other"})
+        self.assertEqual(get_emails_by_job(driver).assigned_emails, "vol@domain.com")
+        self.assertEqual(get_emails_by_job(packer).assigned_emails, "")
+
+        # logins and name changes keep every list, a new email only the volunteer's jobs
+        cached_jobs()
+        user.last_login = timezone.now()
+        user.save(update_fields=["last_login"])
+        user.first_name = "Vol"
+        user.save()
+        self.assertEqual(JobMailingList.objects.count(), 3)
+        user.email = "new@domain.com"
+        user.save()
+        self.assertEqual(
+            set(JobMailingList.objects.values_list("job__name", flat=True)),
+            {"packer", "other"})
+        self.assertEqual(get_emails_by_job(driver).assigned_emails, "new@domain.com")
+
+        # deleting the volunteer stales its jobs
+        cached_jobs()
+        user.volunteer.delete()
+        self.assertEqual(
+            set(JobMailingList.objects.values_list("job__name", flat=True)),
+            {"packer", "other"})
+        self.assertEqual(get_emails_by_job(driver).assigned_emails, "")
+
 
 class TestJobManagement(TestCase):
     def setUp(self):
@@ -80,6 +249,28 @@ class TestJobManagement(TestCase):
         self.sub = Substitution.objects.create(
             date=day, assignment=assignment, volunteer=vol)
 
+    def test_open_route_without_assignment(self):
+        """
+        an open route whose assignment can't be found is shown without the link to
+        request a substitution
+        """
+        day = self.sub.date
+        Assignment.objects.create(
+            job=self.sub.assignment.job, day_of_week=day.isoweekday(),
+            week_of_month=(day.day - 1) // 7 + 1)
+        actuals_to_people = job_management.actuals_to_people
+
+        def without_assignments(actuals):
+            return [
+                dataclasses.replace(person, assignment_pk=None)
+                for person in actuals_to_people(actuals)]
+
+        with patch("staff.views.job_management.actuals_to_people", without_assignments):
+            response = self.client.get(
+                "/staff/manage-jobs/{}/".format(day.strftime("%m-%d-%Y")))
+        self.assertContains(response, f"<span>{OPEN_ROUTE}</span>")
+        self.assertNotContains(response, "Create Substitution Request")
+
     def test_manage_open_job_assignment_not_found(self):
         """
         test manage_open_job when the assignment pk is not valid
@@ -1,7 +1,8 @@
 import datetime
+import tempfile
 
 from django.contrib.auth.models import User
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from freezegun import freeze_time
 
@@ -13,10 +14,12 @@ from models.models import (
     Job,
     JobType,
     ManagerAnnouncement,
+    ReportJob,
     Route,
     Substitution,
     Volunteer,
 )
+from pdfs.jobs import work
 from staff import views
 from staff.views.email import send_email
 
@@ -45,3 +48,59 @@ class TestJoinDateReport(TestCase):
         day = datetime.date.today()
         response = self.client.get("/staff/volunteer-join-date-report")
         self.assertEqual(response.status_code, 302)
+
+
+class TestReportJobs(TestCase):
+    def setUp(self):
+        self.user = User.objects.get_or_create(
+            username="admin",
+            password="pass@123",
+            email="admin@admin.com",
+            is_staff=True,
+        )[0]
+        self.client.force_login(self.user)
+        self.report_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.report_root.cleanup)
+
+    def test_queue_and_download(self):
+        response = self.client.post(
+            reverse("staff:date_range_form", args=["missing-feedback-report"]),
+            {"begin_date": "2020-03-02", "end_date": "2020-03-06"},
+        )
+        job = ReportJob.objects.get()
+        self.assertRedirects(response, reverse("staff:report_job", args=[job.pk]))
+        self.assertEqual(job.report_type, "missing_feedback_report")
+        self.assertEqual(job.args, ["03-02-2020", "03-06-2020"])
+        self.assertEqual(job.requested_by, self.user)
+
+        status = self.client.get(reverse("staff:report_job_status", args=[job.pk])).json()
+        self.assertEqual(status, {"status": "queued", "error": "", "download": None})
+
+        with override_settings(REPORT_ROOT=self.report_root.name):
+            work(once=True)
+        status = self.client.get(reverse("staff:report_job_status", args=[job.pk])).json()
+        self.assertEqual(status["status"], "done")
+
+        response = self.client.get(status["download"])
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"Date,Route Number"))
+
+        # deleting the job removes its file
+        file_path = ReportJob.objects.get().file_path
+        ReportJob.objects.all().delete()
+        with self.assertRaises(FileNotFoundError):
+            open(file_path)
+
+    def test_failure(self):
+        job = ReportJob.objects.create(
+            report_type="missing_feedback_report",
+            args=["03-02-2020", "03-06-2020"],
+            requested_by=User.objects.create(username="not_staff"),
+        )
+        with override_settings(REPORT_ROOT=self.report_root.name):
+            work(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.FAILED)
+        self.assertIn("PermissionDenied", job.error)
+        response = self.client.get(reverse("staff:download_report", args=[job.pk]))
+        self.assertEqual(response.status_code, 404)
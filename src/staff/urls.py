@@ -120,6 +120,9 @@ urlpatterns = [
         views.single_date_form,
         name="single_date_form",
     ),
+    path("report-job/<int:pk>/", views.report_job, name="report_job"),
+    path("report-job/<int:pk>/status/", views.report_job_status, name="report_job_status"),
+    path("report-job/<int:pk>/download/", views.download_report, name="download_report"),
     path("create-volunteer/", views.create_volunteer, name="create_volunteer"),
     path(
         "volunteer-join-date-report",
@@ -6,6 +6,9 @@ from logging import getLogger
 
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import user_passes_test
+from django.core.paginator import Paginator
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Concat, Lower
 from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render, reverse
 
@@ -20,7 +23,7 @@ from interfaces.recurrence import (
     start_of_week_field_names,
     weeks_of_month,
 )
-from meals.constants import OPEN_ROUTE
+from meals.constants import ASSIGNMENTS_TABLE_PAGE_SIZE, OPEN_ROUTE
 from models.models import Assignment, Job, Volunteer
 from staff.forms import CreateAssignmentForm, EditMultipleAssignmentsForm
 
@@ -68,46 +71,6 @@ class Row:
                 assignment.week_of_month,
                 assignment.day_of_week)]
 
-    def __lt__(self, other_row):
-        """
-        used with sorted is called
-        this allows the route to all get displayed first by route number
-        then all other jobs by alphabetical
-        """
-        if (self.route_number != -1 and other_row.route_number != -1) and (
-            self.route_number != other_row.route_number
-        ):
-            # both are routes but not the same route
-            return self.route_number < other_row.route_number
-        elif self.route_number == -1 and other_row.route_number != -1:
-            # one is not a route
-            # routes will get priority in default sort
-            return False
-        elif self.route_number != -1 and other_row.route_number == -1:
-            # one is not a route
-            # routes will get priority in default sort
-            return True
-        elif self.job.job_type.name != other_row.job.job_type.name:
-            # this will allow for the packers and shuttles to be separated
-            return self.job.job_type.name < other_row.job.job_type.name
-        elif self.job.name != other_row.job.name:
-            # they are not the same job
-            return self.job.name < other_row.job.name
-        else:
-            if self.volunteer and other_row.volunteer:
-                self_name = f"{self.volunteer.user.first_name.lower()} {self.volunteer.user.last_name.lower()}"
-                other_row_name = f"{other_row.volunteer.user.first_name.lower()} {other_row.volunteer.user.last_name.lower()}"
-                return self_name < other_row_name
-            elif self.volunteer:
-                # one will display as open route
-                self_name = f"{self.volunteer.user.first_name.lower()} {self.volunteer.user.last_name.lower()}"
-                return self_name < OPEN_ROUTE.lower()
-            else:
-                # other_row.volunteer is not None
-                # one will display as open route
-                other_row_name = f"{other_row.volunteer.user.first_name.lower()} {other_row.volunteer.user.last_name.lower()}"
-                return OPEN_ROUTE.lower() < other_row_name
-
 
 class SingleDayAssignment:
     """
@@ -177,15 +140,118 @@ def generate_assignments_display(single_assignment_list):
                      [str(item) for item in single_days])
 
 
+def days_matching(term):
+    """
+    :param term: lowercase search term
+    returns a Q matching the assignments whose displayed day contains term,
+    eg. '1st mon' or 'mondays' or 'bonus pantry route'
+    """
+    query = Q(pk__in=[])
+    for week in range(1, len(weeks_of_month)):
+        for day in range(1, len(days_of_week)):
+            single = f"{abbreviated_weeks_of_month[week]} {abbreviated_days_of_week[day]}"
+            multiple = f"{days_of_week[day]}s"
+            if term in single.lower() or term in multiple.lower():
+                query |= Q(week_of_month=week, day_of_week=day)
+    if term in str(SingleDayAssignment(None, None)).lower():
+        query |= Q(week_of_month=None, day_of_week=None)
+    return query
+
+
+def filter_assignments(query, search):
+    """
+    :param query: Assignment queryset
+    :param search: filter text, multiple filters are separated by '&&'
+    keeps the assignments whose volunteer name or email, job name
+    or day matches any of the filters
+    """
+    terms = [term.strip().lower() for term in search.split("&&")]
+    terms = [term for term in terms if term]
+    if not terms:
+        return query
+    query = query.annotate(
+        volunteer_name=Concat(
+            "volunteer__user__first_name",
+            Value(" "),
+            "volunteer__user__last_name"))
+    matches = Q(pk__in=[])
+    for term in terms:
+        matches |= (
+            Q(volunteer_name__icontains=term)
+            | Q(volunteer__user__email__icontains=term)
+            | Q(job__name__icontains=term)
+            | days_matching(term)
+        )
+        if term in OPEN_ROUTE.lower():
+            matches |= Q(volunteer=None)
+    return query.filter(matches)
+
+
+def assignment_rows(query):
+    """
+    :param query: Assignment queryset
+    returns the distinct (job, volunteer) pairs of query in display order:
+    routes by number first, then the other jobs by type and name,
+    then volunteers by name with the open job sorted as its title
+    """
+    return query.values("job", "volunteer").annotate(
+        route_number=F("job__route__number"),
+        job_type_name=F("job__job_type__name"),
+        job_name=F("job__name"),
+        sort_name=Case(
+            When(volunteer=None, then=Value(OPEN_ROUTE.lower())),
+            default=Lower(Concat(
+                "volunteer__user__first_name",
+                Value(" "),
+                "volunteer__user__last_name"))),
+    ).order_by(
+        F("route_number").asc(nulls_last=True),
+        "job_type_name",
+        "job_name",
+        "sort_name",
+        "volunteer",
+    ).distinct()
+
+
+def rows_for_page(pairs):
+    """
+    :param pairs: page of (job, volunteer) dicts from assignment_rows
+    loads every assignment of the pairs in one query and returns a Row per pair
+    """
+    if not pairs:
+        return []
+    pair_query = Q(pk__in=[])
+    for pair in pairs:
+        pair_query |= Q(job=pair["job"], volunteer=pair["volunteer"])
+    row_dict = {}
+    assignments = Assignment.objects.filter(pair_query).select_related(
+        "volunteer__user", "job__route", "job__job_type")
+    for item in assignments:
+        # create and edit the row items
+        key = (item.job_id, item.volunteer_id)
+        if key in row_dict:
+            row_dict[key].hidden_assignments.append(
+                SingleDayAssignment(item.week_of_month, item.day_of_week)
+            )
+        else:
+            row_dict[key] = Row(item)
+
+    rows = [row_dict[(pair["job"], pair["volunteer"])] for pair in pairs]
+    # create the visible and hidden assignments
+    for row in rows:
+        row.visible_assignments = generate_assignments_display(
+            row.hidden_assignments)
+    return rows
+
+
 @staff_member_required
 def manage_assignments_table(request, job_pk=None, vol_pk=None):
     """
-    generates the manage assignments table,
+    generates one page of the manage assignments table,
     this will get displayed in the manage_assignments template
-    it is separated because it runs slowly
+    GET parameters: q filters the rows, page selects the page
     job_pk will be 0 by when vol_pk is passed
     """
-    row_dict = {}
     # get the appropriate assignments
     if job_pk is not None and job_pk != 0:
         query = Assignment.objects.filter(
@@ -196,27 +262,25 @@ def manage_assignments_table(request, job_pk=None, vol_pk=None):
                 Volunteer, pk=vol_pk))
     else:
         query = Assignment.objects.all()
+    query = filter_assignments(query, request.GET.get("q", ""))
 
-    for item in query:
-        # create and edit the row items
-        if (item.volunteer, item.job) in row_dict:
-            row = row_dict[(item.volunteer, item.job)]
-            row.hidden_assignments.append(
-                SingleDayAssignment(item.week_of_month, item.day_of_week)
-            )
-        else:
-            row_dict[(item.volunteer, item.job)] = Row(item)
-
-    # create the visible and hidden assignments
-    rows = row_dict.values()
-    for row in rows:
-        row.visible_assignments = generate_assignments_display(
-            row.hidden_assignments)
+    page = Paginator(
+        assignment_rows(query),
+        ASSIGNMENTS_TABLE_PAGE_SIZE).get_page(
+        request.GET.get("page"))
+    # the email button covers every filtered row, not only this page
+    emails = query.exclude(volunteer=None).order_by().values_list(
+        "volunteer__user__email", flat=True).distinct()
 
     return render(
         request,
         "manage-assignments-table.html",
-        {"rows": sorted(rows), "open_job": OPEN_ROUTE},
+        {
+            "rows": rows_for_page(list(page)),
+            "page": page,
+            "emails": ";".join(email for email in emails if email),
+            "open_job": OPEN_ROUTE,
+        },
     )
 
 
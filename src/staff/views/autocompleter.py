@@ -1,22 +1,24 @@
 from dal import autocomplete
-from django.db.models import Q
+from django.db.models import F, Q
 
 from interfaces.recurrence import days_of_week, weeks_of_month
+from interfaces.search import rank_search, search_query, search_rank, search_vector
+from meals.constants import AUTOCOMPLETE_RESULTS
 from models.models import Assignment, Customer, Volunteer
 
 
 class VolunteerAutocomplete(autocomplete.Select2QuerySetView):
+    paginate_by = AUTOCOMPLETE_RESULTS
+
     def get_queryset(self):
 
         # Make sure the Volunteer User has a first name or last name listed
-        qs = Volunteer.objects.all().exclude((Q(user__first_name='') & Q(user__last_name='')) |
-                                             (Q(user__first_name=None) & Q(user__last_name=None)))
+        qs = Volunteer.objects.select_related("user").exclude(
+            (Q(user__first_name='') & Q(user__last_name='')) |
+            (Q(user__first_name=None) & Q(user__last_name=None)))
 
         if self.q:
-            words = self.q.split()
-            for word in words:
-                qs = qs.filter(Q(user__first_name__icontains=word)
-                               | Q(user__last_name__icontains=word))
+            qs = rank_search(qs, self.q)
 
         # Don't forget to filter out results depending on the visitor !
 
@@ -24,38 +26,50 @@ class VolunteerAutocomplete(autocomplete.Select2QuerySetView):
 
 
 class AssignmentAutocomplete(autocomplete.Select2QuerySetView):
+    paginate_by = AUTOCOMPLETE_RESULTS
+
     def get_queryset(self):
         # Don't forget to filter out results depending on the visitor !
 
-        qs = Assignment.objects.all()
+        qs = Assignment.objects.select_related("volunteer__user", "job").order_by(
+            "job__name", "volunteer__search_text", "week_of_month", "day_of_week")
 
         if self.q:
+            qs = qs.annotate(
+                volunteer_search=search_vector("volunteer__search_text"),
+                job_search=search_vector("job__search_text"),
+            )
             words = self.q.split()
             for word in words:
-                query = (
-                    Q(volunteer__user__first_name__icontains=word)
-                    | Q(volunteer__user__last_name__icontains=word)
-                    | Q(job__name__icontains=word)
-                )
-                if word in days_of_week:
-                    query |= Q(day_of_week=days_of_week.index(word))
-                if word in weeks_of_month:
-                    query |= Q(week_of_month=weeks_of_month.index(word))
+                query = Q(pk__in=[])
+                word_query = search_query(word)
+                if word_query is not None:
+                    query |= Q(volunteer_search=word_query) | Q(job_search=word_query)
+                if word.capitalize() in days_of_week:
+                    query |= Q(day_of_week=days_of_week.index(word.capitalize()))
+                if word.capitalize() in weeks_of_month:
+                    query |= Q(week_of_month=weeks_of_month.index(word.capitalize()))
                 qs = qs.filter(query)
 
+            # rank by how well the names match the words
+            if search_query(self.q) is not None:
+                qs = qs.annotate(
+                    rank=search_rank(F("volunteer_search"), self.q)
+                    + search_rank(F("job_search"), self.q)
+                ).order_by(F("rank").desc(), *qs.query.order_by)
+
         return qs
 
 
 class CustomerAutocomplete(autocomplete.Select2QuerySetView):
+    paginate_by = AUTOCOMPLETE_RESULTS
+
     def get_queryset(self):
         # Don't forget to filter out results depending on the visitor !
 
-        qs = Customer.objects.all()
+        qs = Customer.objects.order_by("last_name", "first_name")
 
         if self.q:
-            words = self.q.split()
-            for word in words:
-                qs = qs.filter(Q(first_name__icontains=word)
-                               | Q(last_name__icontains=word))
+            qs = rank_search(qs, self.q)
 
         return qs
@@ -3,6 +3,7 @@ Views file for managing jobs
 """
 
 import datetime
+from collections import defaultdict
 from dataclasses import dataclass, field
 from logging import getLogger
 from typing import List, Optional, Set
@@ -11,7 +12,7 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 from interfaces.recurrence import date_to_day_of_month, is_weekend
 from meals.constants import OPEN_ROUTE, OPEN_SUBSTITUTION, ROUTE_TYPE_NAME, UNASSIGNED_JOB
-from models.models import NO_FILTER_SENTINAL, Assignment, Job, JobType, Route, Substitution
+from models.models import NO_FILTER_SENTINAL, Assignment, Job, JobMailingList, JobType, Route, Substitution
 from staff.forms import DateForm, JobForm, JobFormNoType, JobTypeForm, RouteForm, BonusDeliveryForm
 
 log = getLogger(__name__)
@@ -21,7 +22,7 @@ log = getLogger(__name__)
 class Person:
     name: str
     sub_pk: Optional[int]
-    assignment_pk: int
+    assignment_pk: Optional[int]
     original: str
     email: Optional[str]
     volunteer_pk: Optional[int]
@@ -61,69 +62,97 @@ class Date:
         return self.date == __o.date
 
 
-def populate_structs(date_list, date, job):
-    # add the date struct if it is not in the date_list
-    d = Date(date)
-    if d not in date_list:
-        date_list.append(d)
-    # find the index of the date in date_list
-    dateIndexInList = date_list.index(d)
-    # use the index to find the valid job types for the date struct
-    jobTypesForDate = date_list[dateIndexInList].job_types
-    # create a job type struct
-    jts = JobTypeStruct(job.job_type)
-    # add the job type if not in the list of job types for the given date
-    if jts not in jobTypesForDate:
-        jobTypesForDate.append(jts)
-    # find the index for the job type
-    jtsIndexInList = jobTypesForDate.index(jts)
-    # get the list of jobs for the current job type
-    jobTypeList = jobTypesForDate[jtsIndexInList].jobs
-    # create the job struct
-    jobStruct = JobStruct(job, route_number=job.get_route_number())
-    # add the job to the list if not in list
-    if job not in jobTypeList:
-        jobTypeList.append(jobStruct)
-
-    return jobTypeList[-1]
-
-
-def actual_to_person(a):
-    dom = date_to_day_of_month(a.date)
-    assignment_pks = Assignment.objects.filter(
-        volunteer=a.original,
-        job=a.job,
-        day_of_week=dom.day_of_week,
-        week_of_month=dom.week_of_month,
-    ).values_list("pk")
-    if a.is_substitution:
-        subs = list(
-            Substitution.objects.filter(
-                volunteer=a.volunteer, assignment__pk__in=assignment_pks,
-            )
-        )
-        sub_pk = subs[0].pk
-        ass_pk = subs[0].assignment.pk
-    elif hasattr(a.job, 'route') and a.job.route.bonusRoute is not None:
-        sub_pk = None
-        ass_pk = Assignment.objects.filter(volunteer=a.original, job=a.job, day_of_week=None, week_of_month=None).values_list('pk')[0][0]
-    else:
+def populate_structs(date_struct, index, job):
+    """
+    Add job, and its job type, to date_struct if they are not already on it, and return
+    their JobTypeStruct and JobStruct. index maps the job type names and job pks already
+    on date_struct to their structs, so nothing is searched for.
+    """
+    job_struct = index["jobs"].get(job.pk)
+    if job_struct is not None:
+        return index["job_types"][job.job_type.name], job_struct
+    # add the job type if not in the job types for the date
+    job_type_struct = index["job_types"].get(job.job_type.name)
+    if job_type_struct is None:
+        job_type_struct = JobTypeStruct(job.job_type)
+        index["job_types"][job.job_type.name] = job_type_struct
+        date_struct.job_types.append(job_type_struct)
+    job_struct = JobStruct(job, route_number=job.get_route_number())
+    index["jobs"][job.pk] = job_struct
+    job_type_struct.jobs.append(job_struct)
+    return job_type_struct, job_struct
+
+
+def actuals_to_people(actuals):
+    """
+    The Person for each of actuals, in order. The assignment of each actual is found by
+    (job, original, day_of_week, week_of_month), or with no day for bonus routes, and the
+    substitution of each substitution by (assignment, date, volunteer). This takes two
+    queries for the whole list.
+    """
+    actuals = list(actuals)
+
+    def is_bonus_route(job):
+        return hasattr(job, "route") and job.route.bonusRoute_id is not None
+
+    # (job, original, day_of_week, week_of_month) -> assignment pks
+    assignments = defaultdict(list)
+    for pk, job, volunteer, day_of_week, week_of_month in (
+            Assignment.objects.filter(job__in={a.job.pk for a in actuals}).order_by("pk")
+            .values_list("pk", "job", "volunteer", "day_of_week", "week_of_month")):
+        assignments[(job, volunteer, day_of_week, week_of_month)].append(pk)
+
+    keys = []
+    for a in actuals:
+        if is_bonus_route(a.job):
+            day_of_week, week_of_month = None, None
+        else:
+            dom = date_to_day_of_month(a.date)
+            day_of_week, week_of_month = dom.day_of_week, dom.week_of_month
+        keys.append((
+            a.job.pk, a.original.pk if a.original else None, day_of_week, week_of_month))
+
+    # (assignment, date, volunteer) -> substitution pk
+    subs = {}
+    if any(a.is_substitution for a in actuals):
+        subs = {
+            (assignment, date, volunteer): pk
+            for pk, assignment, date, volunteer in Substitution.objects.filter(
+                assignment__in={
+                    pk for a, key in zip(actuals, keys) if a.is_substitution
+                    for pk in assignments[key]},
+                date__in={a.date for a in actuals if a.is_substitution},
+            ).order_by("-pk").values_list("pk", "assignment", "date", "volunteer")
+        }
+
+    people = []
+    for a, key in zip(actuals, keys):
         sub_pk = None
-        ass_pk = assignment_pks[0][0]
-    if a.volunteer:
-        name = str(a.volunteer)
-    elif a.is_substitution:
-        name = OPEN_SUBSTITUTION
-    else:
-        name = OPEN_ROUTE
-    return Person(
-        name=name,
-        sub_pk=sub_pk,
-        assignment_pk=ass_pk,
-        original=str(a.original) if a.original else OPEN_ROUTE,
-        email=a.volunteer.user.email if a.volunteer else None,
-        volunteer_pk=a.volunteer.pk if a.volunteer else None,
-    )
+        ass_pk = assignments[key][0] if assignments[key] else None
+        if a.is_substitution:
+            volunteer_pk = a.volunteer.pk if a.volunteer else None
+            for pk in assignments[key]:
+                if (pk, a.date, volunteer_pk) in subs:
+                    sub_pk = subs[(pk, a.date, volunteer_pk)]
+                    ass_pk = pk
+                    break
+        if ass_pk is None:
+            log.warning(f"No assignment found for {a}")
+        if a.volunteer:
+            name = str(a.volunteer)
+        elif a.is_substitution:
+            name = OPEN_SUBSTITUTION
+        else:
+            name = OPEN_ROUTE
+        people.append(Person(
+            name=name,
+            sub_pk=sub_pk,
+            assignment_pk=ass_pk,
+            original=str(a.original) if a.original else OPEN_ROUTE,
+            email=a.volunteer.user.email if a.volunteer else None,
+            volunteer_pk=a.volunteer.pk if a.volunteer else None,
+        ))
+    return people
 
 
 def actuals_to_display(
@@ -147,48 +176,29 @@ def actuals_to_display(
         **kwargs,
     )
     actuals = list(actuals)
-    all_jobs= Job.objects.all()
-
-    jobs_index = 0
-
-    dates = []
-    for i, a in enumerate(actuals):
-
-        # insert unassigned jobs from last day
-        while jobs_index < len(all_jobs) and a.job != all_jobs[jobs_index]:
-            job_struct = populate_structs(
-                        dates, actuals[max(i - 1, 0)].date, all_jobs[jobs_index]
-                    )
-            jobs_index += 1
-
-        # insert unassigned jobs from today
-        if jobs_index == len(all_jobs):
-            jobs_index = 0
-        while a.job != all_jobs[jobs_index]:
-            job_struct = populate_structs(dates, a.date, all_jobs[jobs_index])
-            jobs_index += 1
-
-        # insert this job and get the volunteer list
-        todays_volunteers = populate_structs(
-            dates, a.date, a.job).todays_volunteers
+    people = actuals_to_people(actuals)
+    all_jobs = list(Job.objects.select_related("route", "job_type"))
+
+    # date -> (Date, index of its job types and jobs for populate_structs)
+    dates = {}
+    for a, person in zip(actuals, people):
+        if a.date not in dates:
+            # every job is displayed on each date, unassigned jobs too
+            date_struct = Date(a.date)
+            index = {"job_types": {}, "jobs": {}}
+            for job in all_jobs:
+                populate_structs(date_struct, index, job)
+            dates[a.date] = (date_struct, index)
+        date_struct, index = dates[a.date]
+        job_type_struct, job_struct = populate_structs(date_struct, index, a.job)
 
         # add this volunteer's information
-        todays_volunteers.append(actual_to_person(a))
+        job_struct.todays_volunteers.append(person)
         if a.volunteer and a.volunteer.user.email:
-            # needed to ensure the volunteer data is put into the correct location
-            d = Date(a.date)
-            dIndex = dates.index(d)
-            jt = JobTypeStruct(a.job.job_type)
-            jtIndex = dates[dIndex].job_types.index(jt)
-            jIndex = dates[dIndex].job_types[jtIndex].jobs.index(a.job)
-            dates[dIndex].job_types[jtIndex].jobs[jIndex].emails.add(a.volunteer.user.email)
-            dates[dIndex].job_types[jtIndex].emails.add(a.volunteer.user.email)
-            dates[dIndex].emails.add(a.volunteer.user.email)
-
-    # insert unfilled jobs to the end
-    if "a" in locals():
-        for ji in range(jobs_index, len(all_jobs)):
-            job_struct = populate_structs(dates, a.date, all_jobs[ji])
+            job_struct.emails.add(a.volunteer.user.email)
+            job_type_struct.emails.add(a.volunteer.user.email)
+            date_struct.emails.add(a.volunteer.user.email)
+    dates = [date_struct for date_struct, _ in dates.values()]
 
     # comma-seperate emails
     for d in dates:
@@ -420,43 +430,13 @@ def parse_date_form(request):
     return HttpResponseRedirect(reverse("staff:manage_jobs", args=[date_str]))
 
 
-class Emails:
-    def __init__(self, assigned_emails, sub_emails):
-        self.assigned_emails = ",".join(set(assigned_emails))
-        self.sub_emails = ",".join(set(sub_emails))
-        self.all_emails = ",".join(set(sub_emails + assigned_emails))
-
-
-def get_emails_by_job(job_name):
+def get_emails_by_job(job, cached=True):
     """
     get the list of emails for everyone who has
     any sort of assignment for a job
-    return assigned_emails, sub_emails, and all_emails
+    return a JobMailingList with assigned_emails, sub_emails, and all_emails
+    cached=False reads the emails without using or saving the stored list
     """
-    # get job
-    job = Job.objects.get(name=job_name)
-    # get the emails of anyone ever assigned
-    assignments = Assignment.objects.filter(job=job)
-    assigned_emails = []
-    for assignment in assignments:
-        if assignment.volunteer:
-            email = assignment.volunteer.user.email
-            if email:
-                assigned_emails.append(email)
-
-    # get the emails of anyone who may be substituting
-    substitutions = Substitution.objects.filter(
-        assignment__job=job, date__gte=datetime.date.today()
-    )
-    sub_emails = []
-    for sub in substitutions:
-        # get the email, if its not in the ones we
-        # got in the assignments, append it
-        if sub.volunteer:
-            email = sub.volunteer.user.email
-            if email:
-                sub_emails.append(email)
-
-    # join with comma
-    # return all of the emails
-    return Emails(assigned_emails, sub_emails)
+    if cached:
+        return JobMailingList.for_job(job)
+    return JobMailingList.build(job)
@@ -4,13 +4,16 @@ contains views for parsing forms
 """
 
 import datetime
+import os
 from logging import getLogger
 
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponseRedirect
-from django.shortcuts import redirect, render, reverse
+from django.http import FileResponse, Http404, HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render, reverse
 
 from meals.constants import REPORT_TYPES
+from models.models import ReportJob
+from pdfs.jobs import enqueue_report
 from staff.forms import DateRangeForm, MonthForm, SingleDateForm
 
 log = getLogger(__name__)
@@ -23,7 +26,7 @@ def date_range_form(request, report_type):
     job overview or substitution report
     view for the job overview and substitution report
     form. User will fill out form with date pickers
-    this will parse and redirect to proper report
+    this will parse and queue the proper report
     """
     # make sure the report type is valid
     if report_type in REPORT_TYPES:
@@ -52,12 +55,8 @@ def date_range_form(request, report_type):
 
                 # everything worked, so generate the report
                 report_type = report_type.replace("-", "_")
-                return HttpResponseRedirect(
-                    reverse(
-                        "pdfs:{}".format(report_type),
-                        args=[
-                            begin_date,
-                            end_date]))
+                job = enqueue_report(report_type, [begin_date, end_date], request.user)
+                return HttpResponseRedirect(reverse("staff:report_job", args=[job.pk]))
         # not a post request
         report_type = report_type.replace("-", " ")
         report_type = report_type.title()
@@ -89,9 +88,8 @@ def month_form(request, report_type):
 
                 # everything worked, so generate the report
                 report_type = report_type.replace("-", "_")
-                return HttpResponseRedirect(
-                    reverse("pdfs:{}".format(report_type), args=[month])
-                )
+                job = enqueue_report(report_type, [month], request.user)
+                return HttpResponseRedirect(reverse("staff:report_job", args=[job.pk]))
         else:
             # not a post request
             report_type = report_type.replace("-", " ")
@@ -135,9 +133,8 @@ def single_date_form(request, report_type):
 
                 # everything worked, so generate the report
                 report_type = report_type.replace("-", "_")
-                return HttpResponseRedirect(
-                    reverse("pdfs:{}".format(report_type), args=[date_picked])
-                )
+                job = enqueue_report(report_type, [date_picked], request.user)
+                return HttpResponseRedirect(reverse("staff:report_job", args=[job.pk]))
         else:
             # not a post request
             report_type = report_type.replace("-", " ")
@@ -157,3 +154,44 @@ def single_date_form(request, report_type):
 @staff_member_required
 def volunteer_join_date_report(request):
     return HttpResponseRedirect(reverse("pdfs:volunteer_join_date_report"))
+
+
+@staff_member_required
+def report_job(request, pk):
+    """
+    Page that waits for a queued report and links to it once it is generated.
+    """
+    job = get_object_or_404(ReportJob, pk=pk)
+    return render(request, "report-job.html", {
+        "job": job,
+        "report_type": job.report_type.replace("_", " ").title(),
+    })
+
+
+@staff_member_required
+def report_job_status(request, pk):
+    """
+    Polled by the report job page, returns the status of the job and where to download it.
+    """
+    job = get_object_or_404(ReportJob, pk=pk)
+    return JsonResponse({
+        "status": job.status,
+        "error": job.error,
+        "download": reverse("staff:download_report", args=[job.pk])
+        if job.status == ReportJob.DONE else None,
+    })
+
+
+@staff_member_required
+def download_report(request, pk):
+    job = get_object_or_404(ReportJob, pk=pk, status=ReportJob.DONE)
+    try:
+        report = open(job.file_path, "rb")
+    except FileNotFoundError:
+        raise Http404("The report has been deleted")
+    return FileResponse(
+        report,
+        content_type=job.content_type,
+        as_attachment=job.content_type != "application/pdf",
+        filename=os.path.basename(job.file_path),
+    )